@@ -8,6 +8,8 @@ class Settings(BaseSettings):
     OUTPUT_DIR: str = "/data/output"
     CELERY_BROKER_URL: str = "redis://redis:6379/0"
     CELERY_RESULT_BACKEND: str = "redis://redis:6379/0"
+    SYNC_TIMEOUT_SECONDS: int = 600
+    SYNC_WAIT_SECONDS: int = 30
 
     model_config = {"env_file": ".env", "env_file_encoding": "utf-8"}
 
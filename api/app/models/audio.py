@@ -1,23 +1,80 @@
-from pydantic import BaseModel
+from typing import Optional
+
+from pydantic import BaseModel, Field
 
 
 class AudioSyncRequest(BaseModel):
     feed_ids: list[str]
+    method: str = "multires"
+    max_lag_seconds: Optional[float] = Field(None, gt=0)
 
 
 class AudioSyncResult(BaseModel):
     feed_id: str
     detected_offset_seconds: float
+    confidence: Optional[float] = Field(None, description="None for the reference feed, which is not measured.")
+    reference: bool = False
+
+
+class AudioSyncPending(BaseModel):
+    """A sync job still running after the request's wait; poll /api/jobs/{job_id}."""
+
+    job_id: str
+    state: str
+    reference_feed_id: str
+    target_feed_ids: list[str] = Field(
+        ..., description="Order of the offsets in the job result."
+    )
+
+
+class AudioSolveRequest(BaseModel):
+    feed_ids: list[str]
+    max_lag_seconds: Optional[float] = Field(None, gt=0)
+
+
+class AudioSolveResult(BaseModel):
+    feed_id: str
+    offset_seconds: float
     confidence: float
+    component: int = Field(
+        0, description="Feeds in different components share no audio; each is offset from its own first feed."
+    )
 
 
 class AudioOptimizeRequest(BaseModel):
     feed_ids: list[str]
-    master_feed_id: str
+    master_feed_id: str = Field(
+        ..., description="The mix starts with this feed; other feeds are placed by their sync offsets."
+    )
     normalize: bool = True
     noise_reduce: bool = False
+    output_filename: Optional[str] = Field(None, description="Defaults to '<master_feed_id>_mix.wav'.")
 
 
 class AudioOptimizeResult(BaseModel):
     output_path: str
     settings_applied: dict
+    job_id: Optional[str] = Field(None, description="Mixdown job writing output_path; poll /api/jobs/{job_id}.")
+
+
+class AudioLoudnessRequest(BaseModel):
+    feed_ids: list[str]
+    target_lufs: float = Field(-23.0, le=0)
+    curve_hop_seconds: float = Field(1.0, ge=0.1)
+
+
+class AudioLoudnessResult(BaseModel):
+    feed_id: str
+    integrated_lufs: Optional[float] = None
+    loudness_range_lu: Optional[float] = None
+    max_momentary_lufs: Optional[float] = None
+    max_short_term_lufs: Optional[float] = None
+    sample_peak_dbfs: Optional[float] = None
+    clipped_samples: int = 0
+    gain_db: Optional[float] = Field(
+        None, description="Gain that brings the feed to target_lufs; None for silent feeds."
+    )
+    curve_hop_seconds: float = 1.0
+    momentary: list[float] = []
+    short_term: list[float] = []
+    error: Optional[str] = None
@@ -1,42 +1,116 @@
+import os
+
+from celery.exceptions import TimeoutError as CeleryTimeoutError
 from fastapi import APIRouter, HTTPException
+from fastapi.responses import JSONResponse
 
+from app.config import settings
 from app.models.audio import (
+    AudioLoudnessRequest,
+    AudioLoudnessResult,
     AudioOptimizeRequest,
     AudioOptimizeResult,
+    AudioSolveRequest,
+    AudioSolveResult,
+    AudioSyncPending,
     AudioSyncRequest,
     AudioSyncResult,
 )
 from app.routers.feeds import _feeds
-from app.services.audio_service import analyze_sync, optimize_audio
+from app.routers.jobs import SYNC_METHODS
+from app.services.audio_service import (
+    analyze_loudness,
+    analyze_sync,
+    optimize_audio,
+    solve_sync,
+)
 
 router = APIRouter(prefix="/api/audio", tags=["audio"])
 
 
 @router.post("/sync")
 async def sync_audio(body: AudioSyncRequest) -> list[AudioSyncResult]:
+    """Sync all feeds against the first in one batched processor job.
+
+    Jobs that outlast SYNC_WAIT_SECONDS answer 202 with the job id to poll.
+    """
+    if body.method not in SYNC_METHODS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown method '{body.method}'. Choose from: {', '.join(SYNC_METHODS)}",
+        )
     feed_paths: list[str] = []
     for fid in body.feed_ids:
         feed = _feeds.get(fid)
         if not feed:
             raise HTTPException(status_code=404, detail=f"Feed {fid} not found")
         feed_paths.append(feed.file_path or feed.source_url)
-    return await analyze_sync(feed_paths, body.feed_ids)
+    result = await analyze_sync(feed_paths, body.feed_ids, body.method, body.max_lag_seconds)
+    if isinstance(result, AudioSyncPending):
+        return JSONResponse(status_code=202, content=result.model_dump())
+    return result
+
+
+@router.post("/sync/solve")
+async def solve_audio_sync(body: AudioSolveRequest) -> list[AudioSolveResult]:
+    """Solve consistent offsets for all feeds and store them on each feed."""
+    feed_paths: dict[str, str] = {}
+    for fid in body.feed_ids:
+        feed = _feeds.get(fid)
+        if not feed:
+            raise HTTPException(status_code=404, detail=f"Feed {fid} not found")
+        feed_paths[fid] = feed.file_path or feed.source_url
+    try:
+        results = await solve_sync(feed_paths, body.max_lag_seconds)
+    except CeleryTimeoutError:
+        raise HTTPException(status_code=504, detail="Audio sync job timed out")
+    for result in results:
+        feed = _feeds.get(result.feed_id)
+        if feed:
+            _feeds[result.feed_id] = feed.model_copy(
+                update={"offset_seconds": result.offset_seconds}
+            )
+    return results
+
+
+@router.post("/loudness")
+async def measure_loudness(body: AudioLoudnessRequest) -> list[AudioLoudnessResult]:
+    """Rank all feeds by loudness, with the gain that balances each to the target."""
+    feed_paths: dict[str, str] = {}
+    for fid in body.feed_ids:
+        feed = _feeds.get(fid)
+        if not feed:
+            raise HTTPException(status_code=404, detail=f"Feed {fid} not found")
+        feed_paths[fid] = feed.file_path or feed.source_url
+    try:
+        return await analyze_loudness(feed_paths, body.target_lufs, body.curve_hop_seconds)
+    except CeleryTimeoutError:
+        raise HTTPException(status_code=504, detail="Loudness analysis job timed out")
 
 
 @router.post("/optimize")
 async def optimize(body: AudioOptimizeRequest) -> AudioOptimizeResult:
-    feed_paths: list[str] = []
-    master_path: str = ""
+    """Mix all feeds' audio into one master at each feed's volume and sync offset."""
+    feeds = []
     for fid in body.feed_ids:
         feed = _feeds.get(fid)
         if not feed:
             raise HTTPException(status_code=404, detail=f"Feed {fid} not found")
-        path = feed.file_path or feed.source_url
-        feed_paths.append(path)
-        if fid == body.master_feed_id:
-            master_path = path
-    if not master_path:
+        feeds.append(feed)
+    master = _feeds.get(body.master_feed_id)
+    if master is None or body.master_feed_id not in body.feed_ids:
         raise HTTPException(status_code=404, detail="Master feed not found")
+    mix = [
+        {
+            "feed_id": feed.id,
+            "path": feed.file_path or feed.source_url,
+            "offset_seconds": feed.offset_seconds - master.offset_seconds,
+            "volume": feed.volume,
+        }
+        for feed in feeds
+    ]
+    filename = body.output_filename or f"{body.master_feed_id}_mix.wav"
+    output_path = os.path.join(settings.OUTPUT_DIR, filename)
     return await optimize_audio(
-        feed_paths, master_path, body.normalize, body.noise_reduce
+        mix, body.master_feed_id, output_path, body.normalize, body.noise_reduce
     )
@@ -1,9 +1,14 @@
+import logging
+
 from fastapi import APIRouter, HTTPException, UploadFile
 
+from app.celery_app import celery_app
 from app.config import settings
 from app.models.feed import Feed, FeedCreate, FeedUpdate
 from app.services.feed_service import save_upload
 
+logger = logging.getLogger(__name__)
+
 router = APIRouter(prefix="/api/feeds", tags=["feeds"])
 
 _feeds: dict[str, Feed] = {}
@@ -56,4 +61,18 @@ async def upload_video(feed_id: str, file: UploadFile):
     file_path = await save_upload(feed_id, file, settings.UPLOAD_DIR)
     updated = feed.model_copy(update={"file_path": file_path})
     _feeds[feed_id] = updated
+    try:
+        # Fingerprint once at ingest so later clips can be matched by index lookup.
+        celery_app.send_task(
+            "processor.celery_app.fingerprint_feed_task", args=[feed_id, file_path], retry=False
+        )
+    except Exception:
+        logger.warning("Could not queue fingerprinting for feed %s", feed_id, exc_info=True)
+    try:
+        # Measure loudness now, so normalizing this feed later skips the analysis pass.
+        celery_app.send_task(
+            "processor.celery_app.measure_loudness_task", args=[{feed_id: file_path}], retry=False
+        )
+    except Exception:
+        logger.warning("Could not queue loudness measurement for feed %s", feed_id, exc_info=True)
     return {"file_path": file_path}
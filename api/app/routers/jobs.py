@@ -1,11 +1,13 @@
 import os
+from typing import Optional
 
-from fastapi import APIRouter
+from fastapi import APIRouter, HTTPException
 from celery.result import AsyncResult
 from pydantic import BaseModel, Field
 
 from app.celery_app import celery_app
 from app.config import settings
+from app.services import job_cache
 
 router = APIRouter(prefix="/api/jobs", tags=["jobs"])
 
@@ -20,11 +22,62 @@ class ComposeJobRequest(BaseModel):
     )
     feed_paths: dict[str, str]
     output_filename: str
+    engine: str = Field(
+        "auto",
+        description=(
+            "'auto' uses one xstack when the slots tile the frame and z_index-ordered "
+            "overlays otherwise; 'xstack' or 'overlay' force one."
+        ),
+    )
+    feed_offsets: Optional[dict[str, float]] = Field(
+        None, description="Sync offset per feed_id, as returned by the sync endpoints."
+    )
+    start_seconds: float = Field(0.0, ge=0, description="Start of the window on the reference clock.")
+    duration_seconds: Optional[float] = Field(None, gt=0)
+
+
+COMPOSE_ENGINES = ("auto", "xstack", "overlay")
+
+SYNC_METHODS = ("multires", "fft", "streaming")
 
 
 class SyncJobRequest(BaseModel):
     reference_path: str
     target_path: str
+    method: str = Field(
+        "multires",
+        description=(
+            "'multires' searches decimated onset envelopes first and refines at full rate; "
+            "'fft' correlates every lag at full rate; "
+            "'streaming' correlates block by block with bounded memory for very long recordings."
+        ),
+    )
+    max_lag_seconds: Optional[float] = Field(
+        None, gt=0, description="Only consider offsets up to this many seconds either way."
+    )
+
+
+class DriftJobRequest(BaseModel):
+    reference_path: str
+    target_path: str
+    segments: int = Field(
+        1, ge=1, description="1 fits constant drift; more fits a piecewise-linear time warp."
+    )
+    hop_seconds: float = Field(30.0, gt=0, description="Spacing of the analysis windows.")
+
+
+class MatchJobRequest(BaseModel):
+    video_path: str
+    feed_paths: Optional[dict[str, str]] = Field(
+        None,
+        description=(
+            "Fingerprinted feeds to search, by feed_id. Candidates are confirmed by "
+            "correlation against these files; omit to search every fingerprinted feed "
+            "without confirmation."
+        ),
+    )
+    exclude_feed_id: Optional[str] = None
+    top_n: int = Field(5, ge=1, le=50)
 
 
 class OptimizeJobRequest(BaseModel):
@@ -47,36 +100,105 @@ class ExportJobRequest(BaseModel):
     format: str = "landscape_1080p"
 
 
+# Mirrors processor.pipeline.PIPELINE_STAGES.
+PIPELINE_STAGES = ("render", "compose", "optimize", "export")
+
+
+class PipelineJobRequest(BaseModel):
+    stages: list[dict] = Field(
+        ...,
+        min_length=1,
+        description=(
+            "Ordered stages, each with a 'stage' key ('render', 'compose', 'optimize' or "
+            "'export') and that stage's arguments. Render or compose can only come first; "
+            "export can only come last."
+        ),
+    )
+    input_path: Optional[str] = Field(
+        None, description="Master to process when no render/compose stage comes first."
+    )
+    output_filename: Optional[str] = Field(None, description="Output file, unless the last stage is export.")
+    output_prefix: Optional[str] = Field(
+        None, description="For a final export stage, each output is written as '<output_prefix>_<format>.mp4'."
+    )
+
+
+class ExportMultiJobRequest(BaseModel):
+    input_path: str
+    output_prefix: str = Field(..., description="Each output is written as '<output_prefix>_<format>.mp4'.")
+    formats: list[str] = Field(
+        default_factory=lambda: list(SOCIAL_FORMATS), min_length=1,
+        description="SOCIAL_FORMATS keys to export; all of them by default.",
+    )
+
+
+def _dispatch(task: str, args: list, body: BaseModel, input_paths: list[str],
+              output_paths: list[str] = (), **extra) -> dict:
+    """Send a processor task unless an identical job is running or already done.
+
+    Jobs are identified by :func:`job_cache.job_fingerprint` of the request,
+    its input files and the output paths it writes.  A repeat of a running
+    job attaches to it; a repeat of a finished one returns its result at
+    once with ``cached`` set.
+    """
+    params = body.model_dump(exclude={"output_filename", "output_prefix"})
+    fingerprint = job_cache.job_fingerprint(task, params, input_paths, output_paths)
+    existing = job_cache.lookup(fingerprint)
+    if existing:
+        return {**existing, **extra}
+    result = celery_app.send_task(f"processor.celery_app.{task}", args=args)
+    job_cache.remember(fingerprint, result.id, output_paths)
+    return {"job_id": result.id, "state": "PENDING", "fingerprint": fingerprint, **extra}
+
+
 @router.post("/compose", status_code=202)
 async def dispatch_compose(body: ComposeJobRequest) -> dict:
     """Dispatch a video composition job to the Celery worker."""
+    if body.engine not in COMPOSE_ENGINES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown engine '{body.engine}'. Choose from: {', '.join(COMPOSE_ENGINES)}",
+        )
     output_path = os.path.join(settings.OUTPUT_DIR, body.output_filename)
-    task = celery_app.send_task(
-        "processor.celery_app.compose_videos_task",
-        args=[body.layout, body.feed_paths, output_path],
-    )
-    return {"job_id": task.id, "state": "PENDING"}
+    args = [
+        body.layout, body.feed_paths, output_path, body.engine,
+        body.feed_offsets, body.start_seconds, body.duration_seconds,
+    ]
+    return _dispatch("compose_videos_task", args, body, list(body.feed_paths.values()), [output_path])
 
 
 @router.post("/sync", status_code=202)
 async def dispatch_sync(body: SyncJobRequest) -> dict:
     """Dispatch an audio-sync detection job to the Celery worker."""
-    task = celery_app.send_task(
-        "processor.celery_app.detect_offset_task",
-        args=[body.reference_path, body.target_path],
-    )
-    return {"job_id": task.id, "state": "PENDING"}
+    if body.method not in SYNC_METHODS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown method '{body.method}'. Choose from: {', '.join(SYNC_METHODS)}",
+        )
+    args = [body.reference_path, body.target_path, body.method, body.max_lag_seconds]
+    return _dispatch("detect_offset_task", args, body, [body.reference_path, body.target_path])
+
+
+@router.post("/drift", status_code=202)
+async def dispatch_drift(body: DriftJobRequest) -> dict:
+    """Dispatch a clock-drift analysis job; the result includes an offset map."""
+    args = [body.reference_path, body.target_path, body.segments, body.hop_seconds]
+    return _dispatch("estimate_drift_task", args, body, [body.reference_path, body.target_path])
+
+
+@router.post("/match", status_code=202)
+async def dispatch_match(body: MatchJobRequest) -> dict:
+    """Dispatch a clip-matching job against the feed fingerprint index."""
+    args = [body.video_path, body.feed_paths, body.exclude_feed_id, body.top_n]
+    return _dispatch("match_clip_task", args, body, [body.video_path, *(body.feed_paths or {}).values()])
 
 
 @router.post("/optimize", status_code=202)
 async def dispatch_optimize(body: OptimizeJobRequest) -> dict:
     """Dispatch an audio-optimization job to the Celery worker."""
     output_path = os.path.join(settings.OUTPUT_DIR, body.output_filename)
-    task = celery_app.send_task(
-        "processor.celery_app.optimize_audio_task",
-        args=[body.input_path, output_path, body.normalize, body.noise_reduce],
-    )
-    return {"job_id": task.id, "state": "PENDING"}
+    args = [body.input_path, output_path, body.normalize, body.noise_reduce]
+    return _dispatch("optimize_audio_task", args, body, [body.input_path], [output_path])
 
 
 @router.post("/export", status_code=202)
@@ -86,18 +208,88 @@ async def dispatch_export(body: ExportJobRequest) -> dict:
     Supported formats: landscape_1080p (16:9), portrait_1080p (9:16), square_1080 (1:1).
     """
     if body.format not in SOCIAL_FORMATS:
-        from fastapi import HTTPException
         raise HTTPException(
             status_code=400,
             detail=f"Unknown format '{body.format}'. Choose from: {', '.join(SOCIAL_FORMATS)}",
         )
     dimensions = SOCIAL_FORMATS[body.format]
     output_path = os.path.join(settings.OUTPUT_DIR, body.output_filename)
-    task = celery_app.send_task(
-        "processor.celery_app.export_task",
-        args=[body.input_path, output_path, dimensions["width"], dimensions["height"]],
+    args = [body.input_path, output_path, dimensions["width"], dimensions["height"]]
+    return _dispatch("export_task", args, body, [body.input_path], [output_path], format=body.format)
+
+
+@router.post("/export/multi", status_code=202)
+async def dispatch_export_multi(body: ExportMultiJobRequest) -> dict:
+    """Dispatch one export job that writes several social formats from a single decode.
+
+    The job result lists every output path by format.
+    """
+    unknown = [f for f in body.formats if f not in SOCIAL_FORMATS]
+    if unknown:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown format '{unknown[0]}'. Choose from: {', '.join(SOCIAL_FORMATS)}",
+        )
+    formats = list(dict.fromkeys(body.formats))
+    outputs = {f: os.path.join(settings.OUTPUT_DIR, f"{body.output_prefix}_{f}.mp4") for f in formats}
+    body = body.model_copy(update={"formats": formats})
+    return _dispatch(
+        "export_multi_task", [body.input_path, outputs], body, [body.input_path], list(outputs.values()),
+        outputs=outputs,
     )
-    return {"job_id": task.id, "state": "PENDING", "format": body.format}
+
+
+@router.post("/pipeline", status_code=202)
+async def dispatch_pipeline(body: PipelineJobRequest) -> dict:
+    """Dispatch a chain of processor stages as one job.
+
+    The worker fuses the stages into as few ffmpeg runs as it can (usually
+    one), copies streams no stage touches and cleans up any intermediates.
+    """
+    names = [stage.get("stage") for stage in body.stages]
+    unknown = [name for name in names if name not in PIPELINE_STAGES]
+    if unknown:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown stage '{unknown[0]}'. Choose from: {', '.join(PIPELINE_STAGES)}",
+        )
+    output_path, outputs = None, None
+    if names[-1] == "export":
+        formats = body.stages[-1].get("formats") or list(SOCIAL_FORMATS)
+        bad = [f for f in formats if f not in SOCIAL_FORMATS]
+        if bad:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Unknown format '{bad[0]}'. Choose from: {', '.join(SOCIAL_FORMATS)}",
+            )
+        if not body.output_prefix:
+            raise HTTPException(status_code=400, detail="A final export stage needs output_prefix")
+        outputs = {f: os.path.join(settings.OUTPUT_DIR, f"{body.output_prefix}_{f}.mp4") for f in formats}
+    elif body.output_filename:
+        output_path = os.path.join(settings.OUTPUT_DIR, body.output_filename)
+    else:
+        raise HTTPException(status_code=400, detail="output_filename is required")
+    inputs = [body.input_path] if body.input_path else []
+    for stage in body.stages:
+        inputs += list((stage.get("feed_paths") or {}).values())
+    args = [body.stages, output_path, outputs, body.input_path]
+    extra = {"outputs": outputs} if outputs else {"output_path": output_path}
+    written = list(outputs.values()) if outputs else [output_path]
+    return _dispatch("run_pipeline_task", args, body, inputs, written, **extra)
+
+
+@router.delete("/cache")
+async def clear_job_cache() -> dict:
+    """Forget every fingerprinted job, so identical requests run again."""
+    return {"invalidated": job_cache.invalidate()}
+
+
+@router.delete("/cache/{fingerprint}")
+async def invalidate_job(fingerprint: str) -> dict:
+    """Forget one fingerprinted job (the ``fingerprint`` a dispatch returned)."""
+    if not job_cache.invalidate(fingerprint):
+        raise HTTPException(status_code=404, detail="Fingerprint not cached")
+    return {"invalidated": 1}
 
 
 @router.get("/{job_id}")
@@ -105,6 +297,8 @@ async def get_job_status(job_id: str) -> dict:
     """Return the current state (and result) of a Celery task."""
     result = AsyncResult(job_id, app=celery_app)
     response: dict = {"job_id": job_id, "state": result.state}
+    if result.state == "PROGRESS" and isinstance(result.info, dict):
+        response["progress"] = result.info
     if result.ready():
         if result.successful():
             response["result"] = result.result
@@ -8,6 +8,9 @@ from app.models.project import Project, ProjectCreate, ProjectUpdate
 
 router = APIRouter(prefix="/api/projects", tags=["projects"])
 
+# Mirrors processor.timeline.RENDER_MODES.
+RENDER_MODES = ("graph", "copy", "smart")
+
 _projects: dict[str, Project] = {}
 
 
@@ -60,14 +63,34 @@ async def render_project(
     project_id: str,
     feed_paths: dict[str, str],
     output_filename: str = Query(..., description="Filename for the rendered output video"),
+    render_mode: str = Query(
+        "copy",
+        description=(
+            "'graph' re-encodes everything in one pass, 'copy' stream-copies clips cut on "
+            "keyframes, 'smart' also re-encodes only the partial GOPs at other cuts"
+        ),
+    ),
+    parallel: bool = Query(False, description="Render independent pieces across all workers"),
+    resume: bool = Query(
+        True, description="Reuse pieces an interrupted render of the same timeline already finished"
+    ),
 ) -> dict:
     """Dispatch a render job for the project timeline."""
     project = _projects.get(project_id)
     if not project:
         raise HTTPException(status_code=404, detail="Project not found")
+    if render_mode not in RENDER_MODES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown render mode '{render_mode}'. Choose from: {', '.join(RENDER_MODES)}",
+        )
+    if parallel and render_mode == "graph":
+        raise HTTPException(status_code=400, detail="Parallel render needs render mode 'copy' or 'smart'")
     output_path = os.path.join(settings.OUTPUT_DIR, output_filename)
+    task_name = "render_timeline_parallel_task" if parallel else "render_timeline_task"
     task = celery_app.send_task(
-        "processor.celery_app.render_timeline_task",
+        f"processor.celery_app.{task_name}",
         args=[project.model_dump(), feed_paths, output_path],
+        kwargs={"render_mode": render_mode, "resume": resume},
     )
     return {"job_id": task.id, "state": "PENDING"}
@@ -1,43 +1,140 @@
-import hashlib
-import random
+import asyncio
+from typing import Optional, Union
 
-from app.models.audio import AudioOptimizeResult, AudioSyncResult
+from celery.exceptions import TimeoutError as CeleryTimeoutError
+
+from app.celery_app import celery_app
+from app.config import settings
+from app.models.audio import (
+    AudioLoudnessResult,
+    AudioOptimizeResult,
+    AudioSolveResult,
+    AudioSyncPending,
+    AudioSyncResult,
+)
 
 
 async def analyze_sync(
-    feed_paths: list[str], feed_ids: list[str]
-) -> list[AudioSyncResult]:
-    """Placeholder audio sync analysis – returns deterministic mock offsets."""
-    results: list[AudioSyncResult] = []
-    for path, fid in zip(feed_paths, feed_ids):
-        # Deterministic pseudo-random offset based on the path
-        seed = int(hashlib.md5(path.encode()).hexdigest()[:8], 16)
-        rng = random.Random(seed)
-        offset = round(rng.uniform(-0.5, 0.5), 4)
-        confidence = round(rng.uniform(0.7, 1.0), 4)
+    feed_paths: list[str],
+    feed_ids: list[str],
+    method: str = "multires",
+    max_lag_seconds: Optional[float] = None,
+) -> Union[list[AudioSyncResult], AudioSyncPending]:
+    """Sync every feed against the first one with a single batched processor job.
+
+    The first feed is the reference: the worker decodes and transforms it
+    once, and every other feed's offset is reported relative to it.  Waits
+    up to SYNC_WAIT_SECONDS for the result; a longer job is returned as
+    pending so the caller can poll it instead of holding the request open.
+    """
+    if not feed_paths:
+        return []
+    task = celery_app.send_task(
+        "processor.celery_app.detect_offsets_batch_task",
+        args=[feed_paths[0], feed_paths[1:], method, max_lag_seconds],
+    )
+    try:
+        offsets = await asyncio.to_thread(task.get, timeout=settings.SYNC_WAIT_SECONDS)
+    except CeleryTimeoutError:
+        return AudioSyncPending(
+            job_id=task.id,
+            state=task.state,
+            reference_feed_id=feed_ids[0],
+            target_feed_ids=feed_ids[1:],
+        )
+    results = [
+        AudioSyncResult(feed_id=feed_ids[0], detected_offset_seconds=0.0, reference=True)
+    ]
+    for fid, offset in zip(feed_ids[1:], offsets):
         results.append(
             AudioSyncResult(
                 feed_id=fid,
-                detected_offset_seconds=offset,
-                confidence=confidence,
+                detected_offset_seconds=offset["offset_seconds"],
+                confidence=offset["confidence"],
             )
         )
     return results
 
 
+async def solve_sync(
+    feed_paths: dict[str, str],
+    max_lag_seconds: Optional[float] = None,
+) -> list[AudioSolveResult]:
+    """Place every feed on one timeline from a sparse set of pair correlations.
+
+    Unlike :func:`analyze_sync`, no feed has to overlap all the others: the
+    processor picks roughly 2N informative pairs and solves for the offsets.
+    """
+    if not feed_paths:
+        return []
+    task = celery_app.send_task(
+        "processor.celery_app.solve_offsets_task",
+        args=[feed_paths, max_lag_seconds],
+    )
+    solved = await asyncio.to_thread(task.get, timeout=settings.SYNC_TIMEOUT_SECONDS)
+    return [
+        AudioSolveResult(feed_id=fid, **solved["offsets"][fid]) for fid in feed_paths
+    ]
+
+
+async def analyze_loudness(
+    feed_paths: dict[str, str],
+    target_lufs: float = -23.0,
+    curve_hop_seconds: float = 1.0,
+) -> list[AudioLoudnessResult]:
+    """Measure every feed's EBU R128 loudness in one processor job, loudest first.
+
+    The worker analyzes the cached sync PCM without another ffmpeg pass, and
+    each result carries the gain that balances the feed to ``target_lufs``.
+    Feeds without audio sort last.
+    """
+    if not feed_paths:
+        return []
+    task = celery_app.send_task(
+        "processor.celery_app.analyze_loudness_task",
+        args=[feed_paths, target_lufs, curve_hop_seconds],
+    )
+    measured = await asyncio.to_thread(task.get, timeout=settings.SYNC_TIMEOUT_SECONDS)
+    results = [AudioLoudnessResult(feed_id=fid, **measured[fid]) for fid in feed_paths]
+    return sorted(
+        results,
+        key=lambda r: -r.integrated_lufs if r.integrated_lufs is not None else float("inf"),
+    )
+
+
 async def optimize_audio(
-    feed_paths: list[str],
-    master_path: str,
+    feeds: list[dict],
+    master_feed_id: str,
+    output_path: str,
     normalize: bool = True,
     noise_reduce: bool = False,
 ) -> AudioOptimizeResult:
-    """Placeholder audio optimization – returns mock result for MVP."""
+    """Queue a master mix of the feeds' audio and return where it will be written.
+
+    ``feeds`` are {"feed_id", "path", "offset_seconds", "volume"} dicts with
+    offsets relative to the master.  The worker streams every feed through
+    one NumPy mixdown and then normalizes and/or denoises the master.
+    """
+    task = celery_app.send_task(
+        "processor.celery_app.mixdown_task",
+        args=[
+            [{k: feed[k] for k in ("path", "offset_seconds", "volume")} for feed in feeds],
+            output_path,
+            normalize,
+            noise_reduce,
+        ],
+    )
     return AudioOptimizeResult(
-        output_path="/data/output/optimized_mix.wav",
+        output_path=output_path,
+        job_id=task.id,
         settings_applied={
             "normalize": normalize,
             "noise_reduce": noise_reduce,
-            "master": master_path,
-            "input_count": len(feed_paths),
+            "master": master_feed_id,
+            "input_count": len(feeds),
+            "feeds": {
+                feed["feed_id"]: {"offset_seconds": feed["offset_seconds"], "volume": feed["volume"]}
+                for feed in feeds
+            },
         },
     )
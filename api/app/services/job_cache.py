@@ -0,0 +1,127 @@
+import hashlib
+import json
+import os
+import time
+from typing import Optional
+
+from celery.result import AsyncResult
+
+from app.celery_app import celery_app
+
+# Bump a task's version when it starts producing different output for the
+# same inputs, so results cached from the old code stop matching.
+TASK_VERSIONS: dict[str, int] = {
+    "compose_videos_task": 1,
+    "detect_offset_task": 1,
+    "estimate_drift_task": 1,
+    "match_clip_task": 1,
+    "optimize_audio_task": 1,
+    "export_task": 1,
+    "export_multi_task": 1,
+    "run_pipeline_task": 1,
+}
+
+# States of a job that is still going to produce a result.
+IN_FLIGHT_STATES = ("PENDING", "RECEIVED", "STARTED", "RETRY", "PROGRESS")
+# Celery also reports PENDING for ids it does not know, e.g. once a result
+# has expired from the backend; past this age PENDING means the job is gone.
+PENDING_TTL_SECONDS = int(os.environ.get("JOB_PENDING_TTL_SECONDS", "3600"))
+
+# fingerprint -> {"task_id", "dispatched_at", "outputs"} of the job dispatched for it.
+_jobs: dict[str, dict] = {}
+
+
+def _file_identity(path: str) -> dict:
+    """Identify an input by path, size and modification time (path only if missing)."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return {"path": path}
+    return {"path": os.path.realpath(path), "size": st.st_size, "mtime_ns": st.st_mtime_ns}
+
+
+def job_fingerprint(task: str, params: dict, input_paths: list[str], output_paths: list[str] = ()) -> str:
+    """Content address of a job: input file identities, parameters, outputs and task version.
+
+    The output paths are part of the job, so the same work requested under
+    another name runs again and writes that file.
+    """
+    payload = json.dumps(
+        {
+            "task": task,
+            "version": TASK_VERSIONS.get(task, 1),
+            "params": params,
+            "inputs": [_file_identity(p) for p in sorted(set(input_paths))],
+            "outputs": sorted(set(output_paths)),
+        },
+        sort_keys=True,
+        separators=(",", ":"),
+        default=str,
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def _usable(result) -> bool:
+    """Whether a finished job's result can be served again."""
+    if isinstance(result, dict):
+        if "error" in result:
+            return False
+        outputs = result.get("outputs") or {}
+        if not all(os.path.exists(path) for path in outputs.values()):
+            return False
+        result = result.get("result", "")
+    if isinstance(result, str):
+        if result.startswith("error"):
+            return False
+        # Output paths must still exist; other strings are plain values.
+        return not os.path.isabs(result) or os.path.exists(result)
+    return result is not None
+
+
+def lookup(fingerprint: str) -> Optional[dict]:
+    """The response for an identical job that is running or finished, if any.
+
+    In-flight jobs are returned as they are so the caller attaches to them;
+    finished jobs only when they succeeded and their output still exists.
+    A job still PENDING after PENDING_TTL_SECONDS is taken to be lost.
+    Anything else is forgotten, so the job is dispatched again.
+    """
+    job = _jobs.get(fingerprint)
+    if job is None:
+        return None
+    task_id = job["task_id"]
+    result = AsyncResult(task_id, app=celery_app)
+    stale = result.state == "PENDING" and time.time() - job["dispatched_at"] > PENDING_TTL_SECONDS
+    if result.state in IN_FLIGHT_STATES and not stale:
+        return {"job_id": task_id, "state": result.state, "fingerprint": fingerprint, "deduplicated": True}
+    if result.state == "SUCCESS" and _usable(result.result):
+        return {
+            "job_id": task_id,
+            "state": "SUCCESS",
+            "result": result.result,
+            "fingerprint": fingerprint,
+            "cached": True,
+        }
+    _jobs.pop(fingerprint, None)
+    return None
+
+
+def remember(fingerprint: str, task_id: str, output_paths: list[str] = ()) -> None:
+    """Record a dispatched job, forgetting older jobs that wrote the same outputs.
+
+    The new job overwrites those files, so the older results no longer
+    describe what is on disk.
+    """
+    outputs = set(output_paths)
+    for other in [fp for fp, job in _jobs.items() if outputs & job["outputs"]]:
+        _jobs.pop(other, None)
+    _jobs[fingerprint] = {"task_id": task_id, "dispatched_at": time.time(), "outputs": outputs}
+
+
+def invalidate(fingerprint: Optional[str] = None) -> int:
+    """Forget one fingerprint, or every one when None; returns how many were dropped."""
+    if fingerprint is None:
+        count = len(_jobs)
+        _jobs.clear()
+        return count
+    return 1 if _jobs.pop(fingerprint, None) is not None else 0
@@ -1,3 +1,5 @@
+from unittest.mock import MagicMock, patch
+
 import pytest
 from httpx import ASGITransport, AsyncClient
 
@@ -19,36 +21,177 @@ def setup_feeds():
 
 @pytest.mark.asyncio
 async def test_audio_sync():
+    """All feeds should be synced against the first in one batched job."""
+    with patch("app.services.audio_service.celery_app") as mock_celery:
+        mock_task = MagicMock()
+        mock_task.get.return_value = [{"offset_seconds": 1.25, "confidence": 0.93}]
+        mock_celery.send_task.return_value = mock_task
+
+        async with AsyncClient(
+            transport=ASGITransport(app=app), base_url="http://test"
+        ) as client:
+            resp = await client.post(
+                "/api/audio/sync",
+                json={"feed_ids": ["feed-1", "feed-2"]},
+            )
+    assert resp.status_code == 200
+    data = resp.json()
+    assert len(data) == 2
+    assert data[0]["feed_id"] == "feed-1"
+    assert data[0]["detected_offset_seconds"] == 0.0
+    assert data[0]["reference"] is True and data[0]["confidence"] is None
+    assert data[1]["detected_offset_seconds"] == 1.25
+    assert data[1]["confidence"] == 0.93
+    name = mock_celery.send_task.call_args.args[0]
+    assert name == "processor.celery_app.detect_offsets_batch_task"
+    assert mock_celery.send_task.call_args.kwargs["args"][:2] == ["http://a", ["http://b"]]
+
+
+@pytest.mark.asyncio
+async def test_audio_sync_returns_job_when_slow():
+    """A job that outlasts the wait answers 202 with the job to poll."""
+    from celery.exceptions import TimeoutError as CeleryTimeoutError
+
+    with patch("app.services.audio_service.celery_app") as mock_celery:
+        mock_task = MagicMock(id="sync-job", state="STARTED")
+        mock_task.get.side_effect = CeleryTimeoutError()
+        mock_celery.send_task.return_value = mock_task
+
+        async with AsyncClient(
+            transport=ASGITransport(app=app), base_url="http://test"
+        ) as client:
+            resp = await client.post(
+                "/api/audio/sync",
+                json={"feed_ids": ["feed-1", "feed-2"]},
+            )
+    assert resp.status_code == 202
+    assert resp.json() == {
+        "job_id": "sync-job",
+        "state": "STARTED",
+        "reference_feed_id": "feed-1",
+        "target_feed_ids": ["feed-2"],
+    }
+
+
+@pytest.mark.asyncio
+async def test_audio_sync_solve_updates_feeds():
+    """Solved offsets should be written back to each feed."""
+    with patch("app.services.audio_service.celery_app") as mock_celery:
+        mock_task = MagicMock()
+        mock_task.get.return_value = {
+            "offsets": {
+                "feed-1": {"offset_seconds": 0.0, "confidence": 0.9, "component": 0},
+                "feed-2": {"offset_seconds": -3.5, "confidence": 0.8, "component": 0},
+            },
+            "pairs": [],
+            "components": 1,
+        }
+        mock_celery.send_task.return_value = mock_task
+
+        async with AsyncClient(
+            transport=ASGITransport(app=app), base_url="http://test"
+        ) as client:
+            resp = await client.post(
+                "/api/audio/sync/solve",
+                json={"feed_ids": ["feed-1", "feed-2"]},
+            )
+    assert resp.status_code == 200
+    assert resp.json()[1]["offset_seconds"] == -3.5
+    assert _feeds["feed-2"].offset_seconds == -3.5
+    name = mock_celery.send_task.call_args.args[0]
+    assert name == "processor.celery_app.solve_offsets_task"
+    assert mock_celery.send_task.call_args.kwargs["args"][0] == {
+        "feed-1": "http://a",
+        "feed-2": "http://b",
+    }
+
+
+@pytest.mark.asyncio
+async def test_audio_sync_unknown_feed():
     async with AsyncClient(
         transport=ASGITransport(app=app), base_url="http://test"
     ) as client:
         resp = await client.post(
             "/api/audio/sync",
-            json={"feed_ids": ["feed-1", "feed-2"]},
+            json={"feed_ids": ["feed-1", "missing"]},
         )
+    assert resp.status_code == 404
+
+
+@pytest.mark.asyncio
+async def test_audio_optimize():
+    """The master mix is queued as one mixdown job with each feed's volume and offset."""
+    _feeds["feed-1"] = _feeds["feed-1"].model_copy(update={"offset_seconds": 2.0})
+    _feeds["feed-2"] = _feeds["feed-2"].model_copy(update={"offset_seconds": 0.5, "volume": 0.8})
+    with patch("app.services.audio_service.celery_app") as mock_celery:
+        mock_celery.send_task.return_value = MagicMock(id="mix-job")
+        async with AsyncClient(
+            transport=ASGITransport(app=app), base_url="http://test"
+        ) as client:
+            resp = await client.post(
+                "/api/audio/optimize",
+                json={
+                    "feed_ids": ["feed-1", "feed-2"],
+                    "master_feed_id": "feed-1",
+                    "normalize": True,
+                    "noise_reduce": False,
+                },
+            )
     assert resp.status_code == 200
     data = resp.json()
-    assert len(data) == 2
-    assert data[0]["feed_id"] == "feed-1"
-    assert "detected_offset_seconds" in data[0]
-    assert "confidence" in data[0]
+    assert data["output_path"].endswith("feed-1_mix.wav")
+    assert data["job_id"] == "mix-job"
+    assert data["settings_applied"]["normalize"] is True
+    assert data["settings_applied"]["feeds"]["feed-2"] == {"offset_seconds": -1.5, "volume": 0.8}
+    name = mock_celery.send_task.call_args.args[0]
+    assert name == "processor.celery_app.mixdown_task"
+    feeds, output_path, normalize, noise_reduce = mock_celery.send_task.call_args.kwargs["args"]
+    assert feeds == [
+        {"path": "http://a", "offset_seconds": 0.0, "volume": 1.0},
+        {"path": "http://b", "offset_seconds": -1.5, "volume": 0.8},
+    ]
+    assert output_path == data["output_path"]
+    assert (normalize, noise_reduce) == (True, False)
 
 
 @pytest.mark.asyncio
-async def test_audio_optimize():
+async def test_audio_optimize_master_must_be_mixed():
     async with AsyncClient(
         transport=ASGITransport(app=app), base_url="http://test"
     ) as client:
         resp = await client.post(
             "/api/audio/optimize",
-            json={
-                "feed_ids": ["feed-1", "feed-2"],
-                "master_feed_id": "feed-1",
-                "normalize": True,
-                "noise_reduce": False,
-            },
+            json={"feed_ids": ["feed-2"], "master_feed_id": "feed-1"},
         )
+    assert resp.status_code == 404
+
+
+@pytest.mark.asyncio
+async def test_audio_loudness_ranks_feeds():
+    """Feeds come back loudest first; a silent feed sorts last."""
+    with patch("app.services.audio_service.celery_app") as mock_celery:
+        mock_task = MagicMock()
+        mock_task.get.return_value = {
+            "feed-1": {"integrated_lufs": None, "gain_db": None, "momentary": [-70.0]},
+            "feed-2": {"integrated_lufs": -18.5, "gain_db": -4.5, "sample_peak_dbfs": -1.2,
+                       "clipped_samples": 3, "momentary": [-19.0, -18.0]},
+        }
+        mock_celery.send_task.return_value = mock_task
+
+        async with AsyncClient(
+            transport=ASGITransport(app=app), base_url="http://test"
+        ) as client:
+            resp = await client.post(
+                "/api/audio/loudness",
+                json={"feed_ids": ["feed-1", "feed-2"], "target_lufs": -23},
+            )
     assert resp.status_code == 200
     data = resp.json()
-    assert "output_path" in data
-    assert data["settings_applied"]["normalize"] is True
+    assert [r["feed_id"] for r in data] == ["feed-2", "feed-1"]
+    assert data[0]["gain_db"] == -4.5 and data[0]["clipped_samples"] == 3
+    assert data[1]["integrated_lufs"] is None
+    name = mock_celery.send_task.call_args.args[0]
+    assert name == "processor.celery_app.analyze_loudness_task"
+    assert mock_celery.send_task.call_args.kwargs["args"] == [
+        {"feed-1": "http://a", "feed-2": "http://b"}, -23.0, 1.0,
+    ]
@@ -1,3 +1,5 @@
+from unittest.mock import patch
+
 import pytest
 from httpx import ASGITransport, AsyncClient
 
@@ -90,3 +92,28 @@ async def test_delete_feed():
         assert resp.status_code == 204
         get_resp = await client.get(f"/api/feeds/{feed_id}")
     assert get_resp.status_code == 404
+
+
+@pytest.mark.asyncio
+async def test_upload_queues_fingerprint_and_loudness(tmp_path):
+    with patch("app.routers.feeds.settings") as mock_settings, patch(
+        "app.routers.feeds.celery_app"
+    ) as mock_celery:
+        mock_settings.UPLOAD_DIR = str(tmp_path)
+        async with AsyncClient(
+            transport=ASGITransport(app=app), base_url="http://test"
+        ) as client:
+            create_resp = await client.post(
+                "/api/feeds/", json={"name": "Cam1", "source_url": "http://a"}
+            )
+            feed_id = create_resp.json()["id"]
+            resp = await client.post(
+                f"/api/feeds/{feed_id}/upload",
+                files={"file": ("clip.mp4", b"fake video", "video/mp4")},
+            )
+    assert resp.status_code == 200
+    file_path = resp.json()["file_path"]
+    assert file_path.startswith(str(tmp_path))
+    calls = {c.args[0]: c.kwargs["args"] for c in mock_celery.send_task.call_args_list}
+    assert calls["processor.celery_app.fingerprint_feed_task"] == [feed_id, file_path]
+    assert calls["processor.celery_app.measure_loudness_task"] == [{feed_id: file_path}]
@@ -4,6 +4,14 @@ import pytest
 from httpx import ASGITransport, AsyncClient
 
 from app.main import app
+from app.services import job_cache
+
+
+@pytest.fixture(autouse=True)
+def clear_job_cache():
+    job_cache.invalidate()
+    yield
+    job_cache.invalidate()
 
 
 @pytest.mark.asyncio
@@ -28,6 +36,24 @@ async def test_get_job_status_pending():
     assert "error" not in data
 
 
+@pytest.mark.asyncio
+async def test_get_job_status_progress():
+    """A running render reports its checkpoint progress."""
+    with patch("app.routers.jobs.AsyncResult") as mock_result_cls:
+        mock_result = MagicMock()
+        mock_result.state = "PROGRESS"
+        mock_result.info = {"done": 12, "total": 40, "recovered": 9}
+        mock_result.ready.return_value = False
+        mock_result_cls.return_value = mock_result
+
+        async with AsyncClient(
+            transport=ASGITransport(app=app), base_url="http://test"
+        ) as client:
+            resp = await client.get("/api/jobs/render-job")
+
+    assert resp.json()["progress"] == {"done": 12, "total": 40, "recovered": 9}
+
+
 @pytest.mark.asyncio
 async def test_get_job_status_success():
     """A completed successful job should include the result."""
@@ -96,6 +122,24 @@ async def test_dispatch_compose():
     data = resp.json()
     assert data["job_id"] == "task-compose-1"
     assert data["state"] == "PENDING"
+    assert mock_celery.send_task.call_args.kwargs["args"][3] == "auto"
+
+
+@pytest.mark.asyncio
+async def test_dispatch_compose_invalid_engine():
+    async with AsyncClient(
+        transport=ASGITransport(app=app), base_url="http://test"
+    ) as client:
+        resp = await client.post(
+            "/api/jobs/compose",
+            json={
+                "layout": {"slots": []},
+                "feed_paths": {},
+                "output_filename": "out.mp4",
+                "engine": "gpu",
+            },
+        )
+    assert resp.status_code == 400
 
 
 @pytest.mark.asyncio
@@ -122,6 +166,59 @@ async def test_dispatch_sync():
     assert data["job_id"] == "task-sync-1"
 
 
+@pytest.mark.asyncio
+async def test_dispatch_drift():
+    """POST /api/jobs/drift should dispatch the drift analysis task."""
+    with patch("app.routers.jobs.celery_app") as mock_celery:
+        mock_task = MagicMock()
+        mock_task.id = "task-drift-1"
+        mock_celery.send_task.return_value = mock_task
+
+        async with AsyncClient(
+            transport=ASGITransport(app=app), base_url="http://test"
+        ) as client:
+            resp = await client.post(
+                "/api/jobs/drift",
+                json={
+                    "reference_path": "/data/uploads/ref.mp4",
+                    "target_path": "/data/uploads/tgt.mp4",
+                    "segments": 4,
+                },
+            )
+
+    assert resp.status_code == 202
+    assert resp.json()["job_id"] == "task-drift-1"
+    name = mock_celery.send_task.call_args.args[0]
+    assert name == "processor.celery_app.estimate_drift_task"
+    assert mock_celery.send_task.call_args.kwargs["args"][2] == 4
+
+
+@pytest.mark.asyncio
+async def test_dispatch_match():
+    """POST /api/jobs/match should queue a fingerprint lookup for the clip."""
+    with patch("app.routers.jobs.celery_app") as mock_celery:
+        mock_task = MagicMock()
+        mock_task.id = "task-match-1"
+        mock_celery.send_task.return_value = mock_task
+
+        async with AsyncClient(
+            transport=ASGITransport(app=app), base_url="http://test"
+        ) as client:
+            resp = await client.post(
+                "/api/jobs/match",
+                json={
+                    "video_path": "/data/uploads/clip.mp4",
+                    "feed_paths": {"cam1": "/data/uploads/cam1.mp4"},
+                },
+            )
+
+    assert resp.status_code == 202
+    assert resp.json()["job_id"] == "task-match-1"
+    name = mock_celery.send_task.call_args.args[0]
+    assert name == "processor.celery_app.match_clip_task"
+    assert mock_celery.send_task.call_args.kwargs["args"][1] == {"cam1": "/data/uploads/cam1.mp4"}
+
+
 @pytest.mark.asyncio
 async def test_dispatch_optimize():
     """POST /api/jobs/optimize should return 202 with a job_id."""
@@ -190,3 +287,174 @@ async def test_dispatch_export_invalid_format():
             },
         )
     assert resp.status_code == 400
+
+
+@pytest.mark.asyncio
+async def test_dispatch_sync_with_options():
+    """POST /api/jobs/sync should forward the search method and lag window."""
+    with patch("app.routers.jobs.celery_app") as mock_celery:
+        mock_task = MagicMock()
+        mock_task.id = "task-sync-2"
+        mock_celery.send_task.return_value = mock_task
+
+        async with AsyncClient(
+            transport=ASGITransport(app=app), base_url="http://test"
+        ) as client:
+            resp = await client.post(
+                "/api/jobs/sync",
+                json={
+                    "reference_path": "/data/uploads/ref.mp4",
+                    "target_path": "/data/uploads/tgt.mp4",
+                    "method": "fft",
+                    "max_lag_seconds": 5.0,
+                },
+            )
+
+    assert resp.status_code == 202
+    args = mock_celery.send_task.call_args.kwargs["args"]
+    assert args == ["/data/uploads/ref.mp4", "/data/uploads/tgt.mp4", "fft", 5.0]
+
+
+@pytest.mark.asyncio
+async def test_dispatch_sync_invalid_method():
+    """POST /api/jobs/sync with an unknown method should return 400."""
+    async with AsyncClient(
+        transport=ASGITransport(app=app), base_url="http://test"
+    ) as client:
+        resp = await client.post(
+            "/api/jobs/sync",
+            json={
+                "reference_path": "/data/uploads/ref.mp4",
+                "target_path": "/data/uploads/tgt.mp4",
+                "method": "bruteforce",
+            },
+        )
+    assert resp.status_code == 400
+
+
+@pytest.mark.asyncio
+async def test_identical_jobs_are_deduplicated_and_cached(tmp_path):
+    """Repeats attach to the running job, then get its result without a new task."""
+    source = tmp_path / "show.mp4"
+    source.write_bytes(b"video")
+    output = tmp_path / "show_vertical.mp4"
+    body = {"input_path": str(source), "output_filename": "a.mp4", "format": "portrait_1080p"}
+    with patch("app.routers.jobs.celery_app") as mock_celery, \
+            patch("app.services.job_cache.AsyncResult") as mock_result_cls:
+        mock_celery.send_task.return_value = MagicMock(id="task-export-1")
+        mock_result = MagicMock(state="STARTED")
+        mock_result_cls.return_value = mock_result
+        async with AsyncClient(
+            transport=ASGITransport(app=app), base_url="http://test"
+        ) as client:
+            first = await client.post("/api/jobs/export", json=body)
+            repeat = await client.post("/api/jobs/export", json=body)
+            # Another output name is another file to write, so it runs.
+            mock_celery.send_task.return_value = MagicMock(id="task-export-b")
+            renamed = await client.post("/api/jobs/export", json={**body, "output_filename": "b.mp4"})
+            mock_result.state = "SUCCESS"
+            mock_result.result = str(output)
+            mock_celery.send_task.return_value = MagicMock(id="task-export-2")
+            missing = await client.post("/api/jobs/export", json=body)
+            output.write_bytes(b"done")
+            cached = await client.post("/api/jobs/export", json=body)
+            fingerprint = first.json()["fingerprint"]
+            invalidated = await client.delete(f"/api/jobs/cache/{fingerprint}")
+            again = await client.post("/api/jobs/export", json=body)
+
+    assert repeat.json()["job_id"] == "task-export-1" and repeat.json()["deduplicated"]
+    assert renamed.json()["job_id"] == "task-export-b" and renamed.json()["fingerprint"] != fingerprint
+    # A finished job whose output is gone runs again.
+    assert missing.json()["job_id"] == "task-export-2" and "cached" not in missing.json()
+    assert cached.json()["cached"] and cached.json()["result"] == str(output)
+    assert invalidated.json() == {"invalidated": 1}
+    assert "cached" not in again.json()
+    assert mock_celery.send_task.call_count == 4
+
+
+def test_long_pending_job_is_treated_as_lost(monkeypatch):
+    """PENDING is also what Celery reports for expired ids, so it only counts while fresh."""
+    job_cache.invalidate()
+    job_cache.remember("fp", "task-1")
+    with patch("app.services.job_cache.AsyncResult") as mock_result_cls:
+        mock_result_cls.return_value = MagicMock(state="PENDING")
+        assert job_cache.lookup("fp")["deduplicated"]
+        monkeypatch.setitem(job_cache._jobs["fp"], "dispatched_at", 0.0)
+        assert job_cache.lookup("fp") is None
+    assert "fp" not in job_cache._jobs
+
+
+def test_overwriting_an_output_forgets_the_older_job():
+    job_cache.invalidate()
+    job_cache.remember("square", "task-1", ["/data/output/a.mp4"])
+    job_cache.remember("other", "task-2", ["/data/output/b.mp4"])
+    job_cache.remember("portrait", "task-3", ["/data/output/a.mp4"])
+    assert set(job_cache._jobs) == {"other", "portrait"}
+
+
+@pytest.mark.asyncio
+async def test_changed_input_file_changes_fingerprint(tmp_path):
+    source = tmp_path / "show.mp4"
+    source.write_bytes(b"video")
+    before = job_cache.job_fingerprint("export_task", {"format": "square_1080"}, [str(source)])
+    source.write_bytes(b"re-uploaded video")
+    after = job_cache.job_fingerprint("export_task", {"format": "square_1080"}, [str(source)])
+    assert before != after
+
+
+@pytest.mark.asyncio
+async def test_dispatch_export_multi():
+    """One job exports every requested format."""
+    with patch("app.routers.jobs.celery_app") as mock_celery:
+        mock_celery.send_task.return_value = MagicMock(id="task-multi-1")
+        async with AsyncClient(
+            transport=ASGITransport(app=app), base_url="http://test"
+        ) as client:
+            resp = await client.post(
+                "/api/jobs/export/multi",
+                json={
+                    "input_path": "/data/output/show.mp4",
+                    "output_prefix": "show",
+                    "formats": ["portrait_1080p", "square_1080", "portrait_1080p"],
+                },
+            )
+            bad = await client.post(
+                "/api/jobs/export/multi",
+                json={"input_path": "/data/output/show.mp4", "output_prefix": "show", "formats": ["4k"]},
+            )
+
+    assert resp.status_code == 202
+    data = resp.json()
+    assert data["job_id"] == "task-multi-1"
+    assert list(data["outputs"]) == ["portrait_1080p", "square_1080"]
+    assert data["outputs"]["square_1080"].endswith("show_square_1080.mp4")
+    args = mock_celery.send_task.call_args
+    assert args.args[0] == "processor.celery_app.export_multi_task"
+    assert args.kwargs["args"][1] == data["outputs"]
+    assert bad.status_code == 400
+
+
+@pytest.mark.asyncio
+async def test_dispatch_pipeline():
+    """A render→optimize→export chain is one job with one output per format."""
+    stages = [
+        {"stage": "render", "project": {"clips": []}, "feed_paths": {"cam1": "/data/uploads/cam1.mp4"}},
+        {"stage": "optimize", "normalize": True},
+        {"stage": "export", "formats": ["square_1080"]},
+    ]
+    with patch("app.routers.jobs.celery_app") as mock_celery:
+        mock_celery.send_task.return_value = MagicMock(id="task-pipe-1")
+        async with AsyncClient(
+            transport=ASGITransport(app=app), base_url="http://test"
+        ) as client:
+            resp = await client.post("/api/jobs/pipeline", json={"stages": stages, "output_prefix": "gig"})
+            bad = await client.post(
+                "/api/jobs/pipeline", json={"stages": [{"stage": "upscale"}], "output_filename": "x.mp4"},
+            )
+
+    assert resp.status_code == 202
+    assert resp.json()["outputs"]["square_1080"].endswith("gig_square_1080.mp4")
+    args = mock_celery.send_task.call_args
+    assert args.args[0] == "processor.celery_app.run_pipeline_task"
+    assert args.kwargs["args"][0] == stages and args.kwargs["args"][1] is None
+    assert bad.status_code == 400
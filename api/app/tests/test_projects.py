@@ -1,3 +1,5 @@
+from unittest.mock import MagicMock, patch
+
 import pytest
 from httpx import ASGITransport, AsyncClient
 
@@ -112,3 +114,52 @@ async def test_delete_project():
         assert resp.status_code == 204
         get_resp = await client.get(f"/api/projects/{project_id}")
     assert get_resp.status_code == 404
+
+
+@pytest.mark.asyncio
+async def test_render_project_passes_render_mode():
+    async with AsyncClient(
+        transport=ASGITransport(app=app), base_url="http://test"
+    ) as client:
+        created = await client.post("/api/projects/", json={"name": "Gig", "clips": []})
+        project_id = created.json()["id"]
+        with patch("app.routers.projects.celery_app") as mock_celery:
+            mock_celery.send_task.return_value = MagicMock(id="render-1")
+            resp = await client.post(
+                f"/api/projects/{project_id}/render",
+                params={"output_filename": "gig.mp4", "render_mode": "smart"},
+                json={},
+            )
+            bad = await client.post(
+                f"/api/projects/{project_id}/render",
+                params={"output_filename": "gig.mp4", "render_mode": "fast"},
+                json={},
+            )
+    assert resp.status_code == 202
+    assert resp.json()["job_id"] == "render-1"
+    assert mock_celery.send_task.call_args.kwargs["kwargs"] == {"render_mode": "smart", "resume": True}
+    assert bad.status_code == 400
+
+
+@pytest.mark.asyncio
+async def test_render_project_in_parallel():
+    async with AsyncClient(
+        transport=ASGITransport(app=app), base_url="http://test"
+    ) as client:
+        created = await client.post("/api/projects/", json={"name": "Gig", "clips": []})
+        project_id = created.json()["id"]
+        with patch("app.routers.projects.celery_app") as mock_celery:
+            mock_celery.send_task.return_value = MagicMock(id="render-2")
+            resp = await client.post(
+                f"/api/projects/{project_id}/render",
+                params={"output_filename": "gig.mp4", "parallel": "true"},
+                json={},
+            )
+            graph = await client.post(
+                f"/api/projects/{project_id}/render",
+                params={"output_filename": "gig.mp4", "parallel": "true", "render_mode": "graph"},
+                json={},
+            )
+    assert resp.status_code == 202
+    assert mock_celery.send_task.call_args.args[0] == "processor.celery_app.render_timeline_parallel_task"
+    assert graph.status_code == 400
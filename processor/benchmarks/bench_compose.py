@@ -0,0 +1,78 @@
+"""Benchmark the xstack compose graph against the overlay chain.
+
+Needs ffmpeg on PATH.  Run from the processor directory::
+
+    python -m benchmarks.bench_compose
+"""
+import math
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+
+from processor.compose import compile_layout
+
+CLIP_SECONDS = 10
+OUTPUT_SIZE = (1920, 1080)
+
+
+def _grid(n: int) -> dict:
+    cols = math.ceil(math.sqrt(n))
+    rows = math.ceil(n / cols)
+    return {
+        "output_width": OUTPUT_SIZE[0],
+        "output_height": OUTPUT_SIZE[1],
+        "slots": [
+            {
+                "feed_id": f"feed_{i}",
+                "x": round((i % cols) / cols, 4),
+                "y": round((i // cols) / rows, 4),
+                "width": round(1 / cols, 4),
+                "height": round(1 / rows, 4),
+            }
+            for i in range(n)
+        ],
+    }
+
+
+def _make_clips(directory: str, count: int) -> dict[str, str]:
+    paths = {}
+    for i in range(count):
+        path = os.path.join(directory, f"feed_{i}.mp4")
+        subprocess.run(
+            ["ffmpeg", "-y", "-v", "error", "-f", "lavfi",
+             "-i", f"testsrc2=size=1280x720:rate=30:duration={CLIP_SECONDS}",
+             "-c:v", "libx264", "-preset", "ultrafast", path],
+            check=True,
+        )
+        paths[f"feed_{i}"] = path
+    return paths
+
+
+def _render_seconds(layout: dict, feeds: dict[str, str], engine: str) -> float:
+    """Wall time to decode, compose and discard the output (no encode)."""
+    inputs, graph, _, _ = compile_layout(layout, feeds, engine)
+    cmd = ["ffmpeg", "-v", "error"] + inputs + ["-filter_complex", graph, "-map", "[out]", "-f", "null", "-"]
+    start = time.perf_counter()
+    subprocess.run(cmd, check=True)
+    return time.perf_counter() - start
+
+
+def main():
+    if not shutil.which("ffmpeg"):
+        print("ffmpeg not found; nothing to benchmark")
+        return
+    with tempfile.TemporaryDirectory() as scratch:
+        clips = _make_clips(scratch, 16)
+        print(f"{'inputs':>6} {'overlay (s)':>12} {'xstack (s)':>11} {'speedup':>8}")
+        for n in (4, 9, 16):
+            layout = _grid(n)
+            feeds = {f"feed_{i}": clips[f"feed_{i}"] for i in range(n)}
+            overlay = _render_seconds(layout, feeds, "overlay")
+            xstack = _render_seconds(layout, feeds, "xstack")
+            print(f"{n:>6} {overlay:>12.2f} {xstack:>11.2f} {overlay / xstack:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""Benchmark FFT and coarse-to-fine offset search against direct np.correlate.
+
+Run from the processor directory::
+
+    python -m benchmarks.bench_sync
+"""
+import time
+
+import numpy as np
+
+from processor.sync import estimate_offset, estimate_offset_multires, estimate_offsets_batch
+
+SAMPLE_RATE = 16000
+
+
+def _synthetic_pair(ref_seconds: float, offset_seconds: float, seed: int = 0):
+    """Return a noise-like reference and a half-length target cut from it."""
+    rng = np.random.default_rng(seed)
+    ref = rng.standard_normal(int(ref_seconds * SAMPLE_RATE)).astype(np.float32)
+    start = int(offset_seconds * SAMPLE_RATE)
+    tgt = ref[start:start + len(ref) // 2].copy()
+    tgt += 0.1 * rng.standard_normal(len(tgt)).astype(np.float32)
+    return ref, tgt
+
+
+def _direct_offset(ref: np.ndarray, tgt: np.ndarray) -> float:
+    correlation = np.correlate(ref, tgt, mode="full")
+    peak_index = int(np.argmax(np.abs(correlation)))
+    return (peak_index - (len(tgt) - 1)) / SAMPLE_RATE
+
+
+def _timed(fn, *args):
+    start = time.perf_counter()
+    value = fn(*args)
+    return value, time.perf_counter() - start
+
+
+def main():
+    print(f"{'ref (s)':>8} {'direct (s)':>11} {'fft (s)':>9} {'speedup':>8}  offset")
+    for ref_seconds in (2.0, 5.0, 10.0):
+        ref, tgt = _synthetic_pair(ref_seconds, offset_seconds=0.375)
+        direct_offset, direct_time = _timed(_direct_offset, ref, tgt)
+        result, fft_time = _timed(estimate_offset, ref, tgt, SAMPLE_RATE)
+        assert abs(result["offset_seconds"] - direct_offset) < 1e-3
+        print(
+            f"{ref_seconds:>8.1f} {direct_time:>11.3f} {fft_time:>9.4f} "
+            f"{direct_time / fft_time:>7.0f}x  {result['offset_seconds']}"
+        )
+
+    # Sizes that are out of reach for the direct method.
+    print(f"\n{'ref (s)':>8} {'fft (s)':>9} {'multires (s)':>13} {'bounded (s)':>12}  offset")
+    for ref_seconds in (300.0, 1200.0):
+        ref, tgt = _synthetic_pair(ref_seconds, offset_seconds=2.5)
+        result, fft_time = _timed(estimate_offset, ref, tgt, SAMPLE_RATE)
+        coarse, multires_time = _timed(estimate_offset_multires, ref, tgt, SAMPLE_RATE)
+        bounded, bounded_time = _timed(
+            lambda r, t: estimate_offset_multires(r, t, SAMPLE_RATE, max_lag_seconds=5.0), ref, tgt,
+        )
+        assert result["offset_seconds"] == coarse["offset_seconds"] == bounded["offset_seconds"]
+        print(
+            f"{ref_seconds:>8.1f} {fft_time:>9.4f} {multires_time:>13.4f} {bounded_time:>12.4f}  "
+            f"{result['offset_seconds']}"
+        )
+
+    # One reference against twelve cameras: pairwise vs. shared reference spectrum.
+    ref, _ = _synthetic_pair(120.0, offset_seconds=0.0)
+    rng = np.random.default_rng(3)
+    starts = rng.integers(0, 60 * SAMPLE_RATE, size=12)
+    targets = [ref[s:s + 50 * SAMPLE_RATE].copy() for s in starts]
+    _, pairwise_time = _timed(lambda: [estimate_offset(ref, t, SAMPLE_RATE) for t in targets])
+    batch, batch_time = _timed(lambda: estimate_offsets_batch(ref, targets, SAMPLE_RATE, "fft"))
+    assert [r["offset_seconds"] for r in batch] == [round(s / SAMPLE_RATE, 4) for s in starts]
+    print(f"\n12 targets, fft: pairwise {pairwise_time:.3f}s  batched {batch_time:.3f}s")
+
+
+if __name__ == "__main__":
+    main()
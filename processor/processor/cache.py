@@ -0,0 +1,296 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+from typing import Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+PCM_CACHE_DIR = os.environ.get("PCM_CACHE_DIR", "/data/cache/pcm")
+PCM_CACHE_MAX_BYTES = int(os.environ.get("PCM_CACHE_MAX_BYTES", str(20 * 1024 ** 3)))
+SEGMENT_CACHE_DIR = os.environ.get("SEGMENT_CACHE_DIR", "/data/cache/segments")
+SEGMENT_CACHE_MAX_BYTES = int(os.environ.get("SEGMENT_CACHE_MAX_BYTES", str(50 * 1024 ** 3)))
+LOUDNESS_CACHE_DIR = os.environ.get("LOUDNESS_CACHE_DIR", "/data/cache/loudness")
+# Bump when piece encoding changes, so old renders stop matching.
+SEGMENT_CACHE_VERSION = 2
+
+
+def file_identity(path: str) -> Optional[dict]:
+    """Identify a file by resolved path, size and modification time.
+
+    Returns None if the file does not exist, so callers can skip caching.
+    """
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return {"path": os.path.realpath(path), "size": st.st_size, "mtime_ns": st.st_mtime_ns}
+
+
+def cache_key(*parts) -> str:
+    """Stable hex digest of JSON-serializable key parts."""
+    payload = json.dumps(parts, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class DiskCache:
+    """A directory of cache entries with least-recently-used eviction by size.
+
+    Each entry is one file named ``<key><suffix>``.  Hits bump the file's
+    mtime, so recency survives worker restarts and is shared by every process
+    using the same directory.  Entries are published with an atomic rename,
+    so readers never observe a partially written file.
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int, suffix: str):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.suffix = suffix
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+    def path_for(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key + self.suffix)
+
+    def get(self, key: str) -> Optional[str]:
+        """Return the entry path for ``key`` and mark it recently used, or None."""
+        path = self.path_for(key)
+        try:
+            os.utime(path)
+        except OSError:
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return path
+
+    def temp_path(self, key: str) -> str:
+        """A private path to write a new entry to before :meth:`put`."""
+        os.makedirs(self.cache_dir, exist_ok=True)
+        return f"{self.path_for(key)}.{os.getpid()}.{threading.get_ident()}.tmp"
+
+    def put(self, key: str, temp_path: str) -> str:
+        """Publish ``temp_path`` as the entry for ``key`` and enforce the size bound."""
+        path = self.path_for(key)
+        os.replace(temp_path, path)
+        self.evict(keep=path)
+        return path
+
+    def discard(self, key: str) -> None:
+        try:
+            os.remove(self.path_for(key))
+        except OSError:
+            pass
+
+    def _entries(self) -> list[tuple[float, int, str]]:
+        entries = []
+        try:
+            names = os.listdir(self.cache_dir)
+        except OSError:
+            return entries
+        for name in names:
+            if not name.endswith(self.suffix):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+        return entries
+
+    def evict(self, keep: Optional[str] = None) -> int:
+        """Delete least-recently-used entries until the cache fits ``max_bytes``.
+
+        ``keep`` is never evicted, so an entry larger than the whole budget is
+        still usable by the caller that just wrote it.  Returns bytes freed.
+        """
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        freed = 0
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            freed += size
+            with self._lock:
+                self.evictions += 1
+        if freed:
+            logger.info("Evicted %d bytes from %s", freed, self.cache_dir)
+        return freed
+
+    def clear(self) -> None:
+        for _, _, path in self._entries():
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def stats(self) -> dict:
+        entries = self._entries()
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "entries": len(entries),
+            "bytes": sum(size for _, size, _ in entries),
+            "max_bytes": self.max_bytes,
+        }
+
+
+class PCMCache(DiskCache):
+    """Decoded PCM stored as memory-mappable ``.npy`` files.
+
+    Keys combine the source file identity with the sample rate and sample
+    dtype, so a changed file or a different decode never hits a stale entry.
+    """
+
+    def __init__(self, cache_dir: str = PCM_CACHE_DIR, max_bytes: int = PCM_CACHE_MAX_BYTES):
+        super().__init__(cache_dir, max_bytes, ".npy")
+
+    def load(self, video_path: str, sample_rate: int, dtype: np.dtype = np.int16) -> np.ndarray:
+        """Return the PCM of ``video_path``, decoding it only on a cache miss."""
+        from processor.sync import extract_audio_pcm
+
+        dtype = np.dtype(dtype)
+        identity = file_identity(video_path)
+        if identity is None:
+            return extract_audio_pcm(video_path, sample_rate, dtype)
+
+        key = cache_key("pcm", identity, sample_rate, dtype.str)
+        path = self.get(key)
+        if path:
+            try:
+                return np.load(path, mmap_mode="r")
+            except (OSError, ValueError):
+                logger.warning("Discarding unreadable PCM cache entry %s", path)
+                self.discard(key)
+
+        try:
+            temp_path = self.temp_path(key)
+        except OSError:
+            logger.warning("PCM cache dir %s not writable; decoding uncached", self.cache_dir)
+            return extract_audio_pcm(video_path, sample_rate, dtype)
+
+        samples = extract_audio_pcm(video_path, sample_rate, dtype, mmap_path=temp_path)
+        if samples.size == 0:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            return samples
+        # The memory map stays valid across the rename.
+        self.put(key, temp_path)
+        logger.info("PCM cache stats: %s", self.stats())
+        return samples
+
+
+_pcm_cache: Optional[PCMCache] = None
+
+
+def get_pcm_cache() -> Optional[PCMCache]:
+    """Process-wide PCM cache, or None when PCM_CACHE_DIR is empty."""
+    global _pcm_cache
+    if not PCM_CACHE_DIR:
+        return None
+    if _pcm_cache is None:
+        _pcm_cache = PCMCache()
+    return _pcm_cache
+
+
+class SegmentCache(DiskCache):
+    """Re-encoded timeline pieces stored as MPEG-TS files.
+
+    Keys combine the source file identity with everything that shapes the
+    encode: the piece's trim points and lead-in, the clip's speed, the
+    output size and the encoder spec.  Editing one clip therefore changes
+    only the keys of that clip's pieces.
+    """
+
+    def __init__(self, cache_dir: str = SEGMENT_CACHE_DIR, max_bytes: int = SEGMENT_CACHE_MAX_BYTES):
+        super().__init__(cache_dir, max_bytes, ".ts")
+
+    def key_for(self, segment: dict, piece: dict, out_w: int, out_h: int, spec: dict) -> Optional[str]:
+        """Cache key of one piece, or None if its source cannot be identified."""
+        identity = file_identity(segment["path"])
+        if identity is None:
+            return None
+        return cache_key(
+            "segment", SEGMENT_CACHE_VERSION, identity,
+            piece["start"], piece["end"], piece.get("lead_in", segment["lead_in"]),
+            piece.get("streams", "av"), round(segment["speed"], 9), out_w, out_h, spec,
+        )
+
+
+_segment_cache: Optional[SegmentCache] = None
+
+
+def get_segment_cache() -> Optional[SegmentCache]:
+    """Process-wide segment cache, or None when SEGMENT_CACHE_DIR is empty."""
+    global _segment_cache
+    if not SEGMENT_CACHE_DIR:
+        return None
+    if _segment_cache is None:
+        _segment_cache = SegmentCache()
+    return _segment_cache
+
+
+class LoudnessCache(DiskCache):
+    """Loudness measurements stored as small ``.json`` files.
+
+    Keys combine the source file identity with the analysis settings, so a
+    re-uploaded file or a new loudness target is measured again.
+    """
+
+    def __init__(self, cache_dir: str = LOUDNESS_CACHE_DIR, max_bytes: int = 64 * 1024 ** 2):
+        super().__init__(cache_dir, max_bytes, ".json")
+
+    def key_for(self, path: str, settings: str) -> Optional[str]:
+        identity = file_identity(path)
+        return cache_key("loudness", identity, settings) if identity else None
+
+    def load(self, key: str) -> Optional[dict]:
+        path = self.get(key)
+        if not path:
+            return None
+        try:
+            with open(path) as fh:
+                return json.load(fh)
+        except (OSError, ValueError):
+            logger.warning("Discarding unreadable loudness cache entry %s", path)
+            self.discard(key)
+            return None
+
+    def store(self, key: str, measurements: dict) -> None:
+        try:
+            temp = self.temp_path(key)
+            with open(temp, "w") as fh:
+                json.dump(measurements, fh)
+            self.put(key, temp)
+        except OSError:
+            logger.warning("Loudness cache dir %s not writable", self.cache_dir)
+
+
+_loudness_cache: Optional[LoudnessCache] = None
+
+
+def get_loudness_cache() -> Optional[LoudnessCache]:
+    """Process-wide loudness cache, or None when LOUDNESS_CACHE_DIR is empty."""
+    global _loudness_cache
+    if not LOUDNESS_CACHE_DIR:
+        return None
+    if _loudness_cache is None:
+        _loudness_cache = LoudnessCache()
+    return _loudness_cache
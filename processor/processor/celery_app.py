@@ -1,32 +1,187 @@
 import os
 import logging
+from typing import Optional
 
-from celery import Celery
+from celery import Celery, chord, group, signals
 
 logger = logging.getLogger(__name__)
 
 CELERY_BROKER_URL = os.environ.get("CELERY_BROKER_URL", "redis://redis:6379/0")
 CELERY_RESULT_BACKEND = os.environ.get("CELERY_RESULT_BACKEND", "redis://redis:6379/0")
 
+# Renders are acknowledged only when they finish.  The Redis broker hands an
+# unacknowledged task to another worker after this long, so it must exceed
+# the longest render or a running render is started a second time.
+CELERY_VISIBILITY_TIMEOUT = int(os.environ.get("CELERY_VISIBILITY_TIMEOUT", str(12 * 3600)))
+
 app = Celery("processor", broker=CELERY_BROKER_URL, backend=CELERY_RESULT_BACKEND)
+app.conf.broker_transport_options = {"visibility_timeout": CELERY_VISIBILITY_TIMEOUT}
+
+
+@signals.task_prerun.connect
+def _begin_ffmpeg_scope(task_id: str, **kwargs) -> None:
+    """Attribute the ffmpeg work started by the task about to run to its id."""
+    from processor.pool import begin_task
+
+    begin_task(task_id)
+
+
+@signals.task_postrun.connect
+def _end_ffmpeg_scope(task_id: str, **kwargs) -> None:
+    from processor.pool import end_task
+
+    end_task(task_id)
+
+
+@signals.task_revoked.connect
+def _cancel_ffmpeg_on_revoke(request=None, **kwargs) -> None:
+    """Kill the ffmpeg processes of a revoked task instead of letting them run on.
+
+    Only the revoked task's processes are killed.  This takes effect where
+    the task runs in the process handling the revoke (solo, thread and
+    gevent pools).  A prefork child terminated with ``revoke(terminate=True)``
+    unwinds through the same cleanup, since every ffmpeg wait kills its
+    processes on the way out.
+    """
+    from processor.pool import cancel_task
+
+    if request is not None:
+        cancel_task(request.id)
 
 
 @app.task
-def detect_offset_task(reference_path: str, target_path: str) -> dict:
+def detect_offset_task(
+    reference_path: str,
+    target_path: str,
+    method: str = "multires",
+    max_lag_seconds: Optional[float] = None,
+) -> dict:
     """Celery task: detect audio offset between two video files."""
     from processor.sync import detect_offset
 
-    logger.info("Running detect_offset_task: ref=%s target=%s", reference_path, target_path)
-    return detect_offset(reference_path, target_path)
+    logger.info(
+        "Running detect_offset_task: ref=%s target=%s method=%s max_lag=%s",
+        reference_path, target_path, method, max_lag_seconds,
+    )
+    return detect_offset(reference_path, target_path, method, max_lag_seconds)
+
+
+@app.task
+def detect_offsets_batch_task(
+    reference_path: str,
+    target_paths: list[str],
+    method: str = "multires",
+    max_lag_seconds: Optional[float] = None,
+) -> list[dict]:
+    """Celery task: detect audio offsets of many files against one reference."""
+    from processor.sync import detect_offsets_batch
+
+    logger.info(
+        "Running detect_offsets_batch_task: ref=%s targets=%d method=%s",
+        reference_path, len(target_paths), method,
+    )
+    return detect_offsets_batch(reference_path, target_paths, method, max_lag_seconds)
+
+
+@app.task
+def solve_offsets_task(feed_paths: dict, max_lag_seconds: Optional[float] = None) -> dict:
+    """Celery task: one consistent offset per feed from a sparse set of pairs."""
+    from processor.solver import solve_feed_offsets
+
+    logger.info("Running solve_offsets_task: feeds=%d", len(feed_paths))
+    return solve_feed_offsets(feed_paths, max_lag_seconds)
+
+
+@app.task
+def estimate_drift_task(
+    reference_path: str,
+    target_path: str,
+    segments: int = 1,
+    hop_seconds: float = 30.0,
+) -> dict:
+    """Celery task: measure clock drift of a target file against a reference."""
+    from processor.drift import detect_drift
+
+    logger.info("Running estimate_drift_task: ref=%s target=%s", reference_path, target_path)
+    return detect_drift(reference_path, target_path, segments, hop_seconds)
+
+
+@app.task
+def fingerprint_feed_task(feed_id: str, video_path: str) -> dict:
+    """Celery task: fingerprint a feed's audio at ingest for clip matching."""
+    from processor.fingerprint import fingerprint_feed
+
+    logger.info("Running fingerprint_feed_task: feed=%s path=%s", feed_id, video_path)
+    return fingerprint_feed(feed_id, video_path)
+
+
+@app.task
+def match_clip_task(
+    video_path: str,
+    feed_paths: Optional[dict] = None,
+    exclude_feed_id: Optional[str] = None,
+    top_n: int = 5,
+) -> list[dict]:
+    """Celery task: find the fingerprinted feeds a clip overlaps, and where."""
+    from processor.fingerprint import FingerprintIndex, match_clip
+
+    feed_ids = list(feed_paths) if feed_paths else None
+    index = FingerprintIndex.load(feed_ids=feed_ids, feed_paths=feed_paths)
+    logger.info("Running match_clip_task: clip=%s index=%d hashes", video_path, len(index))
+    return match_clip(video_path, index, feed_paths, exclude_feed_id, top_n)
+
+
+@app.task
+def measure_loudness_task(feed_paths: dict) -> dict:
+    """Celery task: measure the loudness of every feed of a project at once."""
+    from processor.optimize import measure_loudness_many
+
+    logger.info("Running measure_loudness_task: feeds=%d", len(feed_paths))
+    return dict(zip(feed_paths, measure_loudness_many(list(feed_paths.values()))))
+
+
+@app.task
+def analyze_loudness_task(
+    feed_paths: dict,
+    target_lufs: Optional[float] = None,
+    curve_hop_seconds: float = 1.0,
+) -> dict:
+    """Celery task: EBU R128 loudness, peak and loudness curves of every feed from cached PCM."""
+    from processor.loudness import analyze_many
+
+    logger.info("Running analyze_loudness_task: feeds=%d target=%s", len(feed_paths), target_lufs)
+    return analyze_many(feed_paths, curve_hop_seconds=curve_hop_seconds, target_lufs=target_lufs)
 
 
 @app.task
-def compose_videos_task(layout: dict, feed_paths: dict, output_path: str) -> str:
-    """Celery task: compose multiple video feeds into a single output file."""
-    from processor.compose import compose_videos
+def extract_thumbnails_task(feed_paths: dict, output_dir: str) -> dict:
+    """Celery task: extract a thumbnail for every feed of a project at once."""
+    from processor.thumbnail import extract_thumbnails
 
-    logger.info("Running compose_videos_task: output=%s", output_path)
-    return compose_videos(layout, feed_paths, output_path)
+    logger.info("Running extract_thumbnails_task: feeds=%d output=%s", len(feed_paths), output_dir)
+    return extract_thumbnails(feed_paths, output_dir)
+
+
+@app.task
+def compose_videos_task(
+    layout: dict,
+    feed_paths: dict,
+    output_path: str,
+    engine: str = "auto",
+    feed_offsets: Optional[dict] = None,
+    start_seconds: float = 0.0,
+    duration_seconds: Optional[float] = None,
+) -> dict:
+    """Celery task: compose multiple video feeds into a single output file.
+
+    Returns {"result", "engine", "culled_slots"}.
+    """
+    from processor.compose import compose_layout
+
+    logger.info("Running compose_videos_task: output=%s engine=%s", output_path, engine)
+    return compose_layout(
+        layout, feed_paths, output_path, engine, feed_offsets, start_seconds, duration_seconds
+    )
 
 
 @app.task
@@ -43,6 +198,20 @@ def optimize_audio_task(
     return optimize_audio(input_path, output_path, normalize, noise_reduce)
 
 
+@app.task
+def mixdown_task(
+    feeds: list,
+    output_path: str,
+    normalize: bool = True,
+    noise_reduce: bool = False,
+) -> dict:
+    """Celery task: mix many feeds' audio into one master WAV, then optimize it."""
+    from processor.mixdown import master_mix
+
+    logger.info("Running mixdown_task: feeds=%d output=%s", len(feeds), output_path)
+    return master_mix(feeds, output_path, normalize, noise_reduce)
+
+
 @app.task
 def export_task(input_path: str, output_path: str, width: int, height: int) -> str:
     """Celery task: export a video to a social-media-friendly format."""
@@ -56,9 +225,130 @@ def export_task(input_path: str, output_path: str, width: int, height: int) -> s
 
 
 @app.task
-def render_timeline_task(project: dict, feed_paths: dict, output_path: str) -> str:
-    """Celery task: render a project timeline to a single output file."""
-    from processor.timeline import render_timeline
+def run_pipeline_task(
+    stages: list,
+    output_path: Optional[str] = None,
+    outputs: Optional[dict] = None,
+    input_path: Optional[str] = None,
+) -> dict:
+    """Celery task: run a chain of processor stages in as few ffmpeg runs as possible."""
+    from processor.pipeline import run_pipeline
+
+    logger.info("Running run_pipeline_task: stages=%s", [stage.get("stage") for stage in stages])
+    return run_pipeline(stages, output_path, outputs, input_path)
+
+
+@app.task
+def export_multi_task(input_path: str, outputs: dict) -> dict:
+    """Celery task: export one master to several social formats in one decode."""
+    from processor.export import export_multi
+
+    logger.info("Running export_multi_task: input=%s formats=%s", input_path, list(outputs))
+    return export_multi(input_path, outputs)
+
+
+@app.task(bind=True, acks_late=True, reject_on_worker_lost=True)
+def render_timeline_task(
+    self,
+    project: dict,
+    feed_paths: dict,
+    output_path: str,
+    offset_maps: Optional[dict] = None,
+    seek_mode: str = "input",
+    render_mode: str = "copy",
+    resume: bool = True,
+) -> dict:
+    """Celery task: render a project timeline to a single output file.
+
+    ``render_mode`` is one of processor.timeline.RENDER_MODES.  In "copy"
+    and "smart" mode clips (or, for "smart", their keyframe-aligned
+    middles) are stream-copied and joined with the concat demuxer; the
+    result then also lists per-segment modes.  Those renders checkpoint
+    every finished piece and report PROGRESS ({"done", "total",
+    "recovered"}); the task is acknowledged only once it finishes, so a
+    worker lost mid-render hands it to another worker, which resumes.
+    """
+    from processor.segments import render_timeline_segments
+    from processor.timeline import RENDER_MODES, render_timeline_detailed
+
+    logger.info(
+        "Running render_timeline_task: output=%s seek=%s render=%s", output_path, seek_mode, render_mode
+    )
+    if render_mode not in RENDER_MODES:
+        return {"result": f"error: unknown render mode '{render_mode}'"}
+    if render_mode != "graph" and seek_mode == "input":
+        return render_timeline_segments(
+            project, feed_paths, output_path, offset_maps, smart=render_mode == "smart", resume=resume,
+            progress=lambda meta: self.update_state(state="PROGRESS", meta=meta),
+        )
+    return render_timeline_detailed(project, feed_paths, output_path, offset_maps, seek_mode)
+
+
+@app.task(acks_late=True, reject_on_worker_lost=True)
+def render_piece_task(job: dict, output_path: str, out_w: int, out_h: int, spec: dict) -> str:
+    """Celery task: render one piece of a parallel timeline render.
+
+    Acknowledged only once the piece is written, so a piece lost with its
+    worker is rendered by another one and the chord still completes.
+    """
+    from processor.segments import render_piece
+
+    return render_piece(job, output_path, out_w, out_h, spec)
+
+
+@app.task
+def concat_pieces_task(piece_results: list, output_path: str, scratch_dir: str, report: dict,
+                       streams: Optional[list] = None) -> dict:
+    """Celery chord callback: join the rendered pieces into the final output."""
+    from processor.segments import finish_parallel_render
+
+    return finish_parallel_render(piece_results, output_path, scratch_dir, report, streams)
 
-    logger.info("Running render_timeline_task: output=%s", output_path)
-    return render_timeline(project, feed_paths, output_path)
+
+@app.task(bind=True, acks_late=True, reject_on_worker_lost=True)
+def render_timeline_parallel_task(
+    self,
+    project: dict,
+    feed_paths: dict,
+    output_path: str,
+    offset_maps: Optional[dict] = None,
+    render_mode: str = "smart",
+    segment_seconds: Optional[float] = None,
+    resume: bool = True,
+) -> dict:
+    """Celery task: render a timeline as independent pieces across workers.
+
+    The timeline is split at clip boundaries and every ``segment_seconds``
+    of re-encoded material (see :func:`processor.segments.plan_parallel_render`);
+    the pieces render as a group with identical encoder settings and a chord
+    callback concatenates them without re-encoding.  This task is replaced
+    by the chord, so its result is the callback's render report.  Pieces
+    are checkpointed next to the output, which must be on storage every
+    worker shares; with ``resume`` pieces finished by an earlier run of the
+    same plan are not rendered again.
+    """
+    from processor.segments import PARALLEL_SEGMENT_SECONDS, RenderCheckpoint, plan_parallel_render
+
+    logger.info("Running render_timeline_parallel_task: output=%s render=%s", output_path, render_mode)
+    if render_mode not in ("copy", "smart"):
+        return {"result": f"error: parallel render needs render mode 'copy' or 'smart', not '{render_mode}'"}
+    if not project.get("clips"):
+        return {"result": "error: no clips defined in project"}
+    jobs, spec, report = plan_parallel_render(
+        project, feed_paths, offset_maps, render_mode == "smart", segment_seconds or PARALLEL_SEGMENT_SECONDS,
+    )
+    if not jobs:
+        return {"result": "error: no valid feeds for project"}
+
+    out_w = project.get("output_width", 1920)
+    out_h = project.get("output_height", 1080)
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    checkpoint = RenderCheckpoint(output_path, [(j["segment"], j["piece"]) for j in jobs], out_w, out_h, spec)
+    report["recovered"] = len(checkpoint.open(resume))
+    header = group(
+        render_piece_task.s(job, checkpoint.piece_path(k), out_w, out_h, spec)
+        for k, job in enumerate(jobs)
+    )
+    streams = [job["piece"].get("streams", "av") for job in jobs]
+    logger.info("Dispatching %d render pieces (%d recovered)", len(jobs), report["recovered"])
+    raise self.replace(chord(header, concat_pieces_task.s(output_path, checkpoint.dir, report, streams)))
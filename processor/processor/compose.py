@@ -1,79 +1,266 @@
 import subprocess
 import logging
+from typing import Optional
+
+from processor.media import input_args, lead_in_filters
+from processor.pool import run_ffmpeg
 
 logger = logging.getLogger(__name__)
 
+COMPOSE_ENGINES = ("auto", "xstack", "overlay")
 
-def compose_videos(
-    layout: dict, feed_paths: dict[str, str], output_path: str
-) -> str:
-    """Compose multiple video feeds into a single output based on a layout.
 
-    Args:
-        layout: Dict with "output_width", "output_height", and "slots" list.
-                Each slot has feed_id, x, y, width, height (fractions 0-1).
-        feed_paths: Mapping of feed_id to file path.
-        output_path: Destination file path for the composed video.
+def _slot_rects(layout: dict, feed_paths: dict[str, str]) -> list[dict]:
+    """Pixel rectangles of the slots that have a file, in layout order.
 
-    Returns:
-        The output file path on success, or an error string.
+    Edges are rounded independently, so adjacent fractional slots share an
+    edge exactly instead of leaving one-pixel seams.
     """
     out_w = layout.get("output_width", 1920)
     out_h = layout.get("output_height", 1080)
-    slots = layout.get("slots", [])
-
-    if not slots:
-        return "error: no slots defined in layout"
-
-    # Build ffmpeg inputs and filter_complex
-    inputs: list[str] = []
-    filters: list[str] = []
-    overlay_chain = ""
-
-    for idx, slot in enumerate(slots):
+    rects = []
+    for order, slot in enumerate(layout.get("slots", [])):
         feed_id = slot["feed_id"]
         path = feed_paths.get(feed_id)
         if not path:
             logger.warning("No file for feed_id=%s, skipping", feed_id)
             continue
+        left = round(slot["x"] * out_w)
+        top = round(slot["y"] * out_h)
+        right = min(out_w, round((slot["x"] + slot["width"]) * out_w))
+        bottom = min(out_h, round((slot["y"] + slot["height"]) * out_h))
+        if right <= left or bottom <= top:
+            logger.warning("Slot for feed_id=%s has no visible area, skipping", feed_id)
+            continue
+        rects.append({
+            "feed_id": feed_id,
+            "path": path,
+            "x": left,
+            "y": top,
+            "w": right - left,
+            "h": bottom - top,
+            "z_index": slot.get("z_index", 0),
+            "order": order,
+        })
+    return rects
+
+
+def _subtract(box: tuple, cover: tuple) -> list[tuple]:
+    """Parts of ``box`` (x0, y0, x1, y1) not covered by ``cover``, as disjoint boxes."""
+    x0, y0, x1, y1 = box
+    cx0, cy0, cx1, cy1 = cover
+    if cx0 >= x1 or cx1 <= x0 or cy0 >= y1 or cy1 <= y0:
+        return [box]
+    parts = []
+    if cy0 > y0:
+        parts.append((x0, y0, x1, cy0))
+    if cy1 < y1:
+        parts.append((x0, cy1, x1, y1))
+    top, bottom = max(y0, cy0), min(y1, cy1)
+    if cx0 > x0:
+        parts.append((x0, top, cx0, bottom))
+    if cx1 < x1:
+        parts.append((cx1, top, x1, bottom))
+    return parts
+
+
+def cull_hidden(rects: list[dict]) -> tuple[list[dict], list[dict]]:
+    """Drop slots hidden behind higher slots and crop partly hidden ones.
+
+    A slot is covered by every slot drawn after it (higher ``z_index``, or
+    the same ``z_index`` later in the layout).  Slots with no visible pixels
+    are removed; the rest shrink to the bounding box of what remains
+    visible, with a "crop" of the source in fractions of its frame so the
+    hidden part is never scaled.  Returns (visible_rects, culled_rects).
+    """
+    stacked = sorted(rects, key=lambda r: (r["z_index"], r["order"]))
+    visible, culled = [], []
+    for k, rect in enumerate(stacked):
+        region = [(rect["x"], rect["y"], rect["x"] + rect["w"], rect["y"] + rect["h"])]
+        for above in stacked[k + 1:]:
+            cover = (above["x"], above["y"], above["x"] + above["w"], above["y"] + above["h"])
+            region = [part for box in region for part in _subtract(box, cover)]
+            if not region:
+                break
+        if not region:
+            culled.append(rect)
+            continue
+        x0 = min(b[0] for b in region)
+        y0 = min(b[1] for b in region)
+        x1 = max(b[2] for b in region)
+        y1 = max(b[3] for b in region)
+        if (x1 - x0, y1 - y0) != (rect["w"], rect["h"]):
+            rect = {
+                **rect,
+                "x": x0, "y": y0, "w": x1 - x0, "h": y1 - y0,
+                "crop": (
+                    (x1 - x0) / rect["w"], (y1 - y0) / rect["h"],
+                    (x0 - rect["x"]) / rect["w"], (y0 - rect["y"]) / rect["h"],
+                ),
+            }
+        visible.append(rect)
+    visible.sort(key=lambda r: r["order"])
+    return visible, culled
+
+
+def tiles_frame(rects: list[dict], out_w: int, out_h: int) -> bool:
+    """True if the rectangles cover the frame exactly once (no gaps, no overlap)."""
+    if sum(r["w"] * r["h"] for r in rects) != out_w * out_h:
+        return False
+    for i, a in enumerate(rects):
+        for b in rects[i + 1:]:
+            if (a["x"] < b["x"] + b["w"] and b["x"] < a["x"] + a["w"]
+                    and a["y"] < b["y"] + b["h"] and b["y"] < a["y"] + a["h"]):
+                return False
+    return True
 
-        px = int(slot["x"] * out_w)
-        py = int(slot["y"] * out_h)
-        pw = int(slot["width"] * out_w)
-        ph = int(slot["height"] * out_h)
 
-        inputs.extend(["-i", path])
-        filters.append(f"[{idx}:v]scale={pw}:{ph}[s{idx}]")
+def compile_layout(
+    layout: dict,
+    feed_paths: dict[str, str],
+    engine: str = "auto",
+    feed_offsets: Optional[dict[str, float]] = None,
+    start_seconds: float = 0.0,
+    duration_seconds: Optional[float] = None,
+) -> tuple[list[str], str, str, list[dict]]:
+    """Compile a layout into ffmpeg input arguments and a filter graph.
 
-        if idx == 0:
-            overlay_chain = f"color=s={out_w}x{out_h}:c=black[base];[base][s0]overlay={px}:{py}[tmp0]"
+    Hidden slots are culled first (see :func:`cull_hidden`), so they add no
+    input at all, and partly hidden slots are cropped before scaling.
+    Layouts whose remaining slots tile the frame (as generated grids do) become one
+    ``xstack`` that places every scaled input in a single pass.  Anything
+    else falls back to ``overlay`` filters on a black canvas, applied in
+    ascending ``z_index`` (layout order breaks ties), so higher slots are
+    drawn on top.  The graph's output is always labelled ``[out]``.
+
+    ``feed_offsets`` (feed_id -> sync offset, as detected against the
+    reference) line the feeds up on the reference clock, and
+    [start_seconds, start_seconds + duration_seconds) selects a window of it.
+    Each input is cut with input-side seeking, so nothing before the window
+    is decoded; a feed that starts inside the window is padded with black.
+
+    Returns (input_args, filter_complex, engine_used, culled_slots), where
+    culled_slots lists {"slot", "feed_id"} for every slot dropped as hidden.
+    Raises ValueError if there is nothing to compose or ``engine`` is
+    "xstack" for a layout that does not tile the frame.
+    """
+    if engine not in COMPOSE_ENGINES:
+        raise ValueError(f"unknown engine '{engine}'. Choose from: {', '.join(COMPOSE_ENGINES)}")
+    out_w = layout.get("output_width", 1920)
+    out_h = layout.get("output_height", 1080)
+    rects, hidden = cull_hidden(_slot_rects(layout, feed_paths))
+    if not rects:
+        raise ValueError("no valid feeds for layout")
+    culled = [{"slot": r["order"], "feed_id": r["feed_id"]} for r in hidden]
+
+    tiled = tiles_frame(rects, out_w, out_h)
+    if engine == "xstack" and not tiled:
+        raise ValueError("layout does not tile the frame; use the overlay engine")
+    if engine == "auto":
+        engine = "xstack" if tiled else "overlay"
+    if engine == "overlay":
+        rects = sorted(rects, key=lambda r: (r["z_index"], r["order"]))
+
+    feed_offsets = feed_offsets or {}
+    inputs: list[str] = []
+    filters: list[str] = []
+    for idx, rect in enumerate(rects):
+        offset = feed_offsets.get(rect["feed_id"], 0.0)
+        start = start_seconds - offset
+        end = start + duration_seconds if duration_seconds is not None else None
+        args, lead_in = input_args(rect["path"], start if start else None, end)
+        inputs.extend(args)
+        crop, _ = lead_in_filters(lead_in)
+        if "crop" in rect:
+            fw, fh, fx, fy = rect["crop"]
+            crop += f"crop=iw*{fw:.6f}:ih*{fh:.6f}:iw*{fx:.6f}:ih*{fy:.6f},"
+        filters.append(f"[{idx}:v]{crop}scale={rect['w']}:{rect['h']},setsar=1[s{idx}]")
+
+    if engine == "xstack":
+        if len(rects) == 1:
+            filters[0] = filters[0].replace("[s0]", "[out]")
         else:
-            prev = f"tmp{idx - 1}"
-            cur = f"tmp{idx}"
-            overlay_chain += f";[{prev}][s{idx}]overlay={px}:{py}[{cur}]"
+            labels = "".join(f"[s{idx}]" for idx in range(len(rects)))
+            positions = "|".join(f"{r['x']}_{r['y']}" for r in rects)
+            filters.append(f"{labels}xstack=inputs={len(rects)}:layout={positions}:shortest=1[out]")
+        return inputs, ";".join(filters), engine, culled
 
-    if not inputs:
-        return "error: no valid feeds for layout"
+    # The canvas is infinite, so the bottom layer decides when output ends.
+    chain = [f"color=s={out_w}x{out_h}:c=black[base]"]
+    prev = "base"
+    for idx, rect in enumerate(rects):
+        cur = "out" if idx == len(rects) - 1 else f"tmp{idx}"
+        shortest = ":shortest=1" if idx == 0 else ""
+        chain.append(f"[{prev}][s{idx}]overlay={rect['x']}:{rect['y']}{shortest}[{cur}]")
+        prev = cur
+    return inputs, ";".join(filters + chain), engine, culled
+
+
+def compose_layout(
+    layout: dict,
+    feed_paths: dict[str, str],
+    output_path: str,
+    engine: str = "auto",
+    feed_offsets: Optional[dict[str, float]] = None,
+    start_seconds: float = 0.0,
+    duration_seconds: Optional[float] = None,
+) -> dict:
+    """Compose a layout and report what the compiler did.
+
+    See :func:`compile_layout` for the sync-offset and window arguments.
+
+    Returns {"result": output path or error string, "engine": engine used,
+    "culled_slots": [{"slot", "feed_id"}, ...]}.
+    """
+    report: dict = {"result": "", "engine": engine, "culled_slots": []}
+    if not layout.get("slots"):
+        return {**report, "result": "error: no slots defined in layout"}
+    try:
+        inputs, filter_complex, engine, culled = compile_layout(
+            layout, feed_paths, engine, feed_offsets, start_seconds, duration_seconds
+        )
+    except ValueError as exc:
+        return {**report, "result": f"error: {exc}"}
+    report.update(engine=engine, culled_slots=culled)
+    if culled:
+        logger.info("Culled %d hidden slots: %s", len(culled), culled)
 
-    last_label = f"tmp{len(slots) - 1}"
-    filter_complex = ";".join(filters) + ";" + overlay_chain
-    # Map the final overlay output
     cmd = (
         ["ffmpeg", "-y"]
         + inputs
-        + ["-filter_complex", filter_complex, "-map", f"[{last_label}]",
+        + ["-filter_complex", filter_complex, "-map", "[out]",
            "-c:v", "libx264", "-preset", "fast", output_path]
     )
 
-    logger.info("Running compose command: %s", " ".join(cmd))
+    logger.info("Running compose command (%s): %s", engine, " ".join(cmd))
     try:
-        subprocess.run(cmd, capture_output=True, check=True)
+        run_ffmpeg(cmd)
     except FileNotFoundError:
         logger.warning("ffmpeg not found")
-        return "error: ffmpeg not available"
+        return {**report, "result": "error: ffmpeg not available"}
     except subprocess.CalledProcessError as exc:
         msg = exc.stderr.decode(errors="replace")
         logger.error("ffmpeg compose failed: %s", msg)
-        return f"error: ffmpeg failed – {msg[:200]}"
+        return {**report, "result": f"error: ffmpeg failed – {msg[:200]}"}
+
+    return {**report, "result": output_path}
 
-    return output_path
+
+def compose_videos(
+    layout: dict, feed_paths: dict[str, str], output_path: str, engine: str = "auto"
+) -> str:
+    """Compose multiple video feeds into a single output based on a layout.
+
+    Args:
+        layout: Dict with "output_width", "output_height", and "slots" list.
+                Each slot has feed_id, x, y, width, height (fractions 0-1)
+                and an optional z_index.
+        feed_paths: Mapping of feed_id to file path.
+        output_path: Destination file path for the composed video.
+        engine: "auto" (xstack when slots tile the frame, otherwise
+                overlay), "xstack" or "overlay".
+
+    Returns:
+        The output file path on success, or an error string.
+    """
+    return compose_layout(layout, feed_paths, output_path, engine)["result"]
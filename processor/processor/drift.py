@@ -0,0 +1,246 @@
+import logging
+from typing import Optional
+
+import numpy as np
+
+from processor.sync import (
+    _next_fast_len,
+    estimate_offset_multires,
+    load_audio_pcm,
+)
+
+logger = logging.getLogger(__name__)
+
+# Length of each analysis window and the spacing between window starts.
+DRIFT_WINDOW_SECONDS = 8.0
+DRIFT_HOP_SECONDS = 30.0
+# How far (either way) each window searches around the global offset.
+DRIFT_SEARCH_SECONDS = 1.0
+# Windows correlated per batched 2-D FFT.
+DRIFT_BATCH_SIZE = 64
+# Windows below this normalized correlation are ignored by the fit.
+DRIFT_MIN_CONFIDENCE = 0.3
+
+
+def _window_offsets(
+    ref: np.ndarray,
+    tgt: np.ndarray,
+    starts: np.ndarray,
+    window: int,
+    search: int,
+    lag: int,
+    batch_size: int,
+) -> tuple[np.ndarray, np.ndarray]:
+    """Best lag and normalized peak for each target window near ``lag``.
+
+    Windows and the reference slices they may align with are stacked into
+    2-D arrays and correlated as one batched FFT per ``batch_size`` rows.
+    """
+    span = window + 2 * search
+    size = _next_fast_len(span)
+    lags = np.zeros(len(starts), dtype=np.int64)
+    scores = np.zeros(len(starts), dtype=np.float64)
+    for b0 in range(0, len(starts), batch_size):
+        batch = starts[b0:b0 + batch_size]
+        windows = np.zeros((len(batch), window), dtype=np.float32)
+        segments = np.zeros((len(batch), span), dtype=np.float32)
+        for row, t0 in enumerate(batch):
+            windows[row] = tgt[t0:t0 + window]
+            a = t0 + lag - search
+            lo, hi = max(a, 0), min(a + span, len(ref))
+            if hi > lo:
+                segments[row, lo - a:hi - a] = ref[lo:hi]
+        spectra = np.fft.rfft(segments, size, axis=-1) * np.conj(np.fft.rfft(windows, size, axis=-1))
+        corr = np.fft.irfft(spectra, size, axis=-1)[:, :2 * search + 1]
+        peaks = np.argmax(np.abs(corr), axis=-1)
+
+        # Energy of the reference slice under each window at its peak lag.
+        seg_energy = np.concatenate(
+            (np.zeros((len(batch), 1)), np.cumsum(np.square(segments, dtype=np.float64), axis=-1)),
+            axis=-1,
+        )
+        rows = np.arange(len(batch))
+        aligned = seg_energy[rows, peaks + window] - seg_energy[rows, peaks]
+        win_energy = np.einsum("ij,ij->i", windows.astype(np.float64), windows.astype(np.float64))
+        norm = np.sqrt(aligned * win_energy)
+        peak_values = np.abs(corr[rows, peaks]).astype(np.float64)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            batch_scores = np.where(norm > 0, peak_values / norm, 0.0)
+
+        lags[b0:b0 + len(batch)] = lag - search + peaks
+        scores[b0:b0 + len(batch)] = np.minimum(batch_scores, 1.0)
+    return lags, scores
+
+
+def _design(times: np.ndarray, knots: np.ndarray) -> np.ndarray:
+    """Continuous piecewise-linear basis: 1, t and a hinge at each inner knot."""
+    columns = [np.ones_like(times), times]
+    columns.extend(np.maximum(times - k, 0.0) for k in knots[1:-1])
+    return np.stack(columns, axis=1)
+
+
+def fit_time_warp(
+    times: np.ndarray,
+    offsets: np.ndarray,
+    weights: np.ndarray,
+    segments: int = 1,
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Weighted, outlier-robust fit of offset as a function of target time.
+
+    ``segments == 1`` fits a straight line (constant drift); more segments
+    fit a continuous piecewise-linear warp with equally spaced knots.
+    Windows further than 3 robust standard deviations (at least 2 ms) from
+    the fit are rejected and the fit is repeated.
+    Returns (knot_times, knot_offsets, inlier_mask).
+    """
+    knots = np.linspace(times.min(), times.max(), max(1, segments) + 1)
+    inliers = weights > 0
+    coef = None
+    for _ in range(4):
+        if inliers.sum() < 2:
+            break
+        design = _design(times[inliers], knots)
+        sqrt_w = np.sqrt(weights[inliers])
+        coef, *_ = np.linalg.lstsq(design * sqrt_w[:, None], offsets[inliers] * sqrt_w, rcond=None)
+        residual = np.abs(_design(times, knots) @ coef - offsets)
+        mad = np.median(residual[inliers])
+        updated = (weights > 0) & (residual <= max(3 * 1.4826 * mad, 0.002))
+        if np.array_equal(updated, inliers):
+            break
+        inliers = updated
+
+    if coef is None:
+        level = float(np.average(offsets, weights=weights)) if weights.sum() > 0 else 0.0
+        return knots, np.full(len(knots), level), inliers
+    return knots, _design(knots, knots) @ coef, inliers
+
+
+def estimate_drift(
+    ref: np.ndarray,
+    tgt: np.ndarray,
+    sample_rate: int,
+    initial_offset_seconds: Optional[float] = None,
+    window_seconds: float = DRIFT_WINDOW_SECONDS,
+    hop_seconds: float = DRIFT_HOP_SECONDS,
+    search_seconds: float = DRIFT_SEARCH_SECONDS,
+    segments: int = 1,
+    batch_size: int = DRIFT_BATCH_SIZE,
+) -> dict:
+    """Measure clock drift of ``tgt`` against ``ref`` along the whole recording.
+
+    A global offset (found with the coarse-to-fine search unless given) seeds
+    the analysis.  Short windows every ``hop_seconds`` of the target are then
+    correlated against the reference within ``search_seconds`` of it, all in
+    batched FFTs, and a time warp is fitted through the per-window offsets.
+
+    Returns a dict with:
+        offset_seconds: fitted offset at the start of the target.
+        drift_ppm: average drift in parts per million (positive = target
+            clock runs slow, so the offset grows over time).
+        confidence: median confidence of the windows kept by the fit.
+        offset_map: per-window {"time", "offset_seconds", "confidence",
+            "inlier"}, times in target seconds.
+        warp: fitted knots [{"time", "offset_seconds"}] of the piecewise-linear
+            map from target time to offset; reference time = time + offset.
+    """
+    empty = {"offset_seconds": 0.0, "drift_ppm": 0.0, "confidence": 0.0, "offset_map": [], "warp": []}
+    if ref.size == 0 or tgt.size == 0:
+        return empty
+
+    if initial_offset_seconds is None:
+        initial_offset_seconds = estimate_offset_multires(ref, tgt, sample_rate)["offset_seconds"]
+    lag = int(round(initial_offset_seconds * sample_rate))
+
+    window = int(window_seconds * sample_rate)
+    hop = max(1, int(hop_seconds * sample_rate))
+    search = int(search_seconds * sample_rate)
+    # Windows inside the target whose aligned position overlaps the reference.
+    first = max(0, -lag)
+    last = min(len(tgt), len(ref) - lag) - window
+    if window <= 0 or last < first:
+        return empty
+    starts = np.arange(first, last + 1, hop, dtype=np.int64)
+
+    lags, scores = _window_offsets(ref, tgt, starts, window, search, lag, batch_size)
+    times = (starts + window / 2) / sample_rate
+    offsets = lags / sample_rate
+    weights = np.where(scores >= DRIFT_MIN_CONFIDENCE, scores ** 2, 0.0)
+    if not weights.any():
+        logger.warning("No drift window reached confidence %.2f; fitting all windows", DRIFT_MIN_CONFIDENCE)
+        weights = scores ** 2
+
+    if len(times) == 1 or times.max() == times.min():
+        knot_times, knot_offsets, inliers = times[:1], offsets[:1], weights > 0
+        slope = 0.0
+    else:
+        knot_times, knot_offsets, inliers = fit_time_warp(times, offsets, weights, segments)
+        slope = (knot_offsets[-1] - knot_offsets[0]) / (knot_times[-1] - knot_times[0])
+
+    start_offset = float(knot_offsets[0] - slope * knot_times[0])
+    kept = scores[inliers]
+    return {
+        "offset_seconds": round(start_offset, 4),
+        "drift_ppm": round(float(slope) * 1e6, 2),
+        "confidence": round(float(np.median(kept)), 4) if kept.size else 0.0,
+        "offset_map": [
+            {
+                "time": round(float(t), 3),
+                "offset_seconds": round(float(o), 4),
+                "confidence": round(float(c), 4),
+                "inlier": bool(keep),
+            }
+            for t, o, c, keep in zip(times, offsets, scores, inliers)
+        ],
+        "warp": [
+            {"time": round(float(t), 3), "offset_seconds": round(float(o), 5)}
+            for t, o in zip(knot_times, knot_offsets)
+        ],
+    }
+
+
+def detect_drift(
+    reference_path: str,
+    target_path: str,
+    segments: int = 1,
+    hop_seconds: float = DRIFT_HOP_SECONDS,
+) -> dict:
+    """Decode both files (through the PCM cache) and run :func:`estimate_drift`."""
+    sample_rate = 16000
+    ref = load_audio_pcm(reference_path, sample_rate)
+    tgt = load_audio_pcm(target_path, sample_rate)
+    if ref.size == 0 or tgt.size == 0:
+        logger.warning("Could not extract audio; returning empty drift map")
+    return estimate_drift(ref, tgt, sample_rate, segments=segments, hop_seconds=hop_seconds)
+
+
+def _warp_arrays(warp: list[dict]) -> tuple[np.ndarray, np.ndarray]:
+    times = np.array([k["time"] for k in warp], dtype=np.float64)
+    offsets = np.array([k["offset_seconds"] for k in warp], dtype=np.float64)
+    return times, offsets
+
+
+def offset_at(warp: list[dict], source_time: float) -> float:
+    """Offset at a target (source) time, extrapolating the end segments linearly."""
+    times, offsets = _warp_arrays(warp)
+    if len(times) == 1:
+        return float(offsets[0])
+    if source_time <= times[0]:
+        i = 0
+    elif source_time >= times[-1]:
+        i = len(times) - 2
+    else:
+        i = int(np.searchsorted(times, source_time, side="right")) - 1
+    slope = (offsets[i + 1] - offsets[i]) / (times[i + 1] - times[i])
+    return float(offsets[i] + slope * (source_time - times[i]))
+
+
+def reference_to_source(warp: list[dict], reference_time: float) -> float:
+    """Invert the warp: the source time whose audio plays at ``reference_time``.
+
+    Solves ``t + offset_at(t) == reference_time``; the warp is monotonic for
+    any realistic drift, so a few fixed-point iterations converge.
+    """
+    source_time = reference_time - offset_at(warp, reference_time)
+    for _ in range(8):
+        source_time = reference_time - offset_at(warp, source_time)
+    return source_time
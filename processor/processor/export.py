@@ -1,8 +1,25 @@
 import subprocess
 import logging
 
+from processor.pool import run_ffmpeg
+
 logger = logging.getLogger(__name__)
 
+# Mirrors the API's SOCIAL_FORMATS.
+SOCIAL_FORMATS = {
+    "landscape_1080p": {"width": 1920, "height": 1080},
+    "portrait_1080p": {"width": 1080, "height": 1920},
+    "square_1080": {"width": 1080, "height": 1080},
+}
+
+
+def fit_filter(width: int, height: int) -> str:
+    """Scale to fit inside width x height, keeping aspect ratio, and pad with black."""
+    return (
+        f"scale={width}:{height}:force_original_aspect_ratio=decrease,"
+        f"pad={width}:{height}:(ow-iw)/2:(oh-ih)/2:black"
+    )
+
 
 def export_for_social(
     input_path: str,
@@ -16,13 +33,9 @@ def export_for_social(
     aspect ratio, then pads with black to reach the exact target size.
     Returns the output path on success or an error string.
     """
-    scale_filter = (
-        f"scale={width}:{height}:force_original_aspect_ratio=decrease,"
-        f"pad={width}:{height}:(ow-iw)/2:(oh-ih)/2:black"
-    )
     cmd = [
         "ffmpeg", "-y", "-i", input_path,
-        "-vf", scale_filter,
+        "-vf", fit_filter(width, height),
         "-c:v", "libx264", "-preset", "fast", "-crf", "23",
         "-c:a", "aac", "-b:a", "192k",
         "-movflags", "+faststart",
@@ -30,7 +43,7 @@ def export_for_social(
     ]
     logger.info("Running export command: %s", " ".join(cmd))
     try:
-        subprocess.run(cmd, capture_output=True, check=True)
+        run_ffmpeg(cmd)
     except FileNotFoundError:
         logger.warning("ffmpeg not found")
         return "error: ffmpeg not available"
@@ -39,3 +52,51 @@ def export_for_social(
         logger.error("export_for_social failed: %s", msg)
         return f"error: ffmpeg failed – {msg[:200]}"
     return output_path
+
+
+def export_multi(input_path: str, outputs: dict[str, str]) -> dict:
+    """Export one master to several social formats with a single decode.
+
+    ``outputs`` maps SOCIAL_FORMATS keys to output paths.  The master is
+    decoded once; ``split``/``asplit`` fan its streams out to one
+    scale/pad chain and encoder pair per format, and one ffmpeg process
+    writes every output, so all of them come from the same decoded frames.
+
+    Returns {"result": "ok" or an error string, "outputs": {format: path}}.
+    """
+    unknown = [name for name in outputs if name not in SOCIAL_FORMATS]
+    if unknown:
+        return {"result": f"error: unknown formats {', '.join(unknown)}", "outputs": {}}
+    if not outputs:
+        return {"result": "error: no formats requested", "outputs": {}}
+
+    n = len(outputs)
+    filters = [
+        f"[0:v]split={n}" + "".join(f"[v{k}]" for k in range(n)),
+        f"[0:a]asplit={n}" + "".join(f"[a{k}]" for k in range(n)),
+    ]
+    cmd = ["ffmpeg", "-y", "-i", input_path]
+    maps: list[str] = []
+    for k, (name, path) in enumerate(outputs.items()):
+        dims = SOCIAL_FORMATS[name]
+        filters.append(f"[v{k}]{fit_filter(dims['width'], dims['height'])}[out{k}]")
+        maps += [
+            "-map", f"[out{k}]", "-map", f"[a{k}]",
+            "-c:v", "libx264", "-preset", "fast", "-crf", "23",
+            "-c:a", "aac", "-b:a", "192k",
+            "-movflags", "+faststart",
+            path,
+        ]
+    cmd += ["-filter_complex", ";".join(filters)] + maps
+
+    logger.info("Running multi-format export (%s): %s", ", ".join(outputs), " ".join(cmd))
+    try:
+        run_ffmpeg(cmd)
+    except FileNotFoundError:
+        logger.warning("ffmpeg not found")
+        return {"result": "error: ffmpeg not available", "outputs": {}}
+    except subprocess.CalledProcessError as exc:
+        msg = exc.stderr.decode(errors="replace")
+        logger.error("export_multi failed: %s", msg)
+        return {"result": f"error: ffmpeg failed – {msg[:200]}", "outputs": {}}
+    return {"result": "ok", "outputs": dict(outputs)}
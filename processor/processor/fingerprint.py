@@ -0,0 +1,345 @@
+import logging
+import os
+import zipfile
+from typing import Optional
+
+import numpy as np
+
+from processor.sync import load_audio_pcm, refine_offset
+
+logger = logging.getLogger(__name__)
+
+FINGERPRINT_DIR = os.environ.get("FINGERPRINT_DIR", "/data/cache/fingerprints")
+
+SAMPLE_RATE = 16000
+# STFT geometry: 64 ms frames every 16 ms.
+FFT_SIZE = 1024
+HOP = 256
+# Peak picking neighbourhood (frames, bins) and target density.
+PEAK_TIME_RADIUS = 8
+PEAK_FREQ_RADIUS = 12
+PEAKS_PER_SECOND = 30
+# Pairing: each anchor is paired with up to FAN_OUT later peaks in its zone.
+FAN_OUT = 5
+MAX_DT = 63
+MAX_DF = 127
+# Hashes shared by more than this many index entries carry no information.
+MAX_BUCKET = 256
+# Matches needed at one offset before a candidate is worth verifying.
+MIN_MATCHES = 8
+# Frames of spectrogram computed per chunk, to bound memory on long files.
+CHUNK_FRAMES = 4096
+# Built indexes kept per worker process, keyed by the files they were read from.
+INDEX_CACHE_SIZE = 4
+
+# (fingerprint_dir, ((feed_id, mtime_ns, size), ...)) -> index built from exactly those files.
+_index_cache: dict[tuple, "FingerprintIndex"] = {}
+
+
+def _spectrogram_chunk(samples: np.ndarray, first_frame: int, frames: int) -> np.ndarray:
+    """Log-magnitude STFT for ``frames`` frames starting at ``first_frame``."""
+    start = first_frame * HOP
+    chunk = np.asarray(samples[start:start + (frames - 1) * HOP + FFT_SIZE], dtype=np.float32)
+    if len(chunk) < FFT_SIZE:
+        return np.empty((0, FFT_SIZE // 2), dtype=np.float32)
+    windows = np.lib.stride_tricks.sliding_window_view(chunk, FFT_SIZE)[::HOP]
+    spectrum = np.abs(np.fft.rfft(windows * np.hanning(FFT_SIZE).astype(np.float32), axis=-1))
+    return np.log(spectrum[:, :FFT_SIZE // 2] + 1e-6)
+
+
+def _local_maxima(spec: np.ndarray) -> np.ndarray:
+    """Boolean mask of points that are the maximum of their neighbourhood."""
+    peak = spec.copy()
+    for axis, radius in ((1, PEAK_FREQ_RADIUS), (0, PEAK_TIME_RADIUS)):
+        grown = peak.copy()
+        for shift in range(1, radius + 1):
+            lead = [slice(None)] * 2
+            lag = [slice(None)] * 2
+            lead[axis], lag[axis] = slice(shift, None), slice(None, -shift)
+            np.maximum(grown[tuple(lead)], peak[tuple(lag)], out=grown[tuple(lead)])
+            np.maximum(grown[tuple(lag)], peak[tuple(lead)], out=grown[tuple(lag)])
+        peak = grown
+    return (spec == peak) & (spec > np.median(spec) + 1.0)
+
+
+def find_peaks(samples: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Constellation of spectral peaks as (frame, bin) arrays sorted by frame.
+
+    The spectrogram is processed in overlapping chunks so memory does not
+    grow with the recording, and only the strongest PEAKS_PER_SECOND peaks
+    per second of audio are kept.
+    """
+    total = max(0, (len(samples) - FFT_SIZE) // HOP + 1)
+    frames: list[np.ndarray] = []
+    bins: list[np.ndarray] = []
+    for first in range(0, total, CHUNK_FRAMES):
+        # Pad each chunk with neighbouring frames so maxima at its edges are real.
+        lo = max(0, first - PEAK_TIME_RADIUS)
+        hi = min(total, first + CHUNK_FRAMES + PEAK_TIME_RADIUS)
+        spec = _spectrogram_chunk(samples, lo, hi - lo)
+        t, f = np.nonzero(_local_maxima(spec))
+        t += lo
+        keep = (t >= first) & (t < first + CHUNK_FRAMES)
+        t, f = t[keep], f[keep]
+        strength = spec[t - lo, f]
+        budget = int(PEAKS_PER_SECOND * CHUNK_FRAMES * HOP / SAMPLE_RATE)
+        if len(t) > budget:
+            strongest = np.argpartition(strength, -budget)[-budget:]
+            t, f = t[strongest], f[strongest]
+        frames.append(t)
+        bins.append(f)
+    if not frames:
+        return np.zeros(0, np.int32), np.zeros(0, np.int32)
+    t = np.concatenate(frames).astype(np.int32)
+    f = np.concatenate(bins).astype(np.int32)
+    order = np.lexsort((f, t))
+    return t[order], f[order]
+
+
+def peak_hashes(frames: np.ndarray, bins: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Pair each anchor peak with later peaks and pack the pairs into hashes.
+
+    A hash is ``anchor_bin << 16 | (df + MAX_DF) << 6 | dt`` with dt in frames
+    (1..MAX_DT), which is invariant to where the clip starts.
+    Returns (hashes, anchor_frames) as uint32/int32 arrays.
+    """
+    n = len(frames)
+    hashes: list[np.ndarray] = []
+    anchors: list[np.ndarray] = []
+    taken = np.zeros(n, dtype=np.int32)
+    idx = np.arange(n)
+    for k in range(1, 4 * FAN_OUT + 1):
+        i = idx[:n - k]
+        j = i + k
+        dt = frames[j] - frames[i]
+        df = bins[j] - bins[i]
+        valid = (dt >= 1) & (dt <= MAX_DT) & (np.abs(df) <= MAX_DF) & (taken[i] < FAN_OUT)
+        i, dt, df = i[valid], dt[valid], df[valid]
+        taken[i] += 1
+        hashes.append(
+            (bins[i].astype(np.uint32) << 16) | ((df + MAX_DF).astype(np.uint32) << 6) | dt.astype(np.uint32)
+        )
+        anchors.append(frames[i])
+    if not hashes:
+        return np.zeros(0, np.uint32), np.zeros(0, np.int32)
+    return np.concatenate(hashes), np.concatenate(anchors).astype(np.int32)
+
+
+def fingerprint_samples(samples: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Hashes and anchor frames for 16 kHz mono PCM."""
+    return peak_hashes(*find_peaks(samples))
+
+
+def fingerprint_path(feed_id: str, fingerprint_dir: str = FINGERPRINT_DIR) -> str:
+    return os.path.join(fingerprint_dir, f"{feed_id}.npz")
+
+
+def fingerprint_feed(
+    feed_id: str, video_path: str, fingerprint_dir: str = FINGERPRINT_DIR
+) -> dict:
+    """Fingerprint a feed once at ingest and store it under ``fingerprint_dir``.
+
+    Each feed gets its own compact ``<feed_id>.npz`` (uint32 hashes, int32
+    anchor frames), so concurrent ingests never contend for one index file.
+    Returns a summary dict, or one with an "error" key if no audio was found.
+    """
+    samples = load_audio_pcm(video_path, SAMPLE_RATE)
+    if samples.size == 0:
+        return {"feed_id": feed_id, "error": "no audio extracted"}
+    hashes, frames = fingerprint_samples(samples)
+    os.makedirs(fingerprint_dir, exist_ok=True)
+    path = fingerprint_path(feed_id, fingerprint_dir)
+    temp = path + ".tmp.npz"
+    np.savez(temp, hashes=hashes, frames=frames, duration=len(samples) / SAMPLE_RATE)
+    os.replace(temp, path)
+    logger.info("Fingerprinted feed %s: %d hashes", feed_id, len(hashes))
+    return {
+        "feed_id": feed_id,
+        "hashes": int(len(hashes)),
+        "duration_seconds": round(len(samples) / SAMPLE_RATE, 3),
+    }
+
+
+def _file_stamp(feed_id: str, fingerprint_dir: str) -> tuple:
+    """(feed_id, mtime_ns, size) of a stored fingerprint, or (feed_id,) if missing."""
+    try:
+        st = os.stat(fingerprint_path(feed_id, fingerprint_dir))
+    except OSError:
+        return (feed_id,)
+    return (feed_id, st.st_mtime_ns, st.st_size)
+
+
+def _read_fingerprint(feed_id: str, fingerprint_dir: str) -> tuple[Optional[tuple], bool]:
+    """((hashes, frames, duration) or None, whether the file was corrupt and deleted)."""
+    path = fingerprint_path(feed_id, fingerprint_dir)
+    try:
+        with np.load(path) as data:
+            return (data["hashes"], data["frames"], float(data["duration"])), False
+    except FileNotFoundError:
+        logger.warning("No fingerprint stored for feed %s", feed_id)
+        return None, False
+    except (OSError, ValueError, KeyError, EOFError, zipfile.BadZipFile) as exc:
+        logger.warning("Discarding corrupt fingerprint of feed %s: %s", feed_id, exc)
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        return None, True
+
+
+class FingerprintIndex:
+    """Array-backed hash table over the fingerprints of many feeds.
+
+    All (hash, frame, feed) triples live in three parallel arrays sorted by
+    hash, so each lookup is a binary search: matching a clip costs
+    O(q log N) for q query hashes over N indexed hashes, independent of how
+    many feeds are indexed.
+    """
+
+    def __init__(self, feed_ids: list[str], hashes: np.ndarray, frames: np.ndarray,
+                 feeds: np.ndarray, durations: Optional[dict[str, float]] = None):
+        order = np.argsort(hashes, kind="stable")
+        self.feed_ids = feed_ids
+        self.hashes = hashes[order]
+        self.frames = frames[order]
+        self.feeds = feeds[order]
+        self.durations = durations or {}
+
+    @classmethod
+    def from_arrays(cls, fingerprints: dict[str, tuple[np.ndarray, np.ndarray]]) -> "FingerprintIndex":
+        """Build from ``{feed_id: (hashes, frames)}``."""
+        feed_ids = list(fingerprints)
+        parts = [fingerprints[fid] for fid in feed_ids]
+        if not parts:
+            empty = np.zeros(0, np.uint32)
+            return cls([], empty, empty.astype(np.int32), empty.astype(np.int32))
+        return cls(
+            feed_ids,
+            np.concatenate([h for h, _ in parts]).astype(np.uint32),
+            np.concatenate([f for _, f in parts]).astype(np.int32),
+            np.concatenate([np.full(len(h), i, np.int32) for i, (h, _) in enumerate(parts)]),
+        )
+
+    @classmethod
+    def load(cls, fingerprint_dir: str = FINGERPRINT_DIR,
+             feed_ids: Optional[list[str]] = None,
+             feed_paths: Optional[dict[str, str]] = None) -> "FingerprintIndex":
+        """Load the stored fingerprints of ``feed_ids`` (default: every feed).
+
+        The built index is kept in memory and reused while none of its files
+        change, so repeated matches do not re-read and re-sort the index.  A
+        truncated or corrupt file is discarded; the feed is fingerprinted
+        again when its path is in ``feed_paths`` and left out otherwise.
+        """
+        if feed_ids is None:
+            try:
+                names = sorted(os.listdir(fingerprint_dir))
+            except OSError:
+                names = []
+            feed_ids = [n[:-4] for n in names if n.endswith(".npz") and not n.endswith(".tmp.npz")]
+        key = (fingerprint_dir, tuple(_file_stamp(fid, fingerprint_dir) for fid in feed_ids))
+        cached = _index_cache.get(key)
+        if cached is not None:
+            return cached
+
+        fingerprints, durations = {}, {}
+        for fid in feed_ids:
+            stored, corrupt = _read_fingerprint(fid, fingerprint_dir)
+            if corrupt and fid in (feed_paths or {}):
+                if "error" not in fingerprint_feed(fid, feed_paths[fid], fingerprint_dir):
+                    stored, _ = _read_fingerprint(fid, fingerprint_dir)
+            if stored is not None:
+                fingerprints[fid] = stored[:2]
+                durations[fid] = stored[2]
+        index = cls.from_arrays(fingerprints)
+        index.durations = durations
+        # Re-fingerprinting changed files; key the cache by what was read.
+        key = (fingerprint_dir, tuple(_file_stamp(fid, fingerprint_dir) for fid in feed_ids))
+        if len(_index_cache) >= INDEX_CACHE_SIZE:
+            _index_cache.pop(next(iter(_index_cache)))
+        _index_cache[key] = index
+        return index
+
+    def __len__(self) -> int:
+        return len(self.hashes)
+
+    def query(self, hashes: np.ndarray, frames: np.ndarray, top_n: int = 5,
+              min_matches: int = MIN_MATCHES) -> list[dict]:
+        """Rank feeds by how many query hashes agree on one time offset.
+
+        Returns up to ``top_n`` dicts {"feed_id", "offset_seconds", "matches"}
+        sorted by matches, where offset_seconds follows the detect_offset
+        convention (the clip appears that far into the feed).
+        """
+        if len(self.hashes) == 0 or len(hashes) == 0:
+            return []
+        lo = np.searchsorted(self.hashes, hashes, side="left")
+        hi = np.searchsorted(self.hashes, hashes, side="right")
+        counts = hi - lo
+        useful = (counts > 0) & (counts <= MAX_BUCKET)
+        lo, counts, q_frames = lo[useful], counts[useful], frames[useful]
+        if counts.sum() == 0:
+            return []
+        # Expand every (query hash, index entry) match without a Python loop.
+        starts = np.repeat(lo - np.cumsum(counts) + counts, counts)
+        positions = starts + np.arange(counts.sum())
+        offsets = self.frames[positions].astype(np.int64) - np.repeat(q_frames, counts)
+        feeds = self.feeds[positions].astype(np.int64)
+
+        span = int(offsets.max() - offsets.min()) + 1
+        keys = feeds * span + (offsets - offsets.min())
+        unique, votes = np.unique(keys, return_counts=True)
+        best: dict[int, tuple[int, int]] = {}
+        for key, vote in zip(unique[np.argsort(-votes, kind="stable")], np.sort(votes)[::-1]):
+            feed = int(key // span)
+            if feed not in best:
+                best[feed] = (int(vote), int(key % span + offsets.min()))
+            if len(best) == len(self.feed_ids):
+                break
+        ranked = sorted(best.items(), key=lambda item: -item[1][0])
+        return [
+            {
+                "feed_id": self.feed_ids[feed],
+                "offset_seconds": round(offset * HOP / SAMPLE_RATE, 4),
+                "matches": vote,
+            }
+            for feed, (vote, offset) in ranked[:top_n]
+            if vote >= min_matches
+        ]
+
+
+def match_clip(
+    video_path: str,
+    index: FingerprintIndex,
+    feed_paths: Optional[dict[str, str]] = None,
+    exclude_feed_id: Optional[str] = None,
+    top_n: int = 5,
+) -> list[dict]:
+    """Find which indexed feeds a clip overlaps, and where.
+
+    Candidates come from the fingerprint index.  When ``feed_paths`` is
+    given, each candidate is confirmed with a full-rate correlation limited
+    to a few frames around its coarse offset, adding "confidence" and a
+    sample-accurate "offset_seconds".
+    """
+    samples = load_audio_pcm(video_path, SAMPLE_RATE)
+    if samples.size == 0:
+        return []
+    hashes, frames = fingerprint_samples(samples)
+    candidates = [
+        c for c in index.query(hashes, frames, top_n=top_n + 1)
+        if c["feed_id"] != exclude_feed_id
+    ][:top_n]
+    if not feed_paths:
+        return candidates
+
+    for candidate in candidates:
+        path = feed_paths.get(candidate["feed_id"])
+        if not path:
+            continue
+        ref = load_audio_pcm(path, SAMPLE_RATE)
+        refined = refine_offset(
+            ref, samples, SAMPLE_RATE, candidate["offset_seconds"], search_seconds=2 * HOP / SAMPLE_RATE,
+        )
+        candidate.update(refined)
+    return candidates
@@ -0,0 +1,237 @@
+import logging
+import math
+from functools import lru_cache
+from typing import Optional
+
+import numpy as np
+
+from processor.pool import run_parallel
+from processor.sync import load_audio_pcm
+
+logger = logging.getLogger(__name__)
+
+# Same rate the sync code decodes at, so both share the PCM cache.
+ANALYSIS_SAMPLE_RATE = 16000
+# ITU-R BS.1770 timing: 100 ms sub-blocks, 400 ms momentary and 3 s short-term windows.
+SUBBLOCK_SECONDS = 0.1
+MOMENTARY_BLOCKS = 4
+SHORT_TERM_BLOCKS = 30
+ABSOLUTE_GATE_LUFS = -70.0
+RELATIVE_GATE_LU = -10.0
+# EBU Tech 3342 loudness range: relative gate and the percentiles it spans.
+LRA_RELATIVE_GATE_LU = -20.0
+LRA_PERCENTILES = (10.0, 95.0)
+# Curves are floored here, so silence stays a finite, JSON-safe number.
+LOUDNESS_FLOOR = -70.0
+# The K-weighting impulse response is truncated after this long; the
+# 38 Hz high-pass has decayed far below int16 resolution by then.
+IMPULSE_SECONDS = 0.5
+# Samples filtered per FFT block.
+CHUNK_SAMPLES = 1 << 18
+
+
+def k_weighting(sample_rate: int) -> list[tuple[np.ndarray, np.ndarray]]:
+    """The two K-weighting biquads (b, a) of BS.1770 at ``sample_rate``.
+
+    Coefficients come from the analog prototypes (a +4 dB high shelf near
+    1.7 kHz and a 38 Hz high-pass), so any sample rate is supported, not
+    only the 48 kHz the standard tabulates.
+    """
+    f0, gain_db, q = 1681.974450955533, 3.999843853973347, 0.7071752369554196
+    k = math.tan(math.pi * f0 / sample_rate)
+    vh = 10 ** (gain_db / 20)
+    vb = vh ** 0.4996667741545416
+    a0 = 1 + k / q + k * k
+    shelf = (
+        np.array([(vh + vb * k / q + k * k) / a0, 2 * (k * k - vh) / a0, (vh - vb * k / q + k * k) / a0]),
+        np.array([1.0, 2 * (k * k - 1) / a0, (1 - k / q + k * k) / a0]),
+    )
+    f0, q = 38.13547087602444, 0.5003270373238773
+    k = math.tan(math.pi * f0 / sample_rate)
+    a0 = 1 + k / q + k * k
+    highpass = (
+        np.array([1.0, -2.0, 1.0]),
+        np.array([1.0, 2 * (k * k - 1) / a0, (1 - k / q + k * k) / a0]),
+    )
+    return [shelf, highpass]
+
+
+@lru_cache(maxsize=8)
+def _impulse_response(sample_rate: int) -> np.ndarray:
+    """The K-weighting filter's impulse response, truncated to IMPULSE_SECONDS."""
+    n = max(int(IMPULSE_SECONDS * sample_rate), 16)
+    x = np.zeros(n)
+    x[0] = 1.0
+    for b, a in k_weighting(sample_rate):
+        y = np.empty(n)
+        x1 = x2 = y1 = y2 = 0.0
+        for i in range(n):
+            y[i] = b[0] * x[i] + b[1] * x1 + b[2] * x2 - a[1] * y1 - a[2] * y2
+            x2, x1, y2, y1 = x1, x[i], y1, y[i]
+        x = y
+    return x
+
+
+def subblock_energy(samples: np.ndarray, sample_rate: int) -> np.ndarray:
+    """Mean square of the K-weighted signal in each complete 100 ms sub-block.
+
+    The biquads are applied as their (truncated) impulse response with
+    FFT overlap-add, one CHUNK_SAMPLES block at a time, so the whole
+    computation is vectorized and a memory-mapped input is read once in
+    order without being loaded.  int16 input is scaled to [-1, 1).
+    """
+    block = int(round(SUBBLOCK_SECONDS * sample_rate))
+    n_blocks = len(samples) // block
+    if n_blocks == 0:
+        return np.zeros(0)
+    scale = 1.0 / 32768.0 if samples.dtype == np.int16 else 1.0
+    h = _impulse_response(sample_rate)
+    chunk = max(CHUNK_SAMPLES // block, 1) * block
+    nfft = 1 << (chunk + len(h) - 1 - 1).bit_length()
+    spectrum = np.fft.rfft(h, nfft)
+    tail = np.zeros(len(h) - 1)
+    energy = np.empty(n_blocks)
+    total = n_blocks * block
+    for start in range(0, total, chunk):
+        x = np.asarray(samples[start:min(start + chunk, total)], dtype=np.float64) * scale
+        y = np.fft.irfft(np.fft.rfft(x, nfft) * spectrum, nfft)[:len(x) + len(h) - 1]
+        y[:len(tail)] += tail
+        tail = y[len(x):].copy()
+        filtered = y[:len(x)]
+        k = start // block
+        energy[k:k + len(x) // block] = np.square(filtered).reshape(-1, block).mean(axis=1)
+    return energy
+
+
+def sample_peak(samples: np.ndarray) -> tuple[float, int]:
+    """Sample peak (1.0 = full scale) and count of full-scale samples.
+
+    Read one CHUNK_SAMPLES block at a time, like :func:`subblock_energy`,
+    so a memory-mapped input is never copied whole.  int16 blocks are
+    widened first: np.abs(-32768) wraps back to -32768.
+    """
+    int16 = samples.dtype == np.int16
+    full_scale = 32767 if int16 else 32767 / 32768
+    peak = 0.0
+    clipped = 0
+    for start in range(0, len(samples), CHUNK_SAMPLES):
+        block = samples[start:start + CHUNK_SAMPLES]
+        magnitude = np.abs(block.astype(np.int32) if int16 else block)
+        peak = max(peak, float(magnitude.max()))
+        clipped += int(np.count_nonzero(magnitude >= full_scale))
+    return (peak / 32768.0 if int16 else peak), clipped
+
+
+def _lufs(power: np.ndarray) -> np.ndarray:
+    with np.errstate(divide="ignore"):
+        return -0.691 + 10.0 * np.log10(power)
+
+
+def _windows(energy: np.ndarray, size: int) -> np.ndarray:
+    """Mean power of every ``size`` consecutive sub-blocks (100 ms hop)."""
+    if len(energy) < size:
+        return np.zeros(0)
+    csum = np.concatenate(([0.0], np.cumsum(energy)))
+    return (csum[size:] - csum[:-size]) / size
+
+
+def integrated_loudness(momentary_power: np.ndarray) -> Optional[float]:
+    """Gated integrated loudness (BS.1770-4) of 400 ms block powers, None if silent."""
+    loud = momentary_power[_lufs(momentary_power) > ABSOLUTE_GATE_LUFS]
+    if loud.size == 0:
+        return None
+    threshold = _lufs(np.array([loud.mean()]))[0] + RELATIVE_GATE_LU
+    gated = loud[_lufs(loud) > threshold]
+    return float(_lufs(np.array([gated.mean()]))[0])
+
+
+def loudness_range(short_term_power: np.ndarray) -> Optional[float]:
+    """EBU Tech 3342 loudness range of 3 s window powers in LU, None if silent."""
+    levels = _lufs(short_term_power)
+    levels = levels[levels > ABSOLUTE_GATE_LUFS]
+    if levels.size == 0:
+        return None
+    threshold = _lufs(np.array([np.mean(10 ** ((levels + 0.691) / 10))]))[0] + LRA_RELATIVE_GATE_LU
+    levels = levels[levels > threshold]
+    low, high = np.percentile(levels, LRA_PERCENTILES)
+    return float(high - low)
+
+
+def _curve(power: np.ndarray, step: int) -> list[float]:
+    levels = np.maximum(_lufs(power[::step]), LOUDNESS_FLOOR)
+    return [round(float(v), 2) for v in levels]
+
+
+def analyze_samples(
+    samples: np.ndarray,
+    sample_rate: int = ANALYSIS_SAMPLE_RATE,
+    curve_hop_seconds: float = 1.0,
+    target_lufs: Optional[float] = None,
+) -> dict:
+    """EBU R128 loudness, loudness range and sample peak of mono PCM.
+
+    Returns {"duration_seconds", "integrated_lufs", "loudness_range_lu",
+    "max_momentary_lufs", "max_short_term_lufs", "sample_peak_dbfs",
+    "clipped_samples", "curve_hop_seconds", "momentary", "short_term"},
+    where the curves are momentary (400 ms) and short-term (3 s) loudness
+    every ``curve_hop_seconds``, floored at LOUDNESS_FLOOR.  Loudness
+    values are None for silence.  With ``target_lufs`` a "gain_db" that
+    brings the integrated loudness to the target is added.
+
+    The input is the mono downmix :func:`processor.sync.extract_audio_pcm`
+    produces, so for correlated stereo the level reads up to 3 dB below a
+    stereo meter; comparisons between feeds are unaffected.
+    """
+    energy = subblock_energy(samples, sample_rate)
+    momentary = _windows(energy, MOMENTARY_BLOCKS)
+    short_term = _windows(energy, SHORT_TERM_BLOCKS)
+    step = max(int(round(curve_hop_seconds / SUBBLOCK_SECONDS)), 1)
+
+    peak, clipped = sample_peak(samples)
+    integrated = integrated_loudness(momentary)
+    result = {
+        "duration_seconds": len(samples) / sample_rate,
+        "integrated_lufs": integrated,
+        "loudness_range_lu": loudness_range(short_term),
+        "max_momentary_lufs": float(_lufs(momentary).max()) if momentary.size and momentary.max() > 0 else None,
+        "max_short_term_lufs": float(_lufs(short_term).max()) if short_term.size and short_term.max() > 0 else None,
+        "sample_peak_dbfs": 20 * math.log10(peak) if peak > 0 else None,
+        "clipped_samples": clipped,
+        "curve_hop_seconds": step * SUBBLOCK_SECONDS,
+        "momentary": _curve(momentary, step),
+        "short_term": _curve(short_term, step),
+    }
+    if target_lufs is not None:
+        result["gain_db"] = target_lufs - integrated if integrated is not None else None
+    return result
+
+
+def analyze_file(
+    path: str,
+    sample_rate: int = ANALYSIS_SAMPLE_RATE,
+    curve_hop_seconds: float = 1.0,
+    target_lufs: Optional[float] = None,
+) -> dict:
+    """Analyze a file's audio (through the PCM cache); {"error": ...} if it has none."""
+    samples = load_audio_pcm(path, sample_rate, np.int16)
+    if samples.size == 0:
+        logger.warning("No audio decoded from %s", path)
+        return {"error": "no audio decoded"}
+    return analyze_samples(samples, sample_rate, curve_hop_seconds, target_lufs)
+
+
+def analyze_many(
+    feed_paths: dict[str, str],
+    sample_rate: int = ANALYSIS_SAMPLE_RATE,
+    curve_hop_seconds: float = 1.0,
+    target_lufs: Optional[float] = None,
+) -> dict[str, dict]:
+    """Analyze every feed in one call, decoding on the shared ffmpeg pool.
+
+    Returns {feed_id: analysis} in the order given.
+    """
+    results = run_parallel(
+        lambda path: analyze_file(path, sample_rate, curve_hop_seconds, target_lufs),
+        list(feed_paths.values()),
+    )
+    return dict(zip(feed_paths, results))
@@ -0,0 +1,75 @@
+import logging
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+SEEK_MODES = ("input", "filter")
+
+
+def _fmt(seconds: float) -> str:
+    return f"{seconds:.6f}".rstrip("0").rstrip(".") or "0"
+
+
+def input_args(
+    path: str,
+    start: Optional[float] = None,
+    end: Optional[float] = None,
+) -> tuple[list[str], float]:
+    """ffmpeg arguments that open ``path`` already cut to [start, end).
+
+    ``-ss``/``-t`` go before ``-i`` so the demuxer jumps to the keyframe
+    before ``start`` instead of decoding everything up to it; ffmpeg's
+    accurate seeking (on by default when transcoding) then drops the frames
+    between that keyframe and ``start``, so the cut stays frame-accurate.
+    The opened stream starts at timestamp 0.
+
+    A negative ``start`` (a feed that begins after the requested window,
+    e.g. because of its sync offset) is clamped to 0 and returned as a
+    lead-in, to be filled with :func:`lead_in_filters`.
+    Returns (args, lead_in_seconds).
+    """
+    args: list[str] = []
+    lead_in = 0.0
+    if start is not None and start < 0:
+        lead_in = -start
+        start = 0.0
+    if start:
+        args += ["-ss", _fmt(start)]
+    if end is not None:
+        duration = end - (start or 0.0)
+        if duration <= 0:
+            logger.warning("Empty window [%s, %s) for %s", start, end, path)
+            duration = 0.0
+        args += ["-t", _fmt(duration)]
+    return args + ["-i", path], lead_in
+
+
+def lead_in_filters(lead_in: float) -> tuple[str, str]:
+    """Video and audio filter fragments that delay a stream by ``lead_in`` seconds.
+
+    Each fragment ends with a comma so it can be prefixed to a chain, and is
+    empty when there is nothing to delay.
+    """
+    if lead_in <= 0:
+        return "", ""
+    ms = int(round(lead_in * 1000))
+    return (
+        f"tpad=start_duration={_fmt(lead_in)}:color=black,",
+        f"adelay={ms}:all=1,",
+    )
+
+
+def trim_filters(start: Optional[float], end: Optional[float]) -> tuple[str, str]:
+    """Filter-side ``trim``/``atrim`` fragments, for inputs that cannot be seeked.
+
+    Every frame before ``start`` is still decoded, so prefer :func:`input_args`.
+    """
+    opts = []
+    if start is not None:
+        opts.append(f"start={_fmt(start)}")
+    if end is not None:
+        opts.append(f"end={_fmt(end)}")
+    if not opts:
+        return "", ""
+    joined = ":".join(opts)
+    return f"trim={joined},", f"atrim={joined},"
@@ -0,0 +1,236 @@
+import collections
+import contextlib
+import logging
+import math
+import os
+import subprocess
+import threading
+import wave
+from typing import Optional
+
+import numpy as np
+
+from processor.pool import check_cancelled, track_process
+
+logger = logging.getLogger(__name__)
+
+MIX_SAMPLE_RATE = 48000
+MIX_CHANNELS = 2
+# Frames mixed per step; memory is a few blocks per feed, whatever the length.
+MIX_BLOCK_FRAMES = MIX_SAMPLE_RATE
+# Peak ceiling of the master, in dBFS.
+LIMITER_CEILING_DB = -1.0
+# The limiter computes one gain per window and recovers at most this fast.
+LIMITER_WINDOW_FRAMES = 480
+LIMITER_RELEASE_DB_PER_SECOND = 20.0
+
+
+class _FeedReader:
+    """One feed's audio as float32 frames from an ffmpeg pipe, placed on the mix timeline.
+
+    A positive ``offset_seconds`` delays the feed by that much silence; a
+    negative one seeks into the feed so its first frame lands at zero.
+    """
+
+    def __init__(self, path: str, offset_seconds: float, volume: float, sample_rate: int, channels: int):
+        self.path = path
+        self.volume = np.float32(volume)
+        self.channels = channels
+        self.lead_frames = max(int(round(offset_seconds * sample_rate)), 0)
+        seek = ["-ss", f"{-offset_seconds:.6f}"] if offset_seconds < 0 else []
+        cmd = [
+            "ffmpeg", "-nostdin", "-v", "error", *seek, "-i", path,
+            "-vn", "-ac", str(channels), "-ar", str(sample_rate),
+            "-f", "f32le", "-acodec", "pcm_f32le", "pipe:1",
+        ]
+        self.proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        # Drain stderr concurrently so a chatty ffmpeg can never block on it.
+        self.stderr_tail: collections.deque = collections.deque(maxlen=64)
+        self.drain = threading.Thread(target=lambda: self.stderr_tail.extend(self.proc.stderr), daemon=True)
+        self.drain.start()
+        self.done = False
+
+    def add_into(self, mix: np.ndarray) -> int:
+        """Add this feed's next ``len(mix)`` frames, scaled by its volume; returns frames added."""
+        frames = len(mix)
+        lead = min(self.lead_frames, frames)
+        self.lead_frames -= lead
+        if self.done or lead == frames:
+            return 0 if self.done else frames
+        want = (frames - lead) * self.channels * 4
+        data = self.proc.stdout.read(want)
+        got = len(data) // (self.channels * 4)
+        if got:
+            block = np.frombuffer(data, dtype="<f4", count=got * self.channels).reshape(got, self.channels)
+            mix[lead:lead + got] += block * self.volume
+        if len(data) < want:
+            self.done = True
+        return lead + got
+
+    def close(self, kill: bool = False) -> Optional[str]:
+        """Reap ffmpeg; returns its error output if it failed."""
+        if kill:
+            self.proc.kill()
+        self.proc.stdout.close()
+        returncode = self.proc.wait()
+        self.drain.join()
+        self.proc.stderr.close()
+        if returncode != 0 and not kill:
+            return b"".join(self.stderr_tail).decode(errors="replace")
+        return None
+
+
+def limiter_gains(peaks: np.ndarray, prev_gain: float, ceiling: float, release: float) -> np.ndarray:
+    """Gain per limiter window: at once down to ``ceiling / peak``, back up by ``release`` per window.
+
+    The recursion ``g[w] = min(target[w], g[w - 1] * release)`` is the
+    running minimum of ``target[k] * release ** (w - k)``, so in the log
+    domain it is one ``minimum.accumulate`` with no Python loop.
+    """
+    with np.errstate(divide="ignore"):
+        target = np.minimum(1.0, ceiling / peaks)
+    steps = np.arange(len(peaks) + 1) * np.log(release)
+    log_terms = np.log(np.concatenate(([prev_gain], target))) - steps
+    return np.exp(np.minimum.accumulate(log_terms) + steps)[1:]
+
+
+class _Limiter:
+    """Brickwall peak limiter applied block by block, carrying its gain across blocks."""
+
+    def __init__(self, sample_rate: int, ceiling_db: float = LIMITER_CEILING_DB,
+                 window: int = LIMITER_WINDOW_FRAMES):
+        self.ceiling = 10 ** (ceiling_db / 20)
+        self.window = window
+        self.release = 10 ** (LIMITER_RELEASE_DB_PER_SECOND * window / sample_rate / 20)
+        self.gain = 1.0
+        self.min_gain = 1.0
+
+    def process(self, mix: np.ndarray) -> np.ndarray:
+        frames = len(mix)
+        n = -(-frames // self.window)
+        padded = np.zeros((n * self.window, mix.shape[1]), dtype=np.float32)
+        padded[:frames] = mix
+        peaks = np.abs(padded).reshape(n, -1).max(axis=1)
+        gains = limiter_gains(peaks, self.gain, self.ceiling, self.release)
+        # Ramp between window gains, never above a window's own gain, so
+        # loud windows stay under the ceiling and recovery is smooth.
+        edges = np.concatenate(([self.gain], gains))
+        ramp = np.minimum(
+            np.repeat(gains, self.window),
+            np.interp(np.arange(n * self.window), np.arange(n + 1) * self.window, edges),
+        ).astype(np.float32)
+        self.gain = float(gains[-1])
+        self.min_gain = min(self.min_gain, float(gains.min()))
+        return np.clip(mix * ramp[:frames, None], -self.ceiling, self.ceiling)
+
+
+def mixdown(
+    feeds: list[dict],
+    output_path: str,
+    sample_rate: int = MIX_SAMPLE_RATE,
+    channels: int = MIX_CHANNELS,
+    block_frames: int = MIX_BLOCK_FRAMES,
+) -> dict:
+    """Mix many feeds' audio into one 16-bit WAV in a single streaming pass.
+
+    ``feeds`` are {"path", "offset_seconds", "volume"} dicts; offsets place
+    each feed on the mix timeline the way sync offsets do elsewhere (the
+    feed's time is mix time minus its offset).  Every feed is decoded by its
+    own ffmpeg pipe and read ``block_frames`` at a time; blocks are scaled,
+    summed in float32, limited to LIMITER_CEILING_DB and appended to the
+    WAV, so memory stays a few blocks per feed however long the feeds are.
+    The mix ends with the last feed.  It is written to ``<output>.part``
+    and renamed on success.
+
+    Returns {"result": output path or error string, "duration_seconds",
+    "peak_dbfs", "max_gain_reduction_db"}.
+    """
+    report = {"result": "", "duration_seconds": 0.0, "peak_dbfs": None, "max_gain_reduction_db": 0.0}
+    if not feeds:
+        return {**report, "result": "error: no feeds to mix"}
+    part = output_path + ".part"
+    limiter = _Limiter(sample_rate)
+    readers: list[_FeedReader] = []
+    written = 0
+    peak = 0.0
+    error = None
+    check_cancelled()
+    try:
+        with contextlib.ExitStack() as stack:
+            for feed in feeds:
+                reader = _FeedReader(
+                    feed["path"], feed.get("offset_seconds", 0.0), feed.get("volume", 1.0), sample_rate, channels
+                )
+                readers.append(reader)
+                stack.enter_context(track_process(reader.proc))
+            with wave.open(part, "wb") as out:
+                out.setnchannels(channels)
+                out.setsampwidth(2)
+                out.setframerate(sample_rate)
+                mix = np.empty((block_frames, channels), dtype=np.float32)
+                while True:
+                    check_cancelled()
+                    mix.fill(0.0)
+                    frames = max(reader.add_into(mix) for reader in readers)
+                    if frames == 0:
+                        break
+                    limited = limiter.process(mix[:frames])
+                    peak = max(peak, float(np.abs(limited).max()))
+                    out.writeframes((limited * 32767.0).round().astype("<i2").tobytes())
+                    written += frames
+            errors = [(reader.path, reader.close()) for reader in readers]
+            readers = []
+            error = next(((path, msg) for path, msg in errors if msg is not None), None)
+    except FileNotFoundError:
+        logger.warning("ffmpeg not found")
+        return {**report, "result": "error: ffmpeg not available"}
+    except OSError as exc:
+        logger.error("mixdown failed: %s", exc)
+        return {**report, "result": f"error: {exc}"}
+    finally:
+        for reader in readers:
+            reader.close(kill=True)
+        if error is not None or readers:
+            with contextlib.suppress(OSError):
+                os.remove(part)
+    if error is not None:
+        logger.error("mixdown of %s failed: %s", error[0], error[1])
+        return {**report, "result": f"error: ffmpeg failed on {error[0]} – {error[1][:200]}"}
+    os.replace(part, output_path)
+    return {
+        "result": output_path,
+        "duration_seconds": written / sample_rate,
+        "peak_dbfs": 20 * math.log10(peak) if peak > 0 else None,
+        "max_gain_reduction_db": -20 * math.log10(limiter.min_gain),
+    }
+
+
+def master_mix(
+    feeds: list[dict],
+    output_path: str,
+    normalize: bool = True,
+    noise_reduce: bool = False,
+) -> dict:
+    """Mix feeds with :func:`mixdown`, then apply audio optimizations to the master.
+
+    With neither optimization the mix is written straight to ``output_path``;
+    otherwise it goes to a scratch area and
+    :func:`processor.optimize.optimize_audio` writes the final WAV in one
+    more pass.  Returns the mixdown report plus the settings applied.
+    """
+    from processor.optimize import optimize_audio
+    from processor.scratch import scratch_area
+
+    settings = {"normalize": normalize, "noise_reduce": noise_reduce, "feeds": len(feeds)}
+    if not (normalize or noise_reduce):
+        return {**settings, **mixdown(feeds, output_path)}
+    try:
+        with scratch_area("mix-") as scratch:
+            report = mixdown(feeds, os.path.join(scratch, "mix.wav"))
+            if report["result"].startswith("error"):
+                return {**settings, **report}
+            optimized = optimize_audio(report["result"], output_path, normalize, noise_reduce)
+    except OSError as exc:
+        logger.error("mix scratch area unavailable: %s", exc)
+        return {**settings, "result": f"error: {exc}"}
+    return {**settings, **report, "result": optimized["result"]}
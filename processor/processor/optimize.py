@@ -1,51 +1,146 @@
+import json
 import subprocess
 import logging
+from typing import Optional
+
+from processor.pool import run_ffmpeg, run_parallel
 
 logger = logging.getLogger(__name__)
 
+LOUDNORM_FILTER = "loudnorm=I=-16:TP=-1.5:LRA=11"
+DENOISE_FILTER = "afftdn=nf=-25"
 
-def normalize_audio(input_path: str, output_path: str) -> str:
-    """Normalize audio levels using the ffmpeg loudnorm filter.
 
-    Returns the output path on success or an error string.
+def loudnorm_filter(measured: Optional[dict] = None) -> str:
+    """The loudnorm filter; linear (second-pass) mode when measurements are given.
+
+    ``measured`` is the result of :func:`measure_loudness`.  Without it (or
+    if it is incomplete) the filter falls back to single-pass dynamic mode.
+    """
+    keys = ("input_i", "input_tp", "input_lra", "input_thresh", "target_offset")
+    if not measured or any(key not in measured for key in keys):
+        return LOUDNORM_FILTER
+    return (
+        f"{LOUDNORM_FILTER}:measured_I={measured['input_i']:.2f}:measured_TP={measured['input_tp']:.2f}"
+        f":measured_LRA={measured['input_lra']:.2f}:measured_thresh={measured['input_thresh']:.2f}"
+        f":offset={measured['target_offset']:.2f}:linear=true"
+    )
+
+
+def audio_filter_chain(
+    normalize: bool = True, noise_reduce: bool = False, measured: Optional[dict] = None
+) -> str:
+    """The ``-af`` chain of an audio optimization ("" when nothing is applied).
+
+    ``measured`` makes normalization linear; see :func:`loudnorm_filter`.
     """
+    filters = []
+    if normalize:
+        filters.append(loudnorm_filter(measured))
+    if noise_reduce:
+        filters.append(DENOISE_FILTER)
+    return ",".join(filters)
+
+
+def _filter_audio(input_path: str, output_path: str, chain: str, name: str) -> str:
+    """Run an audio filter chain, copying any video stream through untouched."""
     cmd = [
         "ffmpeg", "-y", "-i", input_path,
-        "-af", "loudnorm=I=-16:TP=-1.5:LRA=11",
+        "-af", chain,
+        "-c:v", "copy",
         output_path,
     ]
     try:
-        subprocess.run(cmd, capture_output=True, check=True)
+        run_ffmpeg(cmd)
     except FileNotFoundError:
         logger.warning("ffmpeg not found")
         return "error: ffmpeg not available"
     except subprocess.CalledProcessError as exc:
         msg = exc.stderr.decode(errors="replace")
-        logger.error("normalize_audio failed: %s", msg)
+        logger.error("%s failed: %s", name, msg)
         return f"error: {msg[:200]}"
     return output_path
 
 
+def normalize_audio(input_path: str, output_path: str) -> str:
+    """Normalize audio levels with two-pass (linear) loudnorm.
+
+    The analysis pass comes from :func:`measure_loudness_cached`, so a file
+    measured before (e.g. at upload) goes straight to the second pass.  If
+    it cannot be measured, single-pass dynamic loudnorm is used instead.
+    Returns the output path on success or an error string.
+    """
+    chain = loudnorm_filter(measure_loudness_cached(input_path))
+    return _filter_audio(input_path, output_path, chain, "normalize_audio")
+
+
 def reduce_noise(input_path: str, output_path: str) -> str:
     """Basic noise reduction using the ffmpeg afftdn filter.
 
     Returns the output path on success or an error string.
     """
+    return _filter_audio(input_path, output_path, DENOISE_FILTER, "reduce_noise")
+
+
+def measure_loudness(input_path: str) -> dict:
+    """Measure integrated loudness, true peak and loudness range of a file.
+
+    Runs the analysis pass of the ffmpeg loudnorm filter and returns its
+    measurements as floats (input_i, input_tp, input_lra, input_thresh,
+    target_offset), or {"error": ...} on failure.
+    """
     cmd = [
-        "ffmpeg", "-y", "-i", input_path,
-        "-af", "afftdn=nf=-25",
-        output_path,
+        "ffmpeg", "-nostdin", "-hide_banner", "-i", input_path,
+        "-vn", "-af", f"{LOUDNORM_FILTER}:print_format=json",
+        "-f", "null", "-",
     ]
     try:
-        subprocess.run(cmd, capture_output=True, check=True)
+        proc = run_ffmpeg(cmd)
     except FileNotFoundError:
         logger.warning("ffmpeg not found")
-        return "error: ffmpeg not available"
+        return {"error": "ffmpeg not available"}
     except subprocess.CalledProcessError as exc:
         msg = exc.stderr.decode(errors="replace")
-        logger.error("reduce_noise failed: %s", msg)
-        return f"error: {msg[:200]}"
-    return output_path
+        logger.error("measure_loudness failed: %s", msg)
+        return {"error": msg[:200]}
+
+    # loudnorm prints its JSON block last on stderr.
+    text = proc.stderr.decode(errors="replace")
+    start, end = text.rfind("{"), text.rfind("}")
+    try:
+        stats = json.loads(text[start:end + 1])
+    except ValueError:
+        return {"error": "could not parse loudnorm output"}
+    keys = ("input_i", "input_tp", "input_lra", "input_thresh", "target_offset")
+    return {key: float(stats[key]) for key in keys if key in stats}
+
+
+def measure_loudness_cached(input_path: str) -> dict:
+    """Like :func:`measure_loudness`, but served from the loudness cache when enabled.
+
+    Measurements are keyed by file identity and loudness target; failed
+    measurements are not cached.
+    """
+    from processor.cache import get_loudness_cache
+
+    cache = get_loudness_cache()
+    key = cache.key_for(input_path, LOUDNORM_FILTER) if cache else None
+    if key:
+        cached = cache.load(key)
+        if cached is not None:
+            return cached
+    measurements = measure_loudness(input_path)
+    if key and "error" not in measurements:
+        cache.store(key, measurements)
+    return measurements
+
+
+def measure_loudness_many(input_paths: list[str]) -> list[dict]:
+    """Measure every file at once on the shared ffmpeg pool, results in order.
+
+    Files measured before are answered from the loudness cache.
+    """
+    return run_parallel(measure_loudness_cached, input_paths)
 
 
 def optimize_audio(
@@ -54,31 +149,19 @@ def optimize_audio(
     normalize: bool = True,
     noise_reduce: bool = False,
 ) -> dict:
-    """Apply selected audio optimizations.
+    """Apply selected audio optimizations in one ffmpeg pass.
 
+    Both filters run in a single chain and any video stream is copied, so
+    nothing is re-encoded but the audio and no intermediate file is left.
+    Normalization is two-pass, using cached measurements when available.
     Returns a dict with the settings applied and the result path or error.
     """
     settings: dict = {
         "normalize": normalize,
         "noise_reduce": noise_reduce,
     }
-
-    current = input_path
-
-    if normalize:
-        norm_out = output_path if not noise_reduce else output_path + ".norm.tmp"
-        result = normalize_audio(current, norm_out)
-        if result.startswith("error"):
-            return {**settings, "result": result}
-        current = result
-
-    if noise_reduce:
-        result = reduce_noise(current, output_path)
-        if result.startswith("error"):
-            return {**settings, "result": result}
-        current = result
-
-    if not normalize and not noise_reduce:
-        current = input_path
-
-    return {**settings, "result": current}
+    measured = measure_loudness_cached(input_path) if normalize else None
+    chain = audio_filter_chain(normalize, noise_reduce, measured)
+    if not chain:
+        return {**settings, "result": input_path}
+    return {**settings, "result": _filter_audio(input_path, output_path, chain, "optimize_audio")}
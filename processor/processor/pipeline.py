@@ -0,0 +1,231 @@
+import logging
+import os
+import subprocess
+from typing import Optional
+
+from processor.pool import run_ffmpeg
+
+logger = logging.getLogger(__name__)
+
+PIPELINE_STAGES = ("render", "compose", "optimize", "export")
+# Stages that build a program from feeds rather than from the previous stage.
+SOURCE_STAGES = ("render", "compose")
+
+VIDEO_ENCODE = ["-c:v", "libx264", "-preset", "fast", "-crf", "23"]
+AUDIO_ENCODE = ["-c:a", "aac", "-b:a", "192k"]
+
+
+def _open_file(path: str) -> dict:
+    """A program that reads ``path`` with both streams still untouched."""
+    return {"inputs": ["-i", path], "filters": [], "video": "0:v", "audio": "0:a", "stages": []}
+
+
+def _label(stream: str) -> str:
+    """A stream as a filter-graph input pad: raw input streams need brackets."""
+    return stream if stream.startswith("[") else f"[{stream}]"
+
+
+def _maps(program: dict) -> list[str]:
+    """Map and codec arguments for one output of ``program``.
+
+    Streams no filter touched are copied, so an audio-only stage on a file
+    passes its video through without a re-encode.
+    """
+    args: list[str] = []
+    if program["video"].startswith("["):
+        args += ["-map", program["video"], *VIDEO_ENCODE]
+    else:
+        args += ["-map", f"{program['video']}?", "-c:v", "copy"]
+    if program["audio"] is None:
+        pass
+    elif program["audio"].startswith("["):
+        args += ["-map", program["audio"], *AUDIO_ENCODE]
+    else:
+        args += ["-map", f"{program['audio']}?", "-c:a", "copy"]
+    return args
+
+
+def _command(program: dict, outputs: list[list[str]]) -> list[str]:
+    cmd = ["ffmpeg", "-y"] + program["inputs"]
+    if program["filters"]:
+        cmd += ["-filter_complex", ";".join(program["filters"])]
+    for output in outputs:
+        cmd += output
+    return cmd
+
+
+def _validate(stages: list[dict], input_path: Optional[str], output_path: Optional[str],
+              outputs: Optional[dict]) -> None:
+    if not stages:
+        raise ValueError("no stages given")
+    names = [stage.get("stage") for stage in stages]
+    unknown = [name for name in names if name not in PIPELINE_STAGES]
+    if unknown:
+        raise ValueError(f"unknown stage '{unknown[0]}'. Choose from: {', '.join(PIPELINE_STAGES)}")
+    if any(name in SOURCE_STAGES for name in names[1:]):
+        raise ValueError("render and compose can only be the first stage")
+    if (names[0] in SOURCE_STAGES) == bool(input_path):
+        raise ValueError("give either an input_path or a render/compose first stage")
+    if "export" in names[:-1]:
+        raise ValueError("export can only be the last stage")
+    if names[-1] == "export" and not outputs:
+        raise ValueError("export needs an output path per format")
+    if names[-1] != "export" and not output_path:
+        raise ValueError("no output path given")
+
+
+def plan_pipeline(
+    stages: list[dict],
+    output_path: Optional[str] = None,
+    outputs: Optional[dict[str, str]] = None,
+    input_path: Optional[str] = None,
+    scratch_dir: Optional[str] = None,
+) -> list[dict]:
+    """Compile an ordered list of processor stages into as few steps as possible.
+
+    Stages are dicts with a "stage" key and that stage's arguments:
+
+    * ``render``: project, feed_paths, offset_maps, render_mode (see
+      :func:`processor.timeline.render_timeline`)
+    * ``compose``: layout, feed_paths, engine, feed_offsets, start_seconds,
+      duration_seconds (see :func:`processor.compose.compile_layout`)
+    * ``optimize``: normalize, noise_reduce
+    * ``export``: formats (SOCIAL_FORMATS keys), written to ``outputs``
+
+    A render or compose stage, or ``input_path``, supplies the program.
+    Every later stage is appended to the same filter graph, so normally the
+    whole pipeline is one ffmpeg run that decodes the sources once and
+    encodes each output once.  Streams no stage filters are copied.  The
+    only break is a "copy" or "smart" render, which stream-copies pieces
+    outside any graph; when more stages follow, it is rendered into
+    ``scratch_dir`` and the rest of the pipeline reads that file.
+
+    Returns the steps in order: {"stages", "output", "cmd"} for ffmpeg
+    runs, or {"stages", "output", "render": kwargs} for a segmented render.
+    Raises ValueError for an invalid pipeline.
+    """
+    from processor.compose import compile_layout
+    from processor.export import SOCIAL_FORMATS, fit_filter
+    from processor.optimize import audio_filter_chain, measure_loudness_cached
+    from processor.timeline import RENDER_MODES, compile_timeline
+
+    _validate(stages, input_path, output_path, outputs)
+    steps: list[dict] = []
+    master = _open_file(input_path) if input_path else None
+    program = master
+    for i, stage in enumerate(stages):
+        name = stage["stage"]
+        last = i == len(stages) - 1
+        if name == "render":
+            mode = stage.get("render_mode", "graph")
+            if mode not in RENDER_MODES:
+                raise ValueError(f"unknown render mode '{mode}'")
+            if mode != "graph":
+                if not last and not scratch_dir:
+                    raise ValueError("a segmented render followed by more stages needs a scratch area")
+                path = output_path if last else os.path.join(scratch_dir, "render.mp4")
+                kwargs = {k: stage.get(k) for k in ("project", "feed_paths", "offset_maps")}
+                steps.append({"stages": ["render"], "output": path, "render": {**kwargs, "smart": mode == "smart"}})
+                program = None if last else _open_file(path)
+                continue
+            inputs, parts, _ = compile_timeline(stage["project"], stage["feed_paths"], stage.get("offset_maps"))
+            program = {"inputs": inputs, "filters": parts, "video": "[outv]", "audio": "[outa]", "stages": []}
+        elif name == "compose":
+            inputs, graph, _, _ = compile_layout(
+                stage["layout"], stage["feed_paths"], stage.get("engine", "auto"),
+                stage.get("feed_offsets"), stage.get("start_seconds", 0.0), stage.get("duration_seconds"),
+            )
+            program = {"inputs": inputs, "filters": [graph], "video": "[out]", "audio": None, "stages": []}
+        elif name == "optimize":
+            normalize = stage.get("normalize", True)
+            # Only the master's untouched audio can use its cached loudness for
+            # two-pass normalization; anything else (e.g. a scratch render that
+            # does not exist yet) falls back to dynamic loudnorm.
+            untouched = program is master and program["audio"] == "0:a"
+            measured = measure_loudness_cached(input_path) if normalize and untouched else None
+            chain = audio_filter_chain(normalize, stage.get("noise_reduce", False), measured)
+            if chain:
+                if program["audio"] is None:
+                    raise ValueError("optimize needs audio, but the composed program has none")
+                program["filters"].append(f"{_label(program['audio'])}{chain}[p{i}a]")
+                program["audio"] = f"[p{i}a]"
+        elif name == "export":
+            formats = list(stage.get("formats") or outputs)
+            missing = [f for f in formats if f not in SOCIAL_FORMATS or f not in outputs]
+            if missing:
+                raise ValueError(f"no output for format '{missing[0]}'")
+            n = len(formats)
+            video = [f"[p{i}v{k}]" for k in range(n)]
+            program["filters"].append(f"{_label(program['video'])}split={n}" + "".join(video))
+            audio: list[Optional[str]] = [None] * n
+            if program["audio"] is not None:
+                audio = [f"[p{i}a{k}]" for k in range(n)]
+                program["filters"].append(f"{_label(program['audio'])}asplit={n}" + "".join(audio))
+            per_output = []
+            for k, fmt in enumerate(formats):
+                dims = SOCIAL_FORMATS[fmt]
+                program["filters"].append(f"{video[k]}{fit_filter(dims['width'], dims['height'])}[p{i}o{k}]")
+                branch = {**program, "video": f"[p{i}o{k}]", "audio": audio[k]}
+                per_output.append(_maps(branch) + ["-movflags", "+faststart", outputs[fmt]])
+            program["stages"].append(name)
+            steps.append({"stages": program["stages"], "output": {f: outputs[f] for f in formats},
+                          "cmd": _command(program, per_output)})
+            program = None
+            continue
+        program["stages"].append(name)
+
+    if program is not None:
+        steps.append({"stages": program["stages"], "output": output_path,
+                      "cmd": _command(program, [_maps(program) + ["-movflags", "+faststart", output_path]])})
+    return steps
+
+
+def run_pipeline(
+    stages: list[dict],
+    output_path: Optional[str] = None,
+    outputs: Optional[dict[str, str]] = None,
+    input_path: Optional[str] = None,
+) -> dict:
+    """Plan a pipeline with :func:`plan_pipeline` and run its steps.
+
+    Intermediates live in a scratch area (see
+    :func:`processor.scratch.scratch_area`) that is removed when the
+    pipeline ends, whether it succeeded or not.
+
+    Returns {"result": output path, "ok" for exports, or an error string,
+    "outputs": {format: path} for exports, "steps": [[stage names per
+    step]]}.
+    """
+    from processor.scratch import scratch_area
+    from processor.segments import render_timeline_segments
+
+    report: dict = {"result": "", "outputs": {}, "steps": []}
+    try:
+        with scratch_area("pipeline-") as scratch:
+            try:
+                steps = plan_pipeline(stages, output_path, outputs, input_path, scratch)
+            except ValueError as exc:
+                return {**report, "result": f"error: {exc}"}
+            report["steps"] = [step["stages"] for step in steps]
+            for step in steps:
+                if "render" in step:
+                    result = render_timeline_segments(output_path=step["output"], **step["render"])["result"]
+                    if result.startswith("error"):
+                        return {**report, "result": result}
+                    continue
+                logger.info("Running pipeline step %s: %s", step["stages"], " ".join(step["cmd"]))
+                run_ffmpeg(step["cmd"])
+    except FileNotFoundError:
+        logger.warning("ffmpeg not found")
+        return {**report, "result": "error: ffmpeg not available"}
+    except subprocess.CalledProcessError as exc:
+        msg = exc.stderr.decode(errors="replace")
+        logger.error("pipeline failed: %s", msg)
+        return {**report, "result": f"error: ffmpeg failed – {msg[:200]}"}
+    except OSError as exc:
+        logger.error("pipeline scratch area unavailable: %s", exc)
+        return {**report, "result": f"error: {exc}"}
+    final = steps[-1]["output"]
+    if isinstance(final, dict):
+        return {**report, "result": "ok", "outputs": final}
+    return {**report, "result": final}
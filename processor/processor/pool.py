@@ -0,0 +1,224 @@
+import contextlib
+import logging
+import os
+import subprocess
+import threading
+from concurrent.futures import FIRST_EXCEPTION, ThreadPoolExecutor, wait
+from typing import Callable, Iterable, Iterator, Optional, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+def _available_cores() -> int:
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+# Upper bound on ffmpeg processes one worker runs at once.
+FFMPEG_POOL_SIZE = int(os.environ.get("FFMPEG_POOL_SIZE", "0")) or _available_cores()
+
+
+class Cancelled(Exception):
+    """Raised in pool jobs whose batch was cancelled before they finished."""
+
+
+class _Batch:
+    """The processes started on behalf of one :func:`run_parallel` call."""
+
+    def __init__(self):
+        self.cancelled = threading.Event()
+        self.processes: set[subprocess.Popen] = set()
+        self.lock = threading.Lock()
+
+    def cancel(self) -> None:
+        self.cancelled.set()
+        with self.lock:
+            running = list(self.processes)
+        for proc in running:
+            if proc.poll() is None:
+                proc.kill()
+
+
+class _TaskScope(_Batch):
+    """Everything one task started: its own processes and its pool batches."""
+
+    def __init__(self, task_id: str):
+        super().__init__()
+        self.task_id = task_id
+        self.batches: set[_Batch] = set()
+
+    def cancel(self) -> None:
+        super().cancel()
+        with self.lock:
+            batches = list(self.batches)
+        for batch in batches:
+            batch.cancel()
+
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+_local = threading.local()
+_active: set[_Batch] = set()
+_active_lock = threading.Lock()
+# task id -> scope of that task, for the tasks running in this process.
+_tasks: dict[str, _TaskScope] = {}
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=FFMPEG_POOL_SIZE, thread_name_prefix="ffmpeg")
+        return _executor
+
+
+def begin_task(task_id: str) -> None:
+    """Start attributing this thread's processes and batches to ``task_id``."""
+    scope = _TaskScope(task_id)
+    with _active_lock:
+        _tasks[task_id] = scope
+    _local.task = scope
+
+
+def end_task(task_id: str) -> None:
+    with _active_lock:
+        _tasks.pop(task_id, None)
+    _local.task = None
+
+
+def cancel_task(task_id: str) -> bool:
+    """Kill the ffmpeg processes of one task running in this process.
+
+    Only that task's own processes and pool batches are cancelled; other
+    tasks sharing the process (thread or gevent pools) run on.  Returns
+    whether the task was found here.
+    """
+    with _active_lock:
+        scope = _tasks.get(task_id)
+    if scope is None:
+        return False
+    scope.cancel()
+    logger.info("Cancelled ffmpeg work of task %s", task_id)
+    return True
+
+
+@contextlib.contextmanager
+def track_process(proc: subprocess.Popen) -> Iterator[subprocess.Popen]:
+    """Make ``proc`` killable by cancellation of the batch or task running this thread."""
+    batch: Optional[_Batch] = getattr(_local, "batch", None) or getattr(_local, "task", None)
+    if batch is None:
+        yield proc
+        return
+    with batch.lock:
+        batch.processes.add(proc)
+    if batch.cancelled.is_set():
+        proc.kill()
+    try:
+        yield proc
+    finally:
+        with batch.lock:
+            batch.processes.discard(proc)
+
+
+def check_cancelled() -> None:
+    """Raise :class:`Cancelled` if this thread's batch or task has been cancelled."""
+    for scope in (getattr(_local, "batch", None), getattr(_local, "task", None)):
+        if scope is not None and scope.cancelled.is_set():
+            raise Cancelled()
+
+
+def run_ffmpeg(cmd: list[str]) -> subprocess.CompletedProcess:
+    """Run one ffmpeg command like ``subprocess.run(cmd, capture_output=True, check=True)``.
+
+    Raises FileNotFoundError / CalledProcessError exactly as that call does,
+    so callers keep their error handling, but the process is registered so
+    that cancelling the surrounding batch kills it.
+    """
+    check_cancelled()
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    with track_process(proc):
+        try:
+            stdout, stderr = proc.communicate()
+        except BaseException:
+            proc.kill()
+            proc.wait()
+            raise
+    check_cancelled()
+    if proc.returncode != 0:
+        raise subprocess.CalledProcessError(proc.returncode, cmd, stdout, stderr)
+    return subprocess.CompletedProcess(cmd, proc.returncode, stdout, stderr)
+
+
+def _run_in_batch(batch: _Batch, fn: Callable[[T], R], item: T) -> R:
+    if batch.cancelled.is_set():
+        raise Cancelled()
+    _local.batch = batch
+    try:
+        return fn(item)
+    finally:
+        _local.batch = None
+
+
+def run_parallel(fn: Callable[[T], R], items: Iterable[T]) -> list[R]:
+    """Apply ``fn`` to every item on the shared ffmpeg pool; results in order.
+
+    At most FFMPEG_POOL_SIZE jobs run at once across the whole worker.  The
+    first exception cancels the batch: queued jobs never start, running
+    ffmpeg processes are killed, and the exception is re-raised here.
+    Called from inside a pool job, the items run inline instead, so nested
+    use can never deadlock the bounded pool.
+    """
+    items = list(items)
+    if getattr(_local, "batch", None) is not None or len(items) <= 1:
+        return [fn(item) for item in items]
+
+    batch = _Batch()
+    task: Optional[_TaskScope] = getattr(_local, "task", None)
+    with _active_lock:
+        _active.add(batch)
+    if task is not None:
+        with task.lock:
+            task.batches.add(batch)
+        if task.cancelled.is_set():
+            batch.cancel()
+    try:
+        executor = _get_executor()
+        futures = [executor.submit(_run_in_batch, batch, fn, item) for item in items]
+        try:
+            done, _ = wait(futures, return_when=FIRST_EXCEPTION)
+        except BaseException:
+            batch.cancel()
+            raise
+        failed = next((f for f in futures if f in done and f.exception() is not None), None)
+        if failed is not None:
+            batch.cancel()
+            for future in futures:
+                future.cancel()
+            wait(futures)
+            raise failed.exception()
+        return [future.result() for future in futures]
+    finally:
+        with _active_lock:
+            _active.discard(batch)
+        if task is not None:
+            with task.lock:
+                task.batches.discard(batch)
+
+
+def cancel_all() -> int:
+    """Cancel every running batch in this process, e.g. at worker shutdown.
+
+    Returns the number of batches cancelled.
+    """
+    with _active_lock:
+        batches = list(_active)
+    for batch in batches:
+        batch.cancel()
+    if batches:
+        logger.info("Cancelled %d ffmpeg batches", len(batches))
+    return len(batches)
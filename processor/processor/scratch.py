@@ -0,0 +1,23 @@
+import logging
+import os
+import tempfile
+from contextlib import contextmanager
+from typing import Iterator
+
+logger = logging.getLogger(__name__)
+
+# On the output volume by default, so intermediates never cross filesystems.
+SCRATCH_DIR = os.environ.get("SCRATCH_DIR", "/data/output/.scratch")
+
+
+@contextmanager
+def scratch_area(prefix: str = "job-") -> Iterator[str]:
+    """A private directory for a job's intermediate files, removed when the job ends.
+
+    The directory is deleted however the block exits, so a failed or
+    cancelled job leaves nothing behind.
+    """
+    os.makedirs(SCRATCH_DIR, exist_ok=True)
+    with tempfile.TemporaryDirectory(dir=SCRATCH_DIR, prefix=prefix) as path:
+        logger.debug("Scratch area %s", path)
+        yield path
@@ -0,0 +1,737 @@
+import json
+import logging
+import math
+import os
+import shutil
+import socket
+import subprocess
+import threading
+from typing import Callable, Optional
+
+from processor.media import input_args, lead_in_filters
+from processor.pool import run_ffmpeg, run_parallel
+from processor.timeline import drift_corrected_trim, render_timeline_detailed
+
+logger = logging.getLogger(__name__)
+
+# Codecs the concat demuxer output is written with; copied segments must match.
+COPY_VIDEO_CODEC = "h264"
+COPY_AUDIO_CODEC = "aac"
+COPY_PIX_FMT = "yuv420p"
+# Seconds either side of a cut point to look for keyframes.
+KEYFRAME_PROBE_WINDOW = 1.0
+# Smart render looks up to this far for the next keyframe (longest expected GOP).
+GOP_PROBE_SECONDS = 10.0
+# Parallel renders split re-encoded pieces into chunks of at most this many
+# source seconds, so one long clip still spreads over several workers.
+PARALLEL_SEGMENT_SECONDS = float(os.environ.get("PARALLEL_SEGMENT_SECONDS", "60"))
+# Bump when the piece layout of a render changes, so old checkpoints are ignored.
+CHECKPOINT_VERSION = 1
+# Output parameters when no input can be copied to take them from.
+DEFAULT_SPEC = {"fps": 30.0, "profile": "High", "level": None, "sample_rate": 48000, "channels": 2}
+
+
+def probe_media(path: str) -> Optional[dict]:
+    """Stream parameters of a media file via ffprobe, or None if it cannot be read.
+
+    Returns {"duration", "video": {...}, "audio": {...}} with codec_name,
+    profile, level, width, height, pix_fmt and fps for video and codec_name, sample_rate
+    and channels for audio (either may be None if the stream is missing).
+    """
+    cmd = [
+        "ffprobe", "-v", "error",
+        "-show_entries",
+        "stream=codec_type,codec_name,profile,level,width,height,pix_fmt,r_frame_rate,"
+        "sample_rate,channels"
+        ":format=duration",
+        "-of", "json", path,
+    ]
+    try:
+        proc = run_ffmpeg(cmd)
+        info = json.loads(proc.stdout)
+    except FileNotFoundError:
+        logger.warning("ffprobe not found")
+        return None
+    except (subprocess.CalledProcessError, ValueError):
+        logger.warning("Could not probe %s", path)
+        return None
+
+    video = audio = None
+    for stream in info.get("streams", []):
+        if stream.get("codec_type") == "video" and video is None:
+            num, _, den = stream.get("r_frame_rate", "0/1").partition("/")
+            video = {
+                "codec_name": stream.get("codec_name"),
+                "profile": stream.get("profile"),
+                "level": stream.get("level"),
+                "width": stream.get("width"),
+                "height": stream.get("height"),
+                "pix_fmt": stream.get("pix_fmt"),
+                "fps": float(num) / float(den or 1) if float(den or 1) else 0.0,
+            }
+        elif stream.get("codec_type") == "audio" and audio is None:
+            audio = {
+                "codec_name": stream.get("codec_name"),
+                "sample_rate": int(stream.get("sample_rate", 0)),
+                "channels": stream.get("channels"),
+            }
+    duration = float(info.get("format", {}).get("duration", 0.0) or 0.0)
+    return {"duration": duration, "video": video, "audio": audio}
+
+
+def keyframe_times(path: str, around: list[float], window: float = KEYFRAME_PROBE_WINDOW) -> list[float]:
+    """Video keyframe timestamps within ``window`` seconds of each time in ``around``.
+
+    Only packet headers near the requested times are read (``-read_intervals``),
+    so probing a cut in a multi-hour file costs a couple of seeks.
+    """
+    if not around:
+        return []
+    intervals = ",".join(f"{max(0.0, t - window):.3f}%+{2 * window:.3f}" for t in sorted(set(around)))
+    cmd = [
+        "ffprobe", "-v", "error", "-select_streams", "v:0",
+        "-read_intervals", intervals,
+        "-show_entries", "packet=pts_time,flags",
+        "-of", "csv=p=0", path,
+    ]
+    try:
+        proc = run_ffmpeg(cmd)
+    except (FileNotFoundError, subprocess.CalledProcessError):
+        return []
+    times = set()
+    for line in proc.stdout.decode(errors="replace").splitlines():
+        pts, _, flags = line.partition(",")
+        if "K" in flags:
+            try:
+                times.add(float(pts))
+            except ValueError:
+                continue
+    return sorted(times)
+
+
+def _on_keyframe(t: float, keyframes: list[float], tolerance: float) -> bool:
+    return any(abs(k - t) <= tolerance for k in keyframes)
+
+
+def _tolerance(probe: dict) -> float:
+    fps = probe["video"]["fps"]
+    return 0.5 / fps if fps else 0.02
+
+
+def _compat_blocker(segment: dict, probe: Optional[dict], out_w: int, out_h: int,
+                    spec: Optional[dict]) -> Optional[str]:
+    """Why a segment's packets cannot go into the output as they are, or None."""
+    if probe is None or probe["video"] is None or probe["audio"] is None:
+        return "could not probe input"
+    video, audio = probe["video"], probe["audio"]
+    if abs(segment["speed"] - 1.0) > 1e-7:
+        return "drift correction retimes the clip"
+    if segment["lead_in"] > 0:
+        return "clip starts before its source"
+    if (video["width"], video["height"]) != (out_w, out_h):
+        return f"resolution {video['width']}x{video['height']} differs from output"
+    if video["codec_name"] != COPY_VIDEO_CODEC or video["pix_fmt"] != COPY_PIX_FMT:
+        return f"video is {video['codec_name']}/{video['pix_fmt']}"
+    if audio["codec_name"] != COPY_AUDIO_CODEC:
+        return f"audio is {audio['codec_name']}"
+    # Re-encoded pieces must reproduce the copied ones' profile, or the
+    # joined stream switches parameter sets mid-stream.
+    if _x264_profile(video.get("profile")) is None:
+        return f"profile {video.get('profile') or 'unknown'} cannot be matched by re-encoded segments"
+    if spec is not None and (
+        abs(video["fps"] - spec["fps"]) > 1e-3
+        or audio["sample_rate"] != spec["sample_rate"]
+        or audio["channels"] != spec["channels"]
+        or video.get("profile") != spec["profile"]
+        or video.get("level") != spec["level"]
+    ):
+        return "stream parameters differ from the other copied segments"
+    return None
+
+
+def _keyframe_pieces(segment: dict, probe: dict, keyframes: list[float],
+                     smart: bool) -> tuple[list[dict], str]:
+    """Split a stream-compatible segment into copied and re-encoded pieces.
+
+    A segment cut on keyframes is one copied piece.  Otherwise, in smart
+    mode, only the partial GOPs at either end are re-encoded: the head up
+    to the first keyframe after the start and the tail from the last
+    keyframe before the end; the keyframe-aligned middle is copied.
+    Returns (pieces, reason the segment is not a plain copy).
+    """
+    tol = _tolerance(probe)
+    start = segment["start"] or 0.0
+    end = segment["end"]
+    open_end = end is None or end >= probe["duration"] - tol
+    start_ok = start <= tol or _on_keyframe(start, keyframes, tol)
+    end_ok = open_end or _on_keyframe(end, keyframes, tol)
+    if start_ok and end_ok:
+        return [{"start": segment["start"], "end": end, "mode": "copy"}], ""
+
+    reason = "start is not on a keyframe" if not start_ok else "end is not on a keyframe"
+    whole = [{"start": segment["start"], "end": end, "mode": "encode"}]
+    if not smart:
+        return whole, reason
+    first = start if start_ok else min((k for k in keyframes if k > start), default=None)
+    # An open-ended clip copies through to the end of the source.
+    last = end if end_ok else max((k for k in keyframes if k < end), default=None)
+    if first is None or (last is None and not open_end) or (last is not None and first >= last):
+        return whole, reason + "; no whole GOP inside the clip"
+
+    pieces = []
+    if not start_ok:
+        pieces.append({"start": start, "end": first, "mode": "encode"})
+    pieces.append({"start": first or None, "end": last, "mode": "copy"})
+    if not end_ok:
+        pieces.append({"start": last, "end": end, "mode": "encode"})
+    return pieces, reason
+
+
+def plan_segments(
+    project: dict,
+    feed_paths: dict[str, str],
+    offset_maps: Optional[dict] = None,
+    smart: bool = False,
+) -> tuple[list[dict], Optional[dict]]:
+    """Decide, per timeline clip, how much of it can be stream-copied.
+
+    Inputs are probed once per feed (in parallel on the ffmpeg pool) and
+    keyframes are looked up only around each clip's cut points.  A clip is
+    copied when its source already has the output resolution and codecs,
+    needs no retiming or padding, shares stream parameters with the other
+    copied clips, and is cut on keyframes.  With ``smart`` a compatible clip
+    cut between keyframes is still mostly copied: only its partial GOPs at
+    the cut points are re-encoded.
+
+    Returns (segments, spec): one dict per clip with "index", "feed_id",
+    "path", "start", "end", "speed", "lead_in", "mode" ("copy", "smart" or
+    "encode"), "reason", "duration" (of the source, None if it could not be
+    probed) and "pieces" ([{"start", "end", "mode"}]), plus the
+    stream parameters re-encoded pieces must match (None if nothing can be
+    copied).
+    """
+    offset_maps = offset_maps or {}
+    out_w = project.get("output_width", 1920)
+    out_h = project.get("output_height", 1080)
+    segments = []
+    for clip in project.get("clips", []):
+        feed_id = clip.get("feed_id")
+        path = feed_paths.get(feed_id)
+        if not path:
+            logger.warning("No file for feed_id=%s, skipping", feed_id)
+            continue
+        start, end, speed = drift_corrected_trim(clip, offset_maps.get(feed_id))
+        lead_in = -start if start is not None and start < 0 else 0.0
+        segments.append({
+            "index": len(segments),
+            "feed_id": feed_id,
+            "path": path,
+            "start": max(start, 0.0) if start is not None else None,
+            "end": end,
+            "speed": speed,
+            "lead_in": lead_in,
+        })
+
+    # Smart mode needs the nearest keyframe inside the clip, up to a GOP away.
+    window = GOP_PROBE_SECONDS if smart else KEYFRAME_PROBE_WINDOW
+    paths = sorted({s["path"] for s in segments})
+    cuts = {p: [t for s in segments if s["path"] == p for t in (s["start"], s["end"]) if t] for p in paths}
+    probed = run_parallel(lambda p: (probe_media(p), keyframe_times(p, cuts[p], window)), paths)
+    probes = dict(zip(paths, probed))
+
+    spec = None
+    for segment in segments:
+        probe, keyframes = probes[segment["path"]]
+        reason = _compat_blocker(segment, probe, out_w, out_h, spec)
+        if reason:
+            pieces = [{"start": segment["start"], "end": segment["end"], "mode": "encode"}]
+        else:
+            pieces, reason = _keyframe_pieces(segment, probe, keyframes, smart)
+        modes = {piece["mode"] for piece in pieces}
+        segment["mode"] = modes.pop() if len(modes) == 1 else "smart"
+        segment["reason"] = reason
+        segment["pieces"] = pieces
+        segment["duration"] = probe["duration"] if probe else None
+        if "copy" in {piece["mode"] for piece in pieces} and spec is None:
+            spec = _stream_spec(probe)
+    return segments, spec
+
+
+def _stream_spec(probe: Optional[dict]) -> Optional[dict]:
+    """The stream parameters of a probed input that re-encoded pieces must match."""
+    if probe is None or probe["video"] is None or probe["audio"] is None:
+        return None
+    video, audio = probe["video"], probe["audio"]
+    return {
+        "fps": video["fps"],
+        "profile": video.get("profile"),
+        "level": video.get("level"),
+        "sample_rate": audio["sample_rate"],
+        "channels": audio["channels"],
+    }
+
+
+def _x264_profile(profile: Optional[str]) -> Optional[str]:
+    """ffprobe's H.264 profile name as an ``-profile:v`` value for libx264."""
+    if not profile:
+        return None
+    name = profile.lower().replace("constrained ", "")
+    return name if name in ("baseline", "main", "high", "high10", "high422", "high444") else None
+
+
+def piece_command(segment: dict, piece: dict, output_path: str,
+                  out_w: int, out_h: int, spec: dict) -> list[str]:
+    """ffmpeg command writing one piece of a planned segment as MPEG-TS.
+
+    Pieces are written as MPEG-TS so every one carries its H.264 parameter
+    sets in-band; re-encoded pieces match the copied ones' profile, level,
+    frame rate and audio layout, and use x264's ``stitchable`` mode so they
+    can sit between copied GOPs.  A piece's own "lead_in" overrides the
+    segment's (only the first piece of a split segment is padded).  A
+    re-encoded piece with "streams" "v" or "a" writes only its video or
+    only its audio (see :func:`split_piece`).
+    """
+    args, _ = input_args(segment["path"], piece["start"], piece["end"])
+    if piece["mode"] == "copy":
+        return ["ffmpeg", "-y", "-v", "error"] + args + [
+            "-map", "0:v:0", "-map", "0:a:0", "-c", "copy",
+            "-bsf:v", "h264_mp4toannexb", "-f", "mpegts", output_path,
+        ]
+
+    lead_v, lead_a = lead_in_filters(piece.get("lead_in", segment["lead_in"]))
+    v_chain = f"setpts=PTS-STARTPTS,{lead_v}"
+    a_chain = f"asetpts=PTS-STARTPTS,{lead_a}"
+    if abs(segment["speed"] - 1.0) > 1e-7:
+        v_chain += f"setpts=PTS*{segment['speed']:.9f},"
+        a_chain += f"atempo={1.0 / segment['speed']:.9f},"
+    encoder = ["-c:v", "libx264", "-preset", "fast", "-crf", "18", "-x264-params", "stitchable=1"]
+    profile = _x264_profile(spec.get("profile"))
+    if profile:
+        encoder += ["-profile:v", profile]
+    if spec.get("level") and spec["level"] > 0:
+        encoder += ["-level:v", f"{spec['level'] / 10:.1f}"]
+    streams = piece.get("streams", "av")
+    video = [
+        "-map", "0:v:0",
+        "-vf", f"{v_chain}scale={out_w}:{out_h},setsar=1",
+        "-r", f"{spec['fps']:.6f}", "-pix_fmt", COPY_PIX_FMT,
+        *encoder,
+    ] if "v" in streams else []
+    audio = [
+        "-map", "0:a:0",
+        "-af", a_chain.rstrip(","),
+        "-c:a", "aac", "-b:a", "192k",
+        "-ar", str(spec["sample_rate"]), "-ac", str(spec["channels"]),
+    ] if "a" in streams else []
+    return ["ffmpeg", "-y", "-v", "error"] + args + video + audio + ["-f", "mpegts", output_path]
+
+
+def _write_concat_list(paths: list[str], list_path: str, single_stream: bool = False) -> None:
+    """Write a concat demuxer list; ``single_stream`` joins only each file's first stream."""
+    with open(list_path, "w") as fh:
+        if single_stream:
+            fh.write("ffconcat version 1.0\nstream\n")
+        for path in paths:
+            escaped = path.replace("'", "'\\''")
+            fh.write(f"file '{escaped}'\n")
+
+
+def concat_segments(segment_paths: list[str], output_path: str, list_path: str,
+                    audio_paths: Optional[list[str]] = None) -> None:
+    """Join segment files with the concat demuxer, without re-encoding.
+
+    With ``audio_paths`` the video comes from ``segment_paths`` and the
+    audio from ``audio_paths``, each joined on its own and muxed together.
+    The concat demuxer takes its streams from the first file and matches
+    the others by index, so then every segment file must hold its video
+    as its first stream and every audio file must hold audio only.
+    """
+    _write_concat_list(segment_paths, list_path, single_stream=audio_paths is not None)
+    cmd = ["ffmpeg", "-y", "-v", "error", "-f", "concat", "-safe", "0", "-i", list_path]
+    if audio_paths is not None:
+        audio_list = os.path.splitext(list_path)[0] + "-audio.txt"
+        _write_concat_list(audio_paths, audio_list, single_stream=True)
+        cmd += ["-f", "concat", "-safe", "0", "-i", audio_list, "-map", "0:v:0", "-map", "1:a:0"]
+    run_ffmpeg(cmd + ["-c", "copy", "-bsf:a", "aac_adtstoasc", "-movflags", "+faststart", output_path])
+
+
+def _segment_report(segments: list[dict]) -> list[dict]:
+    return [
+        {
+            "index": s["index"],
+            "feed_id": s["feed_id"],
+            "mode": s["mode"],
+            "reason": s["reason"],
+            "pieces": [p["mode"] for p in s["pieces"]],
+        }
+        for s in segments
+    ]
+
+
+def _render_report(segments: list[dict]) -> dict:
+    return {
+        "segments": _segment_report(segments),
+        "copied": sum(s["mode"] == "copy" for s in segments),
+        "encoded": sum(s["mode"] == "encode" for s in segments),
+        "smart": sum(s["mode"] == "smart" for s in segments),
+    }
+
+
+class RenderCheckpoint:
+    """Durable progress of one segmented render, so a restart can resume it.
+
+    Pieces are written to a directory next to the output named after a
+    hash of the render plan (source file identities, every piece's trims,
+    output size, encoder spec and output path) and renamed into place only
+    once complete, so a piece file that exists is finished.  A manifest
+    records the plan and output it belongs to.  Opening a checkpoint removes
+    the directories other plans left for the same output, e.g. by an
+    interrupted render of the timeline before it was edited.
+    """
+
+    def __init__(self, output_path: str, jobs: list[tuple[dict, dict]], out_w: int, out_h: int, spec: dict):
+        from processor.cache import cache_key, file_identity
+
+        paths = sorted({segment["path"] for segment, _ in jobs})
+        pieces = [
+            [segment["path"], round(segment["speed"], 9), segment["lead_in"],
+             piece["start"], piece["end"], piece["mode"], piece.get("lead_in"), piece.get("streams")]
+            for segment, piece in jobs
+        ]
+        self.output_path = os.path.abspath(output_path)
+        self.plan = cache_key(
+            "render", CHECKPOINT_VERSION, self.output_path,
+            [file_identity(p) for p in paths], pieces, out_w, out_h, spec,
+        )
+        self.dir = os.path.join(os.path.dirname(self.output_path), f".render-{self.plan[:16]}")
+        self.total = len(jobs)
+
+    @property
+    def manifest_path(self) -> str:
+        return os.path.join(self.dir, "manifest.json")
+
+    def piece_path(self, k: int) -> str:
+        return os.path.join(self.dir, f"{k:05d}.ts")
+
+    def finished(self) -> list[int]:
+        return [k for k in range(self.total) if os.path.exists(self.piece_path(k))]
+
+    def _sweep_stale(self) -> None:
+        """Remove checkpoint directories of other plans for the same output."""
+        parent = os.path.dirname(self.output_path)
+        try:
+            names = os.listdir(parent)
+        except OSError:
+            return
+        for name in names:
+            path = os.path.join(parent, name)
+            if not name.startswith(".render-") or path == self.dir:
+                continue
+            try:
+                with open(os.path.join(path, "manifest.json")) as fh:
+                    output = json.load(fh).get("output")
+            except (OSError, ValueError, AttributeError):
+                continue
+            if output == self.output_path:
+                logger.info("Removing stale render checkpoint %s", path)
+                shutil.rmtree(path, ignore_errors=True)
+
+    def open(self, resume: bool = True) -> list[int]:
+        """Create the checkpoint, or pick one up; returns the finished pieces."""
+        self._sweep_stale()
+        manifest = None
+        try:
+            with open(self.manifest_path) as fh:
+                manifest = json.load(fh)
+        except (OSError, ValueError):
+            pass
+        if manifest is not None and (not resume or manifest.get("plan") != self.plan):
+            shutil.rmtree(self.dir, ignore_errors=True)
+            manifest = None
+        os.makedirs(self.dir, exist_ok=True)
+        if manifest is None:
+            temp = self.manifest_path + ".tmp"
+            with open(temp, "w") as fh:
+                json.dump({"plan": self.plan, "output": self.output_path, "pieces": self.total}, fh)
+            os.replace(temp, self.manifest_path)
+            return []
+        return self.finished()
+
+    def commit(self, k: int, part_path: str) -> None:
+        """Publish a completed piece written to ``part_path``."""
+        os.replace(part_path, self.piece_path(k))
+
+    def discard(self) -> None:
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+
+def _part_path(path: str) -> str:
+    """Where this process writes ``path`` before renaming it into place.
+
+    The name is unique per host and process: a render redelivered while
+    its first run is still going must not write into the same file.
+    """
+    return f"{path}.{socket.gethostname()}-{os.getpid()}.part"
+
+
+def render_timeline_segments(
+    project: dict,
+    feed_paths: dict[str, str],
+    output_path: str,
+    offset_maps: Optional[dict] = None,
+    smart: bool = False,
+    resume: bool = True,
+    progress: Optional[Callable[[dict], None]] = None,
+) -> dict:
+    """Render a timeline, stream-copying every clip (or clip middle) that allows it.
+
+    Each clip is cut into the pieces :func:`plan_segments` chose: copied
+    pieces are cut without decoding, the others are re-encoded to the
+    copied pieces' parameters, and everything is joined with the concat
+    demuxer.  With ``smart`` only the partial GOPs at cut points are
+    re-encoded.  If nothing can be copied this falls back to the single
+    filter-graph render of :func:`render_timeline_detailed`.
+
+    Re-encoded pieces are served from the segment cache when an identical
+    piece was rendered before, so after a small edit only the changed
+    clips are encoded again.  Finished pieces are checkpointed (see
+    :class:`RenderCheckpoint`): with ``resume`` a render of the same plan
+    that was interrupted continues from them.  ``progress`` is called with
+    {"done", "total", "recovered"} after every piece.
+
+    Returns the render report with "segments" ([{"index", "feed_id",
+    "mode", "reason", "pieces"}]), "copied", "encoded" and "smart" clip
+    counts, "reused" (re-encoded pieces taken from the cache) and
+    "recovered" (pieces kept from an interrupted run) added.
+    """
+    empty = {"segments": [], "copied": 0, "encoded": 0, "smart": 0}
+    if not project.get("clips"):
+        return {**empty, "result": "error: no clips defined in project"}
+    segments, spec = plan_segments(project, feed_paths, offset_maps, smart)
+    if not segments:
+        return {**empty, "result": "error: no valid feeds for project"}
+    report = _render_report(segments)
+    if spec is None:
+        logger.info("No clip can be stream-copied; rendering as one graph")
+        detailed = render_timeline_detailed(project, feed_paths, output_path, offset_maps)
+        return {**detailed, **report}
+
+    out_w = project.get("output_width", 1920)
+    out_h = project.get("output_height", 1080)
+    jobs = [(s, piece) for s in segments for piece in s["pieces"]]
+    checkpoint = RenderCheckpoint(output_path, jobs, out_w, out_h, spec)
+    try:
+        finished = set(checkpoint.open(resume))
+    except OSError as exc:
+        return {**report, "result": f"error: cannot write checkpoint – {exc}"}
+    report.update(recovered=len(finished), reused=0)
+    logger.info("Rendering %d clips as %d pieces (%d recovered)", len(segments), len(jobs), len(finished))
+    lock = threading.Lock()
+
+    def render(k: int) -> bool:
+        part = _part_path(checkpoint.piece_path(k))
+        hit = _render_piece(*jobs[k], part, out_w, out_h, spec)
+        checkpoint.commit(k, part)
+        with lock:
+            finished.add(k)
+            report["reused"] += hit
+            if progress:
+                progress({"done": len(finished), "total": len(jobs), "recovered": report["recovered"]})
+        return hit
+
+    try:
+        run_parallel(render, [k for k in range(len(jobs)) if k not in finished])
+        paths = [checkpoint.piece_path(k) for k in range(len(jobs))]
+        concat_segments(paths, output_path, os.path.join(checkpoint.dir, "segments.txt"))
+    except FileNotFoundError:
+        logger.warning("ffmpeg not found")
+        return {**report, "result": "error: ffmpeg not available"}
+    except subprocess.CalledProcessError as exc:
+        msg = (exc.stderr or b"").decode(errors="replace")
+        logger.error("segment render failed: %s", msg)
+        return {**report, "result": f"error: ffmpeg failed – {msg[:200]}"}
+    checkpoint.discard()
+    return {**report, "result": output_path}
+
+
+def split_piece(piece: dict, segment: dict, max_seconds: float) -> list[dict]:
+    """Cut a re-encoded piece into chunks of at most ``max_seconds`` source seconds.
+
+    Copied pieces cost no decoding and are left whole.  An open-ended piece
+    is split up to the source duration when it is known.  Chunk boundaries
+    fall on multiples of ``max_seconds`` of source time, so moving a clip's
+    cut changes only the chunks next to it (and their segment cache keys).
+    Only the first chunk keeps the segment's lead-in.
+
+    The chunks carry only video ("streams": "v"), preceded by one piece
+    with the whole piece's audio ("streams": "a").  Every AAC encode starts
+    with encoder priming that MPEG-TS cannot trim, so audio encoded per
+    chunk would click at each chunk boundary and drift over a long clip.
+    """
+    start = piece["start"] or 0.0
+    end = piece["end"] if piece["end"] is not None else segment.get("duration")
+    if piece["mode"] != "encode" or end is None or max_seconds <= 0 or end - start <= max_seconds:
+        return [piece]
+    lead_in = piece.get("lead_in", segment["lead_in"])
+    chunks = [{**piece, "lead_in": lead_in, "streams": "a"}]
+    t = start
+    while t < end - 1e-6:
+        stop = min((math.floor(t / max_seconds + 1e-9) + 1) * max_seconds, end)
+        last = end - stop < 1e-6
+        chunks.append({
+            "start": t,
+            "end": piece["end"] if last else stop,
+            "mode": "encode",
+            "lead_in": lead_in if len(chunks) == 1 else 0.0,
+            "streams": "v",
+        })
+        t = stop
+    return chunks
+
+
+def plan_parallel_render(
+    project: dict,
+    feed_paths: dict[str, str],
+    offset_maps: Optional[dict] = None,
+    smart: bool = True,
+    segment_seconds: float = PARALLEL_SEGMENT_SECONDS,
+) -> tuple[list[dict], dict, dict]:
+    """Split a timeline into independent jobs that can render on any worker.
+
+    Jobs break at clip boundaries, at the copy/encode boundaries chosen by
+    :func:`plan_segments`, and every ``segment_seconds`` inside re-encoded
+    pieces, whose audio is then one more job (see :func:`split_piece`).
+    All re-encoded jobs share one stream spec, so their outputs
+    concatenate without another encode.  Returns (jobs, spec, report):
+    the jobs as {"segment", "piece"} in output order, the encoder spec, and
+    the render report of :func:`render_timeline_segments` plus a "pieces"
+    count.
+    """
+    segments, spec = plan_segments(project, feed_paths, offset_maps, smart)
+    if spec is None:
+        first = _stream_spec(probe_media(segments[0]["path"])) if segments else None
+        spec = {**DEFAULT_SPEC, "fps": first["fps"]} if first and first["fps"] else dict(DEFAULT_SPEC)
+    jobs = []
+    for segment in segments:
+        summary = {k: segment[k] for k in ("index", "feed_id", "path", "start", "end", "speed", "lead_in")}
+        for piece in segment["pieces"]:
+            for chunk in split_piece(piece, segment, segment_seconds):
+                jobs.append({"segment": summary, "piece": chunk})
+    return jobs, spec, {**_render_report(segments), "pieces": len(jobs)}
+
+
+def _link_or_copy(src: str, dst: str) -> None:
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copyfile(src, dst)
+
+
+def _render_piece(segment: dict, piece: dict, output_path: str,
+                  out_w: int, out_h: int, spec: dict) -> bool:
+    """Write one piece to ``output_path``, reusing a cached encode when possible.
+
+    Re-encoded pieces go through the segment cache (see
+    :class:`processor.cache.SegmentCache`); copied pieces are cheap to cut
+    again and are never cached.  The result is linked (or copied) out of the
+    cache, so a later eviction cannot pull it from under the concat.
+    Returns True on a cache hit.  Raises like :func:`run_ffmpeg`.
+    """
+    from processor.cache import get_segment_cache
+
+    cache = get_segment_cache() if piece["mode"] == "encode" else None
+    key = cache.key_for(segment, piece, out_w, out_h, spec) if cache else None
+    if key is None:
+        run_ffmpeg(piece_command(segment, piece, output_path, out_w, out_h, spec))
+        return False
+    cached = cache.get(key)
+    if cached:
+        try:
+            _link_or_copy(cached, output_path)
+            return True
+        except OSError:
+            logger.warning("Segment cache entry %s vanished; re-encoding", cached)
+    try:
+        temp_path = cache.temp_path(key)
+    except OSError:
+        logger.warning("Segment cache dir %s not writable; encoding uncached", cache.cache_dir)
+        run_ffmpeg(piece_command(segment, piece, output_path, out_w, out_h, spec))
+        return False
+    try:
+        run_ffmpeg(piece_command(segment, piece, temp_path, out_w, out_h, spec))
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    _link_or_copy(cache.put(key, temp_path), output_path)
+    return False
+
+
+def render_piece(job: dict, output_path: str, out_w: int, out_h: int, spec: dict) -> str:
+    """Render one job of a parallel render.  Returns its path or an error string.
+
+    A piece that already exists was finished by an earlier, interrupted run
+    of the same plan and is kept.
+    """
+    if os.path.exists(output_path):
+        return output_path
+    part = _part_path(output_path)
+    try:
+        _render_piece(job["segment"], job["piece"], part, out_w, out_h, spec)
+        os.replace(part, output_path)
+    except FileNotFoundError:
+        logger.warning("ffmpeg not found")
+        return "error: ffmpeg not available"
+    except subprocess.CalledProcessError as exc:
+        msg = (exc.stderr or b"").decode(errors="replace")
+        logger.error("piece render failed: %s", msg)
+        return f"error: ffmpeg failed – {msg[:200]}"
+    except OSError as exc:
+        logger.error("piece render failed: %s", exc)
+        return f"error: {exc}"
+    return output_path
+
+
+def _audio_only(piece_path: str, scratch_dir: str) -> str:
+    """Copy a piece's audio stream, without re-encoding, to its own MPEG-TS file."""
+    name = os.path.splitext(os.path.basename(piece_path))[0]
+    audio_path = os.path.join(scratch_dir, f"{name}-audio.ts")
+    run_ffmpeg([
+        "ffmpeg", "-y", "-v", "error", "-i", piece_path,
+        "-map", "0:a:0", "-c", "copy", "-f", "mpegts", audio_path,
+    ])
+    return audio_path
+
+
+def finish_parallel_render(piece_results: list[str], output_path: str, scratch_dir: str,
+                           report: dict, streams: Optional[list[str]] = None) -> dict:
+    """Concatenate the pieces of a parallel render and remove its scratch directory.
+
+    ``streams`` gives each piece's "streams" ("av" when absent); pieces
+    that hold only video or only audio are joined into that stream alone.
+    The audio of pieces holding both is then copied out to audio-only
+    files first, so every file in the audio join has the same layout.
+    On failure the finished pieces are kept, so dispatching the same render
+    again resumes from them.
+    """
+    failed = next((r for r in piece_results if r.startswith("error")), None)
+    if failed:
+        return {**report, "result": failed}
+    audio_paths = None
+    try:
+        if streams and any(s != "av" for s in streams):
+            audio_paths = run_parallel(
+                lambda item: item[0] if item[1] == "a" else _audio_only(item[0], scratch_dir),
+                [(r, s) for r, s in zip(piece_results, streams) if "a" in s],
+            )
+            piece_results = [r for r, s in zip(piece_results, streams) if "v" in s]
+        concat_segments(piece_results, output_path, os.path.join(scratch_dir, "segments.txt"), audio_paths)
+    except FileNotFoundError:
+        logger.warning("ffmpeg not found")
+        return {**report, "result": "error: ffmpeg not available"}
+    except subprocess.CalledProcessError as exc:
+        msg = (exc.stderr or b"").decode(errors="replace")
+        logger.error("concat failed: %s", msg)
+        return {**report, "result": f"error: ffmpeg failed – {msg[:200]}"}
+    shutil.rmtree(scratch_dir, ignore_errors=True)
+    return {**report, "result": output_path}
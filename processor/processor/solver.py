@@ -0,0 +1,240 @@
+import logging
+from typing import Optional
+
+import numpy as np
+
+from processor.fingerprint import (
+    FINGERPRINT_DIR,
+    SAMPLE_RATE,
+    FingerprintIndex,
+    _read_fingerprint,
+    fingerprint_samples,
+)
+from processor.pool import run_parallel
+from processor.sync import estimate_offset_multires, load_audio_pcm, refine_offset
+
+logger = logging.getLogger(__name__)
+
+# Extra edges per feed beyond the spanning tree, so one bad pair can be outvoted.
+EXTRA_EDGES_PER_FEED = 1
+# Search radius around a fingerprint offset when confirming a pair.
+PAIR_SEARCH_SECONDS = 0.25
+# Pairs below this confidence are not used in the solve.
+MIN_PAIR_CONFIDENCE = 0.2
+# Residual scale (seconds) of the robust reweighting; pairs far beyond it
+# barely count.
+OUTLIER_SECONDS = 0.02
+
+
+def _find(parent: list[int], i: int) -> int:
+    while parent[i] != i:
+        parent[i] = parent[parent[i]]
+        i = parent[i]
+    return i
+
+
+def _union(parent: list[int], i: int, j: int) -> bool:
+    ri, rj = _find(parent, i), _find(parent, j)
+    if ri == rj:
+        return False
+    parent[rj] = ri
+    return True
+
+
+def select_pairs(
+    n: int,
+    candidates: list[tuple[int, int, float]],
+    durations: list[float],
+    extra_per_node: int = EXTRA_EDGES_PER_FEED,
+) -> list[tuple[int, int]]:
+    """Choose a sparse set of feed pairs (i, j) to correlate.
+
+    ``candidates`` are (i, j, weight) edges, e.g. fingerprint match counts.
+    A maximum spanning forest is taken first, then up to ``extra_per_node``
+    further edges per feed for redundancy.  Components the candidates leave
+    disconnected are joined longest-feed to longest-feed, since long
+    recordings are the most likely to overlap.  Returns about 2N pairs
+    rather than N(N-1)/2.
+    """
+    parent = list(range(n))
+    ranked = sorted(candidates, key=lambda e: -e[2])
+    chosen: list[tuple[int, int]] = []
+    spare: list[tuple[int, int]] = []
+    for i, j, _ in ranked:
+        if _union(parent, i, j):
+            chosen.append((i, j))
+        else:
+            spare.append((i, j))
+
+    degree = [0] * n
+    taken = {frozenset(p) for p in chosen}
+    for i, j in spare:
+        if frozenset((i, j)) in taken:
+            continue
+        if degree[i] < extra_per_node or degree[j] < extra_per_node:
+            chosen.append((i, j))
+            taken.add(frozenset((i, j)))
+            degree[i] += 1
+            degree[j] += 1
+
+    roots: dict[int, list[int]] = {}
+    for i in range(n):
+        roots.setdefault(_find(parent, i), []).append(i)
+    if len(roots) > 1:
+        longest = [max(members, key=lambda k: durations[k]) for members in roots.values()]
+        longest.sort(key=lambda k: -durations[k])
+        hub = longest[0]
+        chosen.extend((hub, other) for other in longest[1:])
+    return chosen
+
+
+def solve_offsets(
+    n: int,
+    measurements: list[dict],
+    anchor: int = 0,
+) -> tuple[np.ndarray, np.ndarray, list[int]]:
+    """Weighted least-squares feed offsets from pairwise measurements.
+
+    Each measurement {"reference": i, "target": j, "offset_seconds", "confidence"}
+    says ``x[j] - x[i] == offset_seconds``.  The first feed of every connected
+    component is pinned to 0 (``anchor`` for its own component), and
+    iteratively reweighted passes with a Cauchy weight stop one wrong pair
+    from bending the solution as long as redundant pairs disagree with it.
+    Returns (offsets, residuals per measurement, component id per feed).
+    """
+    parent = list(range(n))
+    for m in measurements:
+        _union(parent, m["reference"], m["target"])
+    component = [_find(parent, i) for i in range(n)]
+    anchors = {component[anchor]: anchor}
+    for i in range(n):
+        anchors.setdefault(component[i], i)
+
+    rows = len(measurements) + len(anchors)
+    design = np.zeros((rows, n))
+    observed = np.zeros(rows)
+    base = np.ones(rows)
+    for r, m in enumerate(measurements):
+        design[r, m["target"]] = 1.0
+        design[r, m["reference"]] = -1.0
+        observed[r] = m["offset_seconds"]
+        base[r] = m["confidence"] ** 2
+    for r, i in enumerate(anchors.values(), start=len(measurements)):
+        design[r, i] = 1.0
+        base[r] = 1e6
+
+    weights = base.copy()
+    offsets = np.zeros(n)
+    for _ in range(10):
+        sqrt_w = np.sqrt(weights)
+        offsets, *_ = np.linalg.lstsq(design * sqrt_w[:, None], observed * sqrt_w, rcond=None)
+        residual = design @ offsets - observed
+        robust = 1.0 / (1.0 + np.square(residual / OUTLIER_SECONDS))
+        robust[len(measurements):] = 1.0
+        weights = base * robust
+    residual = np.abs(design @ offsets - observed)[:len(measurements)]
+    return offsets, residual, component
+
+
+def _fingerprint(feed_id: str, samples: np.ndarray, fingerprint_dir: str) -> tuple[np.ndarray, np.ndarray]:
+    """Stored fingerprint of an ingested feed, computing it if missing or corrupt."""
+    stored, _ = _read_fingerprint(feed_id, fingerprint_dir)
+    if stored is None:
+        return fingerprint_samples(samples)
+    return stored[0], stored[1]
+
+
+def solve_feed_offsets(
+    feed_paths: dict[str, str],
+    max_lag_seconds: Optional[float] = None,
+    fingerprint_dir: str = FINGERPRINT_DIR,
+) -> dict:
+    """Sync many feeds from a sparse set of pair correlations.
+
+    Every feed is compared with every other only through the fingerprint
+    index; full-rate correlation runs on the ~2N pairs :func:`select_pairs`
+    keeps, and :func:`solve_offsets` turns them into one consistent offset
+    per feed.  Feeds that only overlap each other in a chain are handled,
+    since no single reference has to overlap everything.
+
+    Returns a dict with:
+        offsets: {feed_id: {"offset_seconds", "confidence", "component"}},
+            offsets relative to the first feed of each component.
+        pairs: every correlation run, with its residual after the solve.
+        components: number of connected groups found.
+    """
+    feed_ids = list(feed_paths)
+    n = len(feed_ids)
+    if n == 0:
+        return {"offsets": {}, "pairs": [], "components": 0}
+
+    audio = run_parallel(lambda fid: load_audio_pcm(feed_paths[fid], SAMPLE_RATE), feed_ids)
+    durations = [len(a) / SAMPLE_RATE for a in audio]
+    fingerprints = {
+        fid: _fingerprint(fid, audio[k], fingerprint_dir) for k, fid in enumerate(feed_ids)
+    }
+    index = FingerprintIndex.from_arrays(fingerprints)
+
+    # Coarse offsets and weights from querying each feed against the others.
+    coarse: dict[tuple[int, int], float] = {}
+    candidates: list[tuple[int, int, float]] = []
+    for j, fid in enumerate(feed_ids):
+        for match in index.query(*fingerprints[fid], top_n=n):
+            i = feed_ids.index(match["feed_id"])
+            if i == j or (j, i) in coarse:
+                continue
+            coarse[(i, j)] = match["offset_seconds"]
+            candidates.append((i, j, float(match["matches"])))
+
+    pairs = select_pairs(n, candidates, durations)
+    logger.info("Solving %d feeds from %d pairs (%d fingerprint candidates)", n, len(pairs), len(candidates))
+
+    measurements = []
+    pair_log = []
+    for i, j in pairs:
+        if audio[i].size == 0 or audio[j].size == 0:
+            continue
+        if (i, j) in coarse:
+            result = refine_offset(audio[i], audio[j], SAMPLE_RATE, coarse[(i, j)], PAIR_SEARCH_SECONDS)
+        elif (j, i) in coarse:
+            result = refine_offset(audio[i], audio[j], SAMPLE_RATE, -coarse[(j, i)], PAIR_SEARCH_SECONDS)
+        else:
+            result = estimate_offset_multires(audio[i], audio[j], SAMPLE_RATE, max_lag_seconds=max_lag_seconds)
+        entry = {"reference": i, "target": j, **result}
+        pair_log.append(entry)
+        if result["confidence"] >= MIN_PAIR_CONFIDENCE:
+            measurements.append(entry)
+
+    offsets, residuals, component = solve_offsets(n, measurements)
+    residual_of = {(m["reference"], m["target"]): r for m, r in zip(measurements, residuals)}
+    confidence = np.zeros(n)
+    for m in measurements:
+        for k in (m["reference"], m["target"]):
+            confidence[k] = max(confidence[k], m["confidence"])
+    labels = {c: k for k, c in enumerate(dict.fromkeys(component))}
+    for k in range(n):
+        if component.count(component[k]) == 1:
+            confidence[k] = 1.0 if k == 0 else 0.0
+
+    return {
+        "offsets": {
+            fid: {
+                "offset_seconds": round(float(offsets[k]), 4),
+                "confidence": round(float(confidence[k]), 4),
+                "component": labels[component[k]],
+            }
+            for k, fid in enumerate(feed_ids)
+        },
+        "pairs": [
+            {
+                "reference": feed_ids[p["reference"]],
+                "target": feed_ids[p["target"]],
+                "offset_seconds": p["offset_seconds"],
+                "confidence": p["confidence"],
+                "used": (p["reference"], p["target"]) in residual_of,
+                "residual": round(float(residual_of.get((p["reference"], p["target"]), 0.0)), 4),
+            }
+            for p in pair_log
+        ],
+        "components": len(labels),
+    }
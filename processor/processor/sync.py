@@ -1,61 +1,801 @@
+import collections
+import contextlib
+import heapq
+import os
+import struct
 import subprocess
 import logging
+import tempfile
+import threading
+import uuid
+from typing import Optional
 
 import numpy as np
 
+from processor.pool import check_cancelled, run_parallel, track_process
+
 logger = logging.getLogger(__name__)
 
+# Rate of the decimated onset envelope used by the coarse offset search.
+ENVELOPE_RATE = 200
+# Below this many envelope frames the coarse search is not worth it.
+MIN_ENVELOPE_FRAMES = 64
+# Coarse lags refined at full rate, and the target excerpt used to refine them.
+COARSE_CANDIDATES = 3
+REFINE_SECONDS = 10.0
+# Size of each read from the ffmpeg PCM pipe.
+PCM_CHUNK_BYTES = 1 << 20
+# Fixed header size for streamed .npy files; fits any 1-D length.
+NPY_HEADER_BYTES = 128
+# Targets correlated per 2-D FFT in batched sync.
+SYNC_BATCH_SIZE = 4
+# Window length and peak budget for the bounded-memory streaming search.
+STREAM_BLOCK_SECONDS = 16.0
+STREAM_TOP_K = 32
+# Memory for the target window spectra the streaming search keeps at once.
+STREAM_SPECTRA_BYTES = 256 << 20
+
+
+class _GrowableSink:
+    """Accumulates samples in one array that is grown in place as needed."""
+
+    def __init__(self, dtype: np.dtype, capacity: int = 1 << 20):
+        self.dtype = dtype
+        self.data = np.empty(capacity, dtype=dtype)
+        self.size = 0
+
+    def reserve(self, count: int) -> np.ndarray:
+        needed = self.size + count
+        if needed > len(self.data):
+            # Large allocations are mremap'd by the allocator, so growing
+            # in place does not need a second full-size buffer.
+            self.data.resize(max(needed, len(self.data) * 3 // 2), refcheck=False)
+        view = self.data[self.size:needed]
+        self.size = needed
+        return view
+
+    def commit(self) -> None:
+        pass
+
+    def finish(self) -> np.ndarray:
+        self.data.resize(self.size, refcheck=False)
+        return self.data
+
+    def discard(self) -> None:
+        self.data = np.empty(0, dtype=self.dtype)
+
+
+class _NpySink:
+    """Streams samples into a ``.npy`` file that is memory-mapped when done.
+
+    The header is written with a fixed width up front and patched with the
+    final length at the end, so samples are appended without ever holding
+    the recording in RAM.
+    """
+
+    def __init__(self, path: str, dtype: np.dtype, chunk_samples: int):
+        self.path = path
+        self.dtype = dtype
+        self.size = 0
+        self.buffer = np.empty(chunk_samples, dtype=dtype)
+        self.file = open(path, "wb")
+        self.file.write(_npy_header(dtype, 0))
+
+    def reserve(self, count: int) -> np.ndarray:
+        if count > len(self.buffer):
+            self.buffer = np.empty(count, dtype=self.dtype)
+        self._pending = self.buffer[:count]
+        self.size += count
+        return self._pending
+
+    def commit(self) -> None:
+        self.file.write(self._pending.tobytes())
+
+    def finish(self) -> np.ndarray:
+        self.file.seek(0)
+        self.file.write(_npy_header(self.dtype, self.size))
+        self.file.close()
+        if self.size == 0:
+            return np.empty(0, dtype=self.dtype)
+        return np.load(self.path, mmap_mode="r")
+
+    def discard(self) -> None:
+        self.file.close()
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
 
-def extract_audio_pcm(video_path: str, sample_rate: int = 16000) -> np.ndarray:
-    """Extract audio from a video file as a numpy array of float32 PCM samples."""
+def _npy_header(dtype: np.dtype, length: int) -> bytes:
+    """Fixed-size (NPY_HEADER_BYTES) version 1.0 ``.npy`` header for a 1-D array."""
+    header = repr({
+        "descr": np.lib.format.dtype_to_descr(np.dtype(dtype)),
+        "fortran_order": False,
+        "shape": (length,),
+    })
+    prefix = np.lib.format.magic(1, 0)
+    pad = NPY_HEADER_BYTES - len(prefix) - 2 - len(header) - 1
+    return prefix + struct.pack("<H", len(header) + pad + 1) + header.encode("latin1") + b" " * pad + b"\n"
+
+
+def extract_audio_pcm(
+    video_path: str,
+    sample_rate: int = 16000,
+    dtype: np.dtype = np.float32,
+    mmap_path: Optional[str] = None,
+    chunk_bytes: int = PCM_CHUNK_BYTES,
+) -> np.ndarray:
+    """Extract mono audio from a video file as a numpy array of PCM samples.
+
+    ffmpeg's s16le output is streamed in ``chunk_bytes`` reads and written
+    straight into the destination, so the only full-length buffer is the
+    result itself.  ``dtype`` selects float32 samples normalized to [-1, 1)
+    or raw int16 samples at half the memory.  With ``mmap_path`` the samples
+    are streamed into a ``.npy`` file there and returned memory-mapped.
+    Returns an empty array if ffmpeg is missing or fails.
+    """
+    dtype = np.dtype(dtype)
     cmd = [
-        "ffmpeg", "-i", video_path,
+        "ffmpeg", "-nostdin", "-v", "error", "-i", video_path,
         "-vn", "-ac", "1",
         "-ar", str(sample_rate),
         "-f", "s16le",
         "-acodec", "pcm_s16le",
         "pipe:1",
     ]
+    check_cancelled()
     try:
-        result = subprocess.run(
-            cmd, capture_output=True, check=True,
-        )
+        proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
     except FileNotFoundError:
         logger.warning("ffmpeg not found; returning empty array")
-        return np.array([], dtype=np.float32)
-    except subprocess.CalledProcessError as exc:
-        logger.error("ffmpeg failed: %s", exc.stderr.decode(errors="replace"))
-        return np.array([], dtype=np.float32)
+        return np.array([], dtype=dtype)
 
-    samples = np.frombuffer(result.stdout, dtype=np.int16).astype(np.float32)
-    # Normalize to [-1, 1]
-    if samples.size > 0:
-        samples /= 32768.0
-    return samples
+    # Drain stderr concurrently so a chatty ffmpeg can never block on it.
+    stderr_tail: collections.deque = collections.deque(maxlen=64)
+    drain = threading.Thread(target=lambda: stderr_tail.extend(proc.stderr), daemon=True)
+    drain.start()
 
+    chunk_bytes -= chunk_bytes % 2
+    if mmap_path:
+        sink = _NpySink(mmap_path, dtype, chunk_bytes // 2)
+    else:
+        sink = _GrowableSink(dtype)
+    carry = b""
+    with track_process(proc):
+        try:
+            while True:
+                data = proc.stdout.read(chunk_bytes)
+                if not data:
+                    break
+                if carry:
+                    data, carry = carry + data, b""
+                if len(data) % 2:
+                    data, carry = data[:-1], data[-1:]
+                raw = np.frombuffer(data, dtype="<i2")
+                out = sink.reserve(len(raw))
+                if dtype == np.int16:
+                    out[:] = raw
+                else:
+                    np.multiply(raw, 1.0 / 32768.0, out=out, casting="unsafe")
+                sink.commit()
+            returncode = proc.wait()
+            check_cancelled()
+        except BaseException:
+            proc.kill()
+            proc.wait()
+            sink.discard()
+            raise
+        finally:
+            proc.stdout.close()
+            drain.join()
+            proc.stderr.close()
 
-def detect_offset(reference_path: str, target_path: str) -> dict:
-    """Detect the audio offset between a reference and target file.
+    if returncode != 0:
+        logger.error("ffmpeg failed: %s", b"".join(stderr_tail).decode(errors="replace"))
+        sink.discard()
+        return np.array([], dtype=dtype)
+    return sink.finish()
+
+
+def load_audio_pcm(
+    video_path: str,
+    sample_rate: int = 16000,
+    dtype: np.dtype = np.int16,
+    mmap_dir: Optional[str] = None,
+) -> np.ndarray:
+    """Like :func:`extract_audio_pcm`, but served from the PCM cache when enabled.
+
+    Cached audio comes back as a read-only memory map, so repeat syncs of the
+    same file skip decoding and share pages through the OS page cache.  When
+    the cache is disabled and ``mmap_dir`` is given, the audio is streamed
+    into a memory-mapped file there instead of RAM.
+    """
+    from processor.cache import get_pcm_cache
+
+    cache = get_pcm_cache()
+    if cache is not None:
+        return cache.load(video_path, sample_rate, dtype)
+    mmap_path = None
+    if mmap_dir:
+        mmap_path = os.path.join(mmap_dir, f"{uuid.uuid4().hex}.npy")
+    return extract_audio_pcm(video_path, sample_rate, dtype, mmap_path=mmap_path)
+
+
+@contextlib.contextmanager
+def _scratch_dir():
+    """Temporary directory for memory-mapped PCM, removed on exit."""
+    with tempfile.TemporaryDirectory(prefix="concert-view-sync-") as path:
+        yield path
+
+
+def _next_fast_len(n: int) -> int:
+    """Return the smallest 5-smooth integer (2^a * 3^b * 5^c) >= n.
+
+    numpy's pocketfft is fastest on lengths with only small prime factors,
+    so zero-padding to one of these avoids pathological prime-sized FFTs.
+    """
+    if n <= 1:
+        return 1
+    best = 1 << (n - 1).bit_length()
+    p5 = 1
+    while p5 < best:
+        p35 = p5
+        while p35 < best:
+            # Smallest power of two that lifts p35 to at least n.
+            quotient = -(-n // p35)
+            candidate = p35 * (1 << (quotient - 1).bit_length())
+            if candidate < best:
+                best = candidate
+            p35 *= 3
+        p5 *= 5
+    return best
 
-    Uses cross-correlation of extracted PCM audio.
+
+def fft_correlate(ref: np.ndarray, tgt: np.ndarray) -> np.ndarray:
+    """Full cross-correlation of ``ref`` and ``tgt`` computed with real FFTs.
+
+    Equivalent to ``np.correlate(ref, tgt, mode="full")`` but O((N+M) log(N+M))
+    instead of O(N*M).  Index ``k`` of the result corresponds to a lag of
+    ``k - (len(tgt) - 1)`` samples.
+    """
+    n, m = len(ref), len(tgt)
+    size = _next_fast_len(n + m - 1)
+    spectrum = np.fft.rfft(ref, size) * np.conj(np.fft.rfft(tgt, size))
+    circular = np.fft.irfft(spectrum, size)
+    # Negative lags wrap around to the end of the circular result.
+    return np.concatenate((circular[size - (m - 1):], circular[:n]))
+
+
+def _running_energy(x: np.ndarray) -> np.ndarray:
+    """Cumulative energy with a leading zero: ``out[i] = sum(x[:i] ** 2)``."""
+    energy = np.empty(len(x) + 1, dtype=np.float64)
+    energy[0] = 0.0
+    np.cumsum(np.square(x, dtype=np.float64), out=energy[1:])
+    return energy
+
+
+def overlap_energy(
+    ref_energy: np.ndarray, tgt_energy: np.ndarray, lags: np.ndarray
+) -> np.ndarray:
+    """Product of the reference and target energies in the region they overlap.
+
+    ``ref_energy``/``tgt_energy`` come from :func:`_running_energy`, so each
+    lag costs O(1) and the whole vector of lags is evaluated without loops.
+    """
+    n, m = len(ref_energy) - 1, len(tgt_energy) - 1
+    lags = np.asarray(lags, dtype=np.int64)
+    ref_lo = np.clip(lags, 0, n)
+    ref_hi = np.clip(lags + m, 0, n)
+    tgt_lo = np.clip(-lags, 0, m)
+    tgt_hi = np.clip(n - lags, 0, m)
+    e_ref = ref_energy[ref_hi] - ref_energy[ref_lo]
+    e_tgt = tgt_energy[tgt_hi] - tgt_energy[tgt_lo]
+    return e_ref * e_tgt
+
+
+def _lag_bounds(n: int, m: int, max_lag: Optional[int]) -> tuple[int, int]:
+    """Inclusive range of lags (in samples) worth searching."""
+    lo, hi = -(m - 1), n - 1
+    if max_lag is not None:
+        lo, hi = max(lo, -max_lag), min(hi, max_lag)
+    return lo, hi
+
+
+def _max_lag_samples(max_lag_seconds: Optional[float], rate: float) -> Optional[int]:
+    if max_lag_seconds is None:
+        return None
+    return int(round(abs(max_lag_seconds) * rate))
+
+
+def _dot(a: np.ndarray, b: np.ndarray, chunk: int = 1 << 18) -> float:
+    """Dot product accumulated in float64 across chunks.
+
+    Float inputs go straight to BLAS per chunk; integer PCM is widened one
+    chunk at a time so large inputs are never copied whole.
+    """
+    widen = not (np.issubdtype(a.dtype, np.floating) and np.issubdtype(b.dtype, np.floating))
+    total = 0.0
+    for i in range(0, len(a), chunk):
+        x, y = a[i:i + chunk], b[i:i + chunk]
+        if widen:
+            x, y = x.astype(np.float64), y.astype(np.float64)
+        total += float(np.dot(x, y))
+    return total
+
+
+def overlap_confidence(ref: np.ndarray, tgt: np.ndarray, lag: int) -> float:
+    """Normalized correlation of ``ref`` and ``tgt`` over their overlap at ``lag``."""
+    t0, t1 = max(0, -lag), min(len(tgt), len(ref) - lag)
+    if t1 <= t0:
+        return 0.0
+    r, t = ref[t0 + lag:t1 + lag], tgt[t0:t1]
+    norm = np.sqrt(_dot(r, r) * _dot(t, t))
+    return min(abs(_dot(r, t)) / float(norm), 1.0) if norm > 0 else 0.0
+
+
+def _pick_peak(
+    correlation: np.ndarray,
+    n: int,
+    m: int,
+    max_lag: Optional[int],
+    ref_energy: np.ndarray,
+    tgt_energy: np.ndarray,
+) -> tuple[int, float]:
+    """Best lag in a "full" correlation and its overlap-normalized confidence."""
+    lo, hi = _lag_bounds(n, m, max_lag)
+    base = m - 1
+    window = np.abs(correlation[lo + base:hi + base + 1])
+    peak = int(np.argmax(window))
+    lag = lo + peak
+    norm = float(np.sqrt(overlap_energy(ref_energy, tgt_energy, np.array([lag]))[0]))
+    confidence = min(float(window[peak]) / norm, 1.0) if norm > 0 else 0.0
+    return lag, confidence
+
+
+def _offset_result(lag: int, confidence: float, sample_rate: int) -> dict:
+    return {
+        "offset_seconds": round(lag / sample_rate, 4),
+        "confidence": round(float(confidence), 4),
+    }
+
+
+def estimate_offset(
+    ref: np.ndarray,
+    tgt: np.ndarray,
+    sample_rate: int,
+    max_lag_seconds: Optional[float] = None,
+) -> dict:
+    """Estimate the offset of ``tgt`` relative to ``ref`` from PCM arrays.
+
+    Exhaustive search over every lag (or every lag within ``max_lag_seconds``).
+    A positive offset means the target's audio appears ``offset_seconds``
+    into the reference.  Confidence is the normalized correlation at the
+    peak, computed over the overlapping region only.
     Returns {"offset_seconds": float, "confidence": float}.
     """
-    sample_rate = 16000
-    ref = extract_audio_pcm(reference_path, sample_rate)
-    tgt = extract_audio_pcm(target_path, sample_rate)
+    if ref.size == 0 or tgt.size == 0:
+        return {"offset_seconds": 0.0, "confidence": 0.0}
+
+    lag, confidence = _pick_peak(
+        fft_correlate(ref, tgt), len(ref), len(tgt),
+        _max_lag_samples(max_lag_seconds, sample_rate),
+        _running_energy(ref), _running_energy(tgt),
+    )
+    return _offset_result(lag, confidence, sample_rate)
+
+
+def onset_envelope(
+    x: np.ndarray, sample_rate: int, envelope_rate: int = ENVELOPE_RATE
+) -> np.ndarray:
+    """Decimate PCM to a zero-mean onset-strength envelope at ``envelope_rate`` Hz.
+
+    Each frame of ``sample_rate // envelope_rate`` samples is reduced to its
+    log energy; the half-wave rectified first difference of that curve marks
+    note and drum onsets, which survive camera-to-camera EQ and level changes
+    far better than raw waveforms.
+    """
+    hop = max(1, sample_rate // envelope_rate)
+    frames = len(x) // hop
+    energy = np.empty(frames, dtype=np.float64)
+    chunk = max(1, (1 << 20) // hop)
+    for i in range(0, frames, chunk):
+        block = x[i * hop:min(i + chunk, frames) * hop].astype(np.float64).reshape(-1, hop)
+        energy[i:i + len(block)] = np.einsum("ij,ij->i", block, block) / hop
+    log_energy = np.log10(energy + 1e-10)
+    onset = np.maximum(np.diff(log_energy, prepend=log_energy[:1]), 0.0)
+    return onset - onset.mean() if onset.size else onset
 
+
+def _top_peaks(values: np.ndarray, count: int, min_distance: int) -> list[int]:
+    """Indices of the ``count`` largest values at least ``min_distance`` apart."""
+    values = values.copy()
+    peaks: list[int] = []
+    for _ in range(count):
+        idx = int(np.argmax(values))
+        if not np.isfinite(values[idx]):
+            break
+        peaks.append(idx)
+        values[max(0, idx - min_distance):idx + min_distance + 1] = -np.inf
+    return peaks
+
+
+def correlate_lag_window(
+    ref: np.ndarray, tgt: np.ndarray, lag_lo: int, lag_hi: int, t0: int, t1: int
+) -> np.ndarray:
+    """Correlation of ``tgt[t0:t1]`` against ``ref`` for lags ``lag_lo..lag_hi`` only.
+
+    Reference samples outside ``ref`` count as silence, so the cost is one FFT
+    over the excerpt plus the lag window instead of over both full signals.
+    """
+    excerpt = tgt[t0:t1].astype(np.float64)
+    a, b = t0 + lag_lo, t1 + lag_hi
+    segment = np.zeros(b - a, dtype=np.float64)
+    src_lo, src_hi = max(a, 0), min(b, len(ref))
+    if src_hi > src_lo:
+        segment[src_lo - a:src_hi - a] = ref[src_lo:src_hi]
+    # Circular correlation is exact for the lags we keep, so no extra padding.
+    size = _next_fast_len(len(segment))
+    spectrum = np.fft.rfft(segment, size) * np.conj(np.fft.rfft(excerpt, size))
+    return np.fft.irfft(spectrum, size)[:lag_hi - lag_lo + 1]
+
+
+def _shortlist(
+    coarse: np.ndarray, n: int, m: int, max_lag: Optional[int], candidates: int
+) -> list[int]:
+    """Best ``candidates`` lags of a "full" envelope correlation."""
+    lo, hi = _lag_bounds(n, m, max_lag)
+    base = m - 1
+    return [lo + peak for peak in _top_peaks(coarse[lo + base:hi + base + 1], candidates, 2)]
+
+
+def _refine(
+    ref: np.ndarray,
+    tgt: np.ndarray,
+    centers: list[int],
+    radius: int,
+    max_lag: Optional[int],
+    excerpt_len: int,
+) -> Optional[int]:
+    """Refine candidate lags at full rate and return the best one.
+
+    Each candidate lag (in samples) is searched ``radius`` samples either side
+    using an ``excerpt_len`` slice from the middle of the target's overlap
+    with the reference.  Returns None if no candidate leaves any overlap.
+    """
+    lag_lo_limit, lag_hi_limit = _lag_bounds(len(ref), len(tgt), max_lag)
+    best_lag, best_score = None, -1.0
+    for center in centers:
+        lag_lo = max(center - radius, lag_lo_limit)
+        lag_hi = min(center + radius, lag_hi_limit)
+        if lag_hi < lag_lo:
+            continue
+        o0, o1 = max(0, -center), min(len(tgt), len(ref) - center)
+        if o1 <= o0:
+            continue
+        mid = (o0 + o1) // 2
+        t0 = max(o0, mid - excerpt_len // 2)
+        t1 = min(o1, t0 + excerpt_len)
+        values = np.abs(correlate_lag_window(ref, tgt, lag_lo, lag_hi, t0, t1))
+        lag = lag_lo + int(np.argmax(values))
+        score = overlap_confidence(ref, tgt[t0:t1], t0 + lag)
+        if score > best_score:
+            best_lag, best_score = lag, score
+    return best_lag
+
+
+def refine_offset(
+    ref: np.ndarray,
+    tgt: np.ndarray,
+    sample_rate: int,
+    coarse_offset_seconds: float,
+    search_seconds: float = 0.1,
+) -> dict:
+    """Full-rate offset search within ``search_seconds`` of a coarse estimate.
+
+    For verifying candidates from a cheaper matcher (onset envelopes or the
+    fingerprint index) without correlating the whole recordings.
+    Returns {"offset_seconds": float, "confidence": float}.
+    """
     if ref.size == 0 or tgt.size == 0:
-        logger.warning("Could not extract audio; returning mock offset")
         return {"offset_seconds": 0.0, "confidence": 0.0}
+    center = int(round(coarse_offset_seconds * sample_rate))
+    radius = max(1, int(search_seconds * sample_rate))
+    lag = _refine(ref, tgt, [center], radius, None, int(REFINE_SECONDS * sample_rate))
+    if lag is None:
+        return {"offset_seconds": round(coarse_offset_seconds, 4), "confidence": 0.0}
+    return _offset_result(lag, overlap_confidence(ref, tgt, lag), sample_rate)
+
+
+def estimate_offset_multires(
+    ref: np.ndarray,
+    tgt: np.ndarray,
+    sample_rate: int,
+    max_lag_seconds: Optional[float] = None,
+    envelope_rate: int = ENVELOPE_RATE,
+    candidates: int = COARSE_CANDIDATES,
+    refine_seconds: float = REFINE_SECONDS,
+) -> dict:
+    """Coarse-to-fine offset search.
+
+    The onset envelopes of both signals are correlated at ``envelope_rate``
+    Hz to shortlist ``candidates`` lags.  Each candidate is then refined at the
+    full sample rate over a few envelope frames, using a ``refine_seconds``
+    excerpt of the target, and the best refined lag wins.  Signals too short
+    for a meaningful envelope fall back to :func:`estimate_offset`.
+    Returns {"offset_seconds": float, "confidence": float}.
+    """
+    if ref.size == 0 or tgt.size == 0:
+        return {"offset_seconds": 0.0, "confidence": 0.0}
+
+    hop = max(1, sample_rate // envelope_rate)
+    env_ref = onset_envelope(ref, sample_rate, envelope_rate)
+    env_tgt = onset_envelope(tgt, sample_rate, envelope_rate)
+    if min(len(env_ref), len(env_tgt)) < MIN_ENVELOPE_FRAMES:
+        return estimate_offset(ref, tgt, sample_rate, max_lag_seconds)
+
+    max_lag = _max_lag_samples(max_lag_seconds, sample_rate)
+    max_env_lag = None if max_lag is None else max_lag // hop + 1
+    coarse_lags = _shortlist(
+        fft_correlate(env_ref, env_tgt), len(env_ref), len(env_tgt), max_env_lag, candidates,
+    )
+    lag = _refine(
+        ref, tgt, [c * hop for c in coarse_lags], 2 * hop, max_lag, int(refine_seconds * sample_rate),
+    )
+    if lag is None:
+        return estimate_offset(ref, tgt, sample_rate, max_lag_seconds)
+    return _offset_result(lag, overlap_confidence(ref, tgt, lag), sample_rate)
+
+
+def _iter_correlations(ref: np.ndarray, targets: list[np.ndarray], batch_size: int):
+    """Yield ``(index, correlation)`` of ``ref`` against each target.
+
+    The reference spectrum is computed once and every batch of targets is
+    transformed and multiplied as one 2-D FFT.  Work is done in float32 to
+    halve the size of the per-batch buffers.  Correlations use the same
+    "full" layout as :func:`fft_correlate`.
+    """
+    if not targets:
+        return
+    n = len(ref)
+    size = _next_fast_len(n + max(len(t) for t in targets) - 1)
+    ref_spectrum = np.fft.rfft(np.asarray(ref, dtype=np.float32), size)
+    for start in range(0, len(targets), batch_size):
+        batch = targets[start:start + batch_size]
+        block = np.zeros((len(batch), size), dtype=np.float32)
+        for row, tgt in enumerate(batch):
+            block[row, :len(tgt)] = tgt
+        spectra = np.conj(np.fft.rfft(block, axis=-1))
+        del block
+        spectra *= ref_spectrum
+        circular = np.fft.irfft(spectra, size, axis=-1)
+        del spectra
+        for row, tgt in enumerate(batch):
+            m = len(tgt)
+            yield start + row, np.concatenate((circular[row, size - (m - 1):], circular[row, :n]))
+
+
+def estimate_offsets_batch(
+    ref: np.ndarray,
+    targets: list[np.ndarray],
+    sample_rate: int,
+    method: str = "multires",
+    max_lag_seconds: Optional[float] = None,
+    batch_size: int = SYNC_BATCH_SIZE,
+) -> list[dict]:
+    """Estimate the offset of every target against one reference.
+
+    Same search as :func:`estimate_offset` ("fft") or
+    :func:`estimate_offset_multires` ("multires"), but the reference is
+    transformed (or reduced to its onset envelope) once for all targets.
+    "streaming" runs :func:`estimate_offset_streaming` per target.
+    Returns one {"offset_seconds", "confidence"} dict per target, in order.
+    """
+    if method not in SYNC_METHODS:
+        raise ValueError(f"Unknown sync method '{method}'. Choose from: {', '.join(SYNC_METHODS)}")
+
+    results = [{"offset_seconds": 0.0, "confidence": 0.0} for _ in targets]
+    valid = [i for i, tgt in enumerate(targets) if tgt.size > 0]
+    if ref.size == 0 or not valid:
+        return results
+
+    max_lag = _max_lag_samples(max_lag_seconds, sample_rate)
+    if method == "streaming":
+        for i in valid:
+            results[i] = estimate_offset_streaming(ref, targets[i], sample_rate, max_lag_seconds)
+        return results
 
-    # Cross-correlation via numpy
-    correlation = np.correlate(ref, tgt, mode="full")
-    peak_index = int(np.argmax(np.abs(correlation)))
-    offset_samples = peak_index - (len(tgt) - 1)
-    offset_seconds = offset_samples / sample_rate
+    if method == "fft":
+        ref_energy = _running_energy(ref)
+        chosen = [targets[i] for i in valid]
+        for idx, correlation in _iter_correlations(ref, chosen, batch_size):
+            tgt = chosen[idx]
+            lag, confidence = _pick_peak(
+                correlation, len(ref), len(tgt), max_lag, ref_energy, _running_energy(tgt),
+            )
+            results[valid[idx]] = _offset_result(lag, confidence, sample_rate)
+        return results
 
-    peak_value = float(np.abs(correlation[peak_index]))
-    norm = float(np.sqrt(np.sum(ref ** 2) * np.sum(tgt ** 2)))
-    confidence = peak_value / norm if norm > 0 else 0.0
+    hop = max(1, sample_rate // ENVELOPE_RATE)
+    env_ref = onset_envelope(ref, sample_rate)
+    envelopes = {i: onset_envelope(targets[i], sample_rate) for i in valid}
+    coarse_ok = [i for i in valid if min(len(env_ref), len(envelopes[i])) >= MIN_ENVELOPE_FRAMES]
+    for i in set(valid) - set(coarse_ok):
+        results[i] = estimate_offset(ref, targets[i], sample_rate, max_lag_seconds)
+
+    max_env_lag = None if max_lag is None else max_lag // hop + 1
+    excerpt_len = int(REFINE_SECONDS * sample_rate)
+    chosen = [envelopes[i] for i in coarse_ok]
+    for idx, coarse in _iter_correlations(env_ref, chosen, batch_size):
+        i = coarse_ok[idx]
+        tgt = targets[i]
+        coarse_lags = _shortlist(
+            coarse, len(env_ref), len(chosen[idx]), max_env_lag, COARSE_CANDIDATES,
+        )
+        lag = _refine(ref, tgt, [c * hop for c in coarse_lags], 2 * hop, max_lag, excerpt_len)
+        if lag is None:
+            results[i] = estimate_offset(ref, tgt, sample_rate, max_lag_seconds)
+        else:
+            results[i] = _offset_result(lag, overlap_confidence(ref, tgt, lag), sample_rate)
+    return results
+
+
+def _window_score(
+    seg: np.ndarray, window_len: int, window_energy: float, raw: np.ndarray
+) -> tuple[int, float]:
+    """Raw correlation peak of one overlap-save step and its normalized score."""
+    idx = int(np.argmax(np.abs(raw)))
+    aligned = seg[idx:idx + window_len]
+    norm = np.sqrt(window_energy * float(np.dot(aligned, aligned)))
+    return idx, (abs(float(raw[idx])) / norm if norm > 0 else 0.0)
+
+
+def estimate_offset_streaming(
+    ref: np.ndarray,
+    tgt: np.ndarray,
+    sample_rate: int,
+    max_lag_seconds: Optional[float] = None,
+    block_seconds: float = STREAM_BLOCK_SECONDS,
+    top_k: int = STREAM_TOP_K,
+) -> dict:
+    """Block-wise overlap-save offset search with memory bounded by the block size.
+
+    The target is cut into ``block_seconds`` windows and matched against the
+    reference by overlap-save.  The reference is read one block at a time
+    (so memory-mapped PCM is paged in, never loaded whole) and each block is
+    transformed once per group of windows, then multiplied with the spectrum
+    of every window in the group that can align with it; groups are sized so
+    their spectra fit STREAM_SPECTRA_BYTES.  The strongest normalized peak of
+    every (block, window) product is offered to a running top-``k`` heap of
+    (score, lag) pairs.  The lag with the most accumulated score across
+    windows wins, and its confidence is measured over the full overlap with
+    chunked dot products.
+    Returns {"offset_seconds": float, "confidence": float}.
+    """
+    if ref.size == 0 or tgt.size == 0:
+        return {"offset_seconds": 0.0, "confidence": 0.0}
+
+    n, m = len(ref), len(tgt)
+    block = max(1, min(int(block_seconds * sample_rate), m))
+    size = _next_fast_len(2 * block)
+    step = size - block + 1
+    lag_lo, lag_hi = _lag_bounds(n, m, _max_lag_samples(max_lag_seconds, sample_rate))
+    group = max(1, STREAM_SPECTRA_BYTES // ((size // 2 + 1) * 16))
+    # A trailing window shorter than a quarter block is too weak to score.
+    starts = [w0 for w0 in range(0, m, block) if m - w0 >= block // 4]
+
+    heap: list[tuple[float, int]] = []
+    seg = np.zeros(size, dtype=np.float64)
+    for g0 in range(0, len(starts), group):
+        windows = []
+        for w0 in starts[g0:g0 + group]:
+            window = np.asarray(tgt[w0:w0 + block], dtype=np.float64)
+            window_energy = float(np.dot(window, window))
+            # Reference positions this window can align with, within the lag bounds.
+            q_lo = max(w0 + lag_lo, -(len(window) - 1))
+            q_hi = min(w0 + lag_hi, n - 1)
+            if window_energy == 0.0 or q_lo > q_hi:
+                continue
+            windows.append((w0, len(window), window_energy, q_lo, q_hi, np.conj(np.fft.rfft(window, size))))
+        if not windows:
+            continue
+        for p in range(min(w[3] for w in windows), max(w[4] for w in windows) + 1, step):
+            seg[:] = 0.0
+            src_lo, src_hi = max(p, 0), min(p + size, n)
+            if src_hi > src_lo:
+                seg[src_lo - p:src_hi - p] = ref[src_lo:src_hi]
+            block_spectrum = None
+            for w0, window_len, window_energy, q_lo, q_hi, window_spectrum in windows:
+                lo, hi = max(q_lo, p), min(q_hi, p + step - 1)
+                if lo > hi:
+                    continue
+                if block_spectrum is None:
+                    block_spectrum = np.fft.rfft(seg)
+                raw = np.fft.irfft(block_spectrum * window_spectrum, size)[lo - p:hi - p + 1]
+                idx, score = _window_score(seg[lo - p:], window_len, window_energy, raw)
+                entry = (score, lo + idx - w0)
+                if len(heap) < top_k:
+                    heapq.heappush(heap, entry)
+                elif entry > heap[0]:
+                    heapq.heapreplace(heap, entry)
+
+    if not heap:
+        return {"offset_seconds": 0.0, "confidence": 0.0}
+
+    # Vote: windows agreeing on a lag (within a millisecond) pool their scores.
+    tolerance = max(1, sample_rate // 1000)
+    votes: dict[int, float] = {}
+    for score, lag in heap:
+        anchor = next((a for a in votes if abs(a - lag) <= tolerance), lag)
+        votes[anchor] = votes.get(anchor, 0.0) + score
+    winner = max(votes, key=votes.get)
+    lag = max((e for e in heap if abs(e[1] - winner) <= tolerance))[1]
+    return _offset_result(lag, overlap_confidence(ref, tgt, lag), sample_rate)
+
+
+SYNC_METHODS = {
+    "multires": estimate_offset_multires,
+    "fft": estimate_offset,
+    "streaming": estimate_offset_streaming,
+}
+
+
+def detect_offset(
+    reference_path: str,
+    target_path: str,
+    method: str = "multires",
+    max_lag_seconds: Optional[float] = None,
+) -> dict:
+    """Detect the audio offset between a reference and target file.
+
+    ``method`` selects the search: "multires" (coarse onset envelopes, then a
+    full-rate refinement around the best candidates), "fft" (exhaustive FFT
+    cross-correlation) or "streaming" (block-wise overlap-save over
+    memory-mapped PCM, for recordings too long to hold in RAM).
+    ``max_lag_seconds`` caps the offsets considered.
+    Returns {"offset_seconds": float, "confidence": float}.
+    """
+    if method not in SYNC_METHODS:
+        raise ValueError(f"Unknown sync method '{method}'. Choose from: {', '.join(SYNC_METHODS)}")
+
+    sample_rate = 16000
+    with _scratch_dir() as scratch:
+        # int16 storage halves memory; every search path widens chunks on demand.
+        # The streaming search additionally needs memory maps, never in-RAM arrays.
+        mmap_dir = scratch if method == "streaming" else None
+        ref = load_audio_pcm(reference_path, sample_rate, mmap_dir=mmap_dir)
+        tgt = load_audio_pcm(target_path, sample_rate, mmap_dir=mmap_dir)
+
+        if ref.size == 0 or tgt.size == 0:
+            logger.warning("Could not extract audio; returning mock offset")
+            return {"offset_seconds": 0.0, "confidence": 0.0}
+
+        return SYNC_METHODS[method](ref, tgt, sample_rate, max_lag_seconds=max_lag_seconds)
+
+
+def detect_offsets_batch(
+    reference_path: str,
+    target_paths: list[str],
+    method: str = "multires",
+    max_lag_seconds: Optional[float] = None,
+) -> list[dict]:
+    """Detect the offset of every target file against one reference file.
+
+    All files are decoded concurrently on the shared ffmpeg pool, then
+    every target is correlated against the reference, whose spectrum or
+    envelope is computed only once.  Returns one {"offset_seconds",
+    "confidence"} dict per target, in order.
+    """
+    if method not in SYNC_METHODS:
+        raise ValueError(f"Unknown sync method '{method}'. Choose from: {', '.join(SYNC_METHODS)}")
+
+    sample_rate = 16000
+    paths = [reference_path] + list(target_paths)
+    with _scratch_dir() as scratch:
+        mmap_dir = scratch if method == "streaming" else None
+        pcm = run_parallel(lambda path: load_audio_pcm(path, sample_rate, mmap_dir=mmap_dir), paths)
 
-    return {"offset_seconds": round(offset_seconds, 4), "confidence": round(confidence, 4)}
+        ref, targets = pcm[0], pcm[1:]
+        if ref.size == 0:
+            logger.warning("Could not extract reference audio; returning mock offsets")
+        return estimate_offsets_batch(ref, targets, sample_rate, method, max_lag_seconds)
@@ -0,0 +1,59 @@
+import os
+import subprocess
+import logging
+
+from processor.media import input_args
+from processor.pool import run_ffmpeg, run_parallel
+
+logger = logging.getLogger(__name__)
+
+
+def extract_thumbnail(
+    video_path: str,
+    output_path: str,
+    time_seconds: float = 1.0,
+    width: int = 320,
+) -> str:
+    """Grab a single scaled frame at ``time_seconds`` as a JPEG.
+
+    Seeks on the input side so only the frames around the timestamp are
+    decoded.  Returns the output path on success or an error string.
+    """
+    seek, _ = input_args(video_path, time_seconds)
+    cmd = [
+        "ffmpeg", "-nostdin", "-y", *seek,
+        "-frames:v", "1", "-vf", f"scale={width}:-2",
+        "-q:v", "4",
+        output_path,
+    ]
+    try:
+        run_ffmpeg(cmd)
+    except FileNotFoundError:
+        logger.warning("ffmpeg not found")
+        return "error: ffmpeg not available"
+    except subprocess.CalledProcessError as exc:
+        msg = exc.stderr.decode(errors="replace")
+        logger.error("extract_thumbnail failed: %s", msg)
+        return f"error: {msg[:200]}"
+    return output_path
+
+
+def extract_thumbnails(
+    feed_paths: dict[str, str],
+    output_dir: str,
+    time_seconds: float = 1.0,
+    width: int = 320,
+) -> dict[str, str]:
+    """Thumbnail every feed at once on the shared ffmpeg pool.
+
+    Returns {feed_id: output path or error string}.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    feed_ids = list(feed_paths)
+    results = run_parallel(
+        lambda fid: extract_thumbnail(
+            feed_paths[fid], os.path.join(output_dir, f"{fid}.jpg"), time_seconds, width
+        ),
+        feed_ids,
+    )
+    return dict(zip(feed_ids, results))
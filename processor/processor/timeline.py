@@ -1,89 +1,221 @@
+import re
 import subprocess
 import logging
+from typing import Optional
+
+from processor.media import SEEK_MODES, input_args, lead_in_filters, trim_filters
+from processor.pool import run_ffmpeg
 
 logger = logging.getLogger(__name__)
 
 
-def render_timeline(project: dict, feed_paths: dict[str, str], output_path: str) -> str:
-    """Render a project timeline by concatenating and trimming clips in order.
+def _warp_knots(offset_map) -> list[dict]:
+    """Accept either a full drift result or its bare list of warp knots."""
+    if isinstance(offset_map, dict):
+        return offset_map.get("warp", [])
+    return offset_map or []
 
-    Each clip in the timeline is trimmed to [trim_start, trim_end] (if set),
-    then placed at its ``timeline_start`` position in the output.  Gaps between
-    clips are filled with black/silence.
 
-    Args:
-        project: Project dict with 'clips', 'output_width', 'output_height'.
-        feed_paths: Mapping of feed_id to local file path.
-        output_path: Destination file path.
+def drift_corrected_trim(
+    clip: dict, offset_map
+) -> tuple[Optional[float], Optional[float], float]:
+    """Map a clip's reference-clock trims onto its drifting source clock.
 
-    Returns:
-        The output file path on success, or an error string.
+    Returns (source_start, source_end, speed) where ``speed`` is how much the
+    source must be slowed down (>1) or sped up (<1) so that it spans exactly
+    the reference-clock duration.  Without a usable map the trims pass
+    through unchanged at speed 1.
+    """
+    from processor.drift import offset_at, reference_to_source
+
+    trim_start, trim_end = clip.get("trim_start"), clip.get("trim_end")
+    warp = _warp_knots(offset_map)
+    if not warp:
+        return trim_start, trim_end, 1.0
+
+    src_start = reference_to_source(warp, trim_start) if trim_start is not None else None
+    src_end = reference_to_source(warp, trim_end) if trim_end is not None else None
+    if src_start is not None and src_end is not None and src_end > src_start:
+        speed = (trim_end - trim_start) / (src_end - src_start)
+    else:
+        # Local drift rate around the start of the clip.
+        t0 = src_start or 0.0
+        speed = 1.0 + (offset_at(warp, t0 + 1.0) - offset_at(warp, t0))
+    return src_start, src_end, speed
+
+
+# "graph" renders every clip through one filter graph; "copy" stream-copies
+# clips cut on keyframes; "smart" also copies the keyframe-aligned middle of
+# every other compatible clip and re-encodes only its partial GOPs.
+RENDER_MODES = ("graph", "copy", "smart")
+
+# A feed's next clip reuses its open input if it starts within this many
+# seconds after the previous one ends; larger jumps seek a new input instead.
+GROUP_GAP_SECONDS = 30.0
+
+
+def _group_inputs(windows: list[dict], seek_mode: str) -> list[dict]:
+    """Assign clips to shared inputs, one decoder per group instead of per clip.
+
+    A feed's clips (in timeline order) share an input while each starts at
+    or after the previous one's end.  Clips that jump backwards in the
+    source start a new group in either seek mode, which keeps ``split`` from
+    buffering decoded frames for a branch that is not yet being read.  In
+    "input" mode a clip more than GROUP_GAP_SECONDS past the previous one
+    also starts a new group, so the shared input is seeked once and decodes
+    little that is thrown away; "filter" mode inputs are never seeked, so a
+    new one would only decode the same gap again.
+    """
+    groups: list[dict] = []
+    open_group: dict[str, dict] = {}
+    for idx, w in enumerate(windows):
+        start = max(w["start"] or 0.0, 0.0)
+        group = open_group.get(w["feed_id"])
+        if group is not None:
+            last_end = group["end"]
+            if last_end is None or start < last_end:
+                group = None
+            elif seek_mode == "input" and start - last_end > GROUP_GAP_SECONDS:
+                group = None
+        if group is None:
+            group = {
+                "index": len(groups),
+                "path": w["path"],
+                "start": start if seek_mode == "input" else 0.0,
+                "end": w["end"],
+                "clips": [],
+            }
+            groups.append(group)
+            open_group[w["feed_id"]] = group
+        elif w["end"] is None or group["end"] is None:
+            group["end"] = None
+        else:
+            group["end"] = max(group["end"], w["end"])
+        group["clips"].append(idx)
+        w["group"] = group["index"]
+    if seek_mode == "filter":
+        for group in groups:
+            group["end"] = None
+    return groups
+
+
+def _peak_rss_kb(stderr: bytes) -> Optional[int]:
+    """Peak resident memory ffmpeg reports under ``-benchmark``, in kB."""
+    match = re.search(rb"maxrss=(\d+)kB", stderr or b"")
+    return int(match.group(1)) if match else None
+
+
+def compile_timeline(
+    project: dict,
+    feed_paths: dict[str, str],
+    offset_maps: Optional[dict] = None,
+    seek_mode: str = "input",
+) -> tuple[list[str], list[str], dict]:
+    """Compile a project timeline into ffmpeg input arguments and a filter graph.
+
+    Clips that share a feed share an ffmpeg input (see
+    :func:`_group_inputs`); each input's streams are fanned out with
+    ``split``/``asplit`` and every branch is cut with ``trim``/``atrim``
+    relative to where the input was seeked.  The graph's outputs are
+    labelled ``[outv]`` and ``[outa]``.
+
+    Returns (input_args, filter_parts, stats) with "clips", "inputs" and
+    "decoders" (one video and one audio decoder per input) in stats.
+    Raises ValueError if there is nothing to render.
     """
+    offset_maps = offset_maps or {}
     clips = project.get("clips", [])
     out_w = project.get("output_width", 1920)
     out_h = project.get("output_height", 1080)
-
     if not clips:
-        return "error: no clips defined in project"
-
-    # Build a concat-based filter graph: trim each clip, scale, then concat.
-    inputs: list[str] = []
-    filter_parts: list[str] = []
+        raise ValueError("no clips defined in project")
+    if seek_mode not in SEEK_MODES:
+        raise ValueError(f"unknown seek mode '{seek_mode}'")
 
-    valid_clips = []
+    windows = []
     for clip in clips:
         feed_id = clip.get("feed_id")
         path = feed_paths.get(feed_id)
         if not path:
             logger.warning("No file for feed_id=%s, skipping", feed_id)
             continue
-        valid_clips.append((clip, path))
-
-    if not valid_clips:
-        return "error: no valid feeds for project"
-
-    for idx, (clip, path) in enumerate(valid_clips):
-        inputs.extend(["-i", path])
-        trim_start = clip.get("trim_start")
-        trim_end = clip.get("trim_end")
-
-        # Build per-clip video filter chain
-        v_chain = f"[{idx}:v]"
-        a_chain = f"[{idx}:a]"
-
-        trim_opts = ""
-        atrim_opts = ""
-        if trim_start is not None:
-            trim_opts += f":start={trim_start}"
-            atrim_opts += f":start={trim_start}"
-        if trim_end is not None:
-            trim_opts += f":end={trim_end}"
-            atrim_opts += f":end={trim_end}"
-
-        v_label = f"v{idx}"
-        a_label = f"a{idx}"
-
-        if trim_opts:
-            filter_parts.append(
-                f"{v_chain}trim{trim_opts},setpts=PTS-STARTPTS,scale={out_w}:{out_h}[{v_label}]"
-            )
-            filter_parts.append(
-                f"{a_chain}atrim{atrim_opts},asetpts=PTS-STARTPTS[{a_label}]"
-            )
+        start, end, speed = drift_corrected_trim(clip, offset_maps.get(feed_id))
+        windows.append({"feed_id": feed_id, "path": path, "start": start, "end": end, "speed": speed})
+
+    if not windows:
+        raise ValueError("no valid feeds for project")
+
+    # Build a concat-based filter graph: cut each clip, scale, then concat.
+    groups = _group_inputs(windows, seek_mode)
+    inputs: list[str] = []
+    filter_parts: list[str] = []
+    branch: dict[int, tuple[str, str]] = {}
+    for g, group in enumerate(groups):
+        if seek_mode == "input":
+            args, _ = input_args(group["path"], group["start"] or None, group["end"])
         else:
-            filter_parts.append(
-                f"{v_chain}scale={out_w}:{out_h}[{v_label}]"
-            )
-            filter_parts.append(f"{a_chain}asetpts=PTS-STARTPTS[{a_label}]")
+            args = ["-i", group["path"]]
+        inputs.extend(args)
+        k = len(group["clips"])
+        if k == 1:
+            branch[group["clips"][0]] = (f"[{g}:v]", f"[{g}:a]")
+            continue
+        filter_parts.append(f"[{g}:v]split={k}" + "".join(f"[g{g}v{j}]" for j in range(k)))
+        filter_parts.append(f"[{g}:a]asplit={k}" + "".join(f"[g{g}a{j}]" for j in range(k)))
+        for j, idx in enumerate(group["clips"]):
+            branch[idx] = (f"[g{g}v{j}]", f"[g{g}a{j}]")
+
+    for idx, w in enumerate(windows):
+        group = groups[w["group"]]
+        lead_in = -w["start"] if w["start"] is not None and w["start"] < 0 else 0.0
+        rel_start = max(w["start"] or 0.0, 0.0) - group["start"]
+        rel_end = w["end"] - group["start"] if w["end"] is not None else None
+        shared = len(group["clips"]) > 1 or seek_mode == "filter"
+        trim_v, trim_a = trim_filters(rel_start if rel_start > 0 else None, rel_end) if shared else ("", "")
+        lead_v, lead_a = lead_in_filters(lead_in)
 
-    n = len(valid_clips)
+        v_chain = f"{trim_v}setpts=PTS-STARTPTS,{lead_v}"
+        a_chain = f"{trim_a}asetpts=PTS-STARTPTS,{lead_a}"
+        if abs(w["speed"] - 1.0) > 1e-7:
+            v_chain += f"setpts=PTS*{w['speed']:.9f},"
+            a_chain += f"atempo={1.0 / w['speed']:.9f},"
+        v_in, a_in = branch[idx]
+        filter_parts.append(f"{v_in}{v_chain}scale={out_w}:{out_h}[v{idx}]")
+        filter_parts.append(f"{a_in}{a_chain.rstrip(',')}[a{idx}]")
+
+    n = len(windows)
     v_inputs = "".join(f"[v{i}]" for i in range(n))
     a_inputs = "".join(f"[a{i}]" for i in range(n))
     filter_parts.append(f"{v_inputs}{a_inputs}concat=n={n}:v=1:a=1[outv][outa]")
+    return inputs, filter_parts, {"clips": n, "inputs": len(groups), "decoders": 2 * len(groups)}
+
+
+def render_timeline_detailed(
+    project: dict,
+    feed_paths: dict[str, str],
+    output_path: str,
+    offset_maps: Optional[dict] = None,
+    seek_mode: str = "input",
+) -> dict:
+    """Render a project timeline and report the resources the render used.
+
+    See :func:`render_timeline` for the arguments and
+    :func:`compile_timeline` for how the graph is built.
+
+    Returns a dict with "result" (output path or error string), "clips",
+    "inputs", "decoders" (one video and one audio decoder per input) and
+    "peak_rss_kb" (ffmpeg's peak memory, when it reported one).
+    """
+    report: dict = {"result": "", "clips": 0, "inputs": 0, "decoders": 0, "peak_rss_kb": None}
+    try:
+        inputs, filter_parts, stats = compile_timeline(project, feed_paths, offset_maps, seek_mode)
+    except ValueError as exc:
+        return {**report, "result": f"error: {exc}"}
+    report.update(stats)
 
     filter_complex = ";".join(filter_parts)
     cmd = (
-        ["ffmpeg", "-y"]
+        ["ffmpeg", "-y", "-benchmark"]
         + inputs
         + [
             "-filter_complex", filter_complex,
@@ -95,15 +227,62 @@ def render_timeline(project: dict, feed_paths: dict[str, str], output_path: str)
         ]
     )
 
-    logger.info("Running render_timeline command: %s", " ".join(cmd))
+    logger.info(
+        "Running render_timeline command (%d clips, %d inputs): %s",
+        report["clips"], report["inputs"], " ".join(cmd),
+    )
     try:
-        subprocess.run(cmd, capture_output=True, check=True)
+        proc = run_ffmpeg(cmd)
     except FileNotFoundError:
         logger.warning("ffmpeg not found")
-        return "error: ffmpeg not available"
+        return {**report, "result": "error: ffmpeg not available"}
     except subprocess.CalledProcessError as exc:
         msg = exc.stderr.decode(errors="replace")
         logger.error("render_timeline failed: %s", msg)
-        return f"error: ffmpeg failed – {msg[:200]}"
+        return {**report, "result": f"error: ffmpeg failed – {msg[:200]}"}
+
+    report["peak_rss_kb"] = _peak_rss_kb(proc.stderr)
+    logger.info("render_timeline stats: %s", report)
+    return {**report, "result": output_path}
+
+
+def render_timeline(
+    project: dict,
+    feed_paths: dict[str, str],
+    output_path: str,
+    offset_maps: Optional[dict] = None,
+    seek_mode: str = "input",
+    render_mode: str = "graph",
+) -> str:
+    """Render a project timeline by concatenating and trimming clips in order.
+
+    Each clip in the timeline is trimmed to [trim_start, trim_end] (if set),
+    then placed at its ``timeline_start`` position in the output.  Gaps between
+    clips are filled with black/silence.
+
+    Args:
+        project: Project dict with 'clips', 'output_width', 'output_height'.
+        feed_paths: Mapping of feed_id to local file path.
+        output_path: Destination file path.
+        offset_maps: Optional mapping of feed_id to a drift map from
+            :func:`processor.drift.estimate_drift`.  Clips of those feeds
+            have their trims read on the reference clock and are re-timed
+            so they stay in sync across long recordings.
+        seek_mode: "input" seeks each input with ``-ss``/``-t`` before its
+            ``-i``, so only the trimmed spans are decoded; "filter" opens
+            every feed once from the start and cuts with ``trim``/``atrim``.
+        render_mode: One of RENDER_MODES.  "copy" and "smart" render per
+            clip with :func:`processor.segments.render_timeline_segments`
+            (input seeking only).
+
+    Returns:
+        The output file path on success, or an error string.
+    """
+    if render_mode not in RENDER_MODES:
+        return f"error: unknown render mode '{render_mode}'"
+    if render_mode != "graph" and seek_mode == "input":
+        from processor.segments import render_timeline_segments
 
-    return output_path
+        smart = render_mode == "smart"
+        return render_timeline_segments(project, feed_paths, output_path, offset_maps, smart)["result"]
+    return render_timeline_detailed(project, feed_paths, output_path, offset_maps, seek_mode)["result"]
@@ -0,0 +1,18 @@
+"""Synthetic audio shared by the audio-matching tests."""
+import numpy as np
+
+from processor import fingerprint
+
+SR = fingerprint.SAMPLE_RATE
+
+
+def tones(seconds: float, seed: int) -> np.ndarray:
+    """Short decaying tones at random pitches, a stand-in for music."""
+    rng = np.random.default_rng(seed)
+    note = SR // 8
+    n = int(seconds * SR)
+    t = np.arange(note) / SR
+    out = np.zeros(n + note, dtype=np.float32)
+    for start in range(0, n, note):
+        out[start:start + note] += np.sin(2 * np.pi * rng.uniform(200, 3000) * t) * np.exp(-t * 8)
+    return out[:n] + 0.01 * rng.standard_normal(n).astype(np.float32)
@@ -0,0 +1,82 @@
+import os
+import subprocess
+import sys
+
+import numpy as np
+
+from processor.cache import DiskCache, PCMCache, SegmentCache, cache_key, file_identity
+
+
+def _write_entry(cache: DiskCache, key: str, size: int, mtime: float) -> str:
+    temp = cache.temp_path(key)
+    with open(temp, "wb") as fh:
+        fh.write(b"x" * size)
+    path = cache.put(key, temp)
+    os.utime(path, (mtime, mtime))
+    return path
+
+
+def test_file_identity_tracks_changes(tmp_path):
+    """Keys should change when the file is rewritten."""
+    path = tmp_path / "clip.mp4"
+    path.write_bytes(b"abc")
+    first = file_identity(str(path))
+    path.write_bytes(b"abcdef")
+    second = file_identity(str(path))
+    assert first["size"] == 3 and second["size"] == 6
+    assert cache_key(first, 16000) != cache_key(second, 16000)
+    assert file_identity(str(tmp_path / "missing.mp4")) is None
+
+
+def test_lru_eviction_by_total_bytes(tmp_path):
+    """The least recently used entries go first once the byte budget is exceeded."""
+    cache = DiskCache(str(tmp_path), max_bytes=250, suffix=".bin")
+    _write_entry(cache, "a", 100, mtime=1000)
+    _write_entry(cache, "b", 100, mtime=2000)
+    os.utime(cache.get("a"), (3000, 3000))
+    _write_entry(cache, "c", 100, mtime=4000)
+    cache.evict()
+    assert cache.get("b") is None
+    assert cache.get("a") and cache.get("c")
+    stats = cache.stats()
+    assert stats["evictions"] == 1
+    assert stats["bytes"] == 200
+    assert stats["hits"] == 3 and stats["misses"] == 1
+
+
+def test_pcm_cache_skips_repeat_decodes(monkeypatch, tmp_path):
+    """A second load of an unchanged file must not start ffmpeg again."""
+    video = tmp_path / "clip.mp4"
+    video.write_bytes(b"not really a video")
+    samples = np.arange(-400, 400, dtype=np.int16)
+    launches = []
+    real_popen = subprocess.Popen
+
+    def popen(cmd, **kwargs):
+        launches.append(cmd)
+        script = "import sys; sys.stdout.buffer.write(bytes.fromhex(sys.argv[1]))"
+        return real_popen([sys.executable, "-c", script, samples.tobytes().hex()], **kwargs)
+
+    monkeypatch.setattr(subprocess, "Popen", popen)
+    cache = PCMCache(str(tmp_path / "cache"), max_bytes=1 << 20)
+    first = cache.load(str(video), 16000)
+    second = cache.load(str(video), 16000)
+    assert len(launches) == 1
+    assert isinstance(second, np.memmap)
+    np.testing.assert_array_equal(first, samples)
+    np.testing.assert_array_equal(second, samples)
+    assert cache.stats()["hits"] == 1
+
+
+def test_segment_cache_key_changes_with_trim(tmp_path):
+    source = tmp_path / "cam.mp4"
+    source.write_bytes(b"video")
+    cache = SegmentCache(str(tmp_path / "segments"), max_bytes=1 << 20)
+    segment = {"path": str(source), "lead_in": 0.0, "speed": 1.0}
+    spec = {"fps": 30.0, "sample_rate": 48000, "channels": 2}
+    key = cache.key_for(segment, {"start": 10.0, "end": 20.0, "mode": "encode"}, 1920, 1080, spec)
+    assert key == cache.key_for(segment, {"start": 10.0, "end": 20.0, "mode": "encode"}, 1920, 1080, spec)
+    assert key != cache.key_for(segment, {"start": 10.0, "end": 21.0, "mode": "encode"}, 1920, 1080, spec)
+    assert key != cache.key_for(segment, {"start": 10.0, "end": 20.0, "mode": "encode"}, 1280, 720, spec)
+    assert cache.key_for({**segment, "path": str(tmp_path / "gone.mp4")},
+                         {"start": 0.0, "end": 1.0}, 1920, 1080, spec) is None
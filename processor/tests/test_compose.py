@@ -1,4 +1,22 @@
-from processor.compose import compose_videos
+from processor.compose import compile_layout, compose_layout, compose_videos
+
+
+def _grid(n: int, cols: int, rows: int) -> dict:
+    """Same rounding as the API's generate_grid_layout."""
+    return {
+        "output_width": 1920,
+        "output_height": 1080,
+        "slots": [
+            {
+                "feed_id": f"feed_{i}",
+                "x": round((i % cols) / cols, 4),
+                "y": round((i // cols) / rows, 4),
+                "width": round(1 / cols, 4),
+                "height": round(1 / rows, 4),
+            }
+            for i in range(n)
+        ],
+    }
 
 
 def test_compose_builds_command():
@@ -33,3 +51,69 @@ def test_compose_layout_mapping():
     assert isinstance(result, str)
     # Verify fractional→pixel math: 0.25*1000=250, 0.5*500=250
     assert result.startswith("error")
+
+
+def test_grid_compiles_to_single_xstack():
+    """A 3x3 grid tiles the frame, so no overlay chain should be emitted."""
+    layout = _grid(9, 3, 3)
+    feeds = {f"feed_{i}": f"/tmp/{i}.mp4" for i in range(9)}
+    inputs, graph, engine, culled = compile_layout(layout, feeds)
+    assert engine == "xstack"
+    assert inputs.count("-i") == 9
+    assert "overlay" not in graph and graph.count("xstack") == 1
+    assert "layout=0_0|640_0|1280_0|0_360|640_360|1280_360|0_720|640_720|1280_720" in graph
+    assert graph.endswith("[out]")
+
+
+def test_overlay_fallback_orders_by_z_index_and_skips_missing():
+    layout = {
+        "output_width": 1920,
+        "output_height": 1080,
+        "slots": [
+            {"feed_id": "pip", "x": 0.7, "y": 0.05, "width": 0.25, "height": 0.25, "z_index": 2},
+            {"feed_id": "gone", "x": 0.0, "y": 0.6, "width": 0.25, "height": 0.25, "z_index": 3},
+            {"feed_id": "main", "x": 0.0, "y": 0.0, "width": 1.0, "height": 1.0, "z_index": 0},
+        ],
+    }
+    inputs, graph, engine, culled = compile_layout(layout, {"pip": "/tmp/pip.mp4", "main": "/tmp/main.mp4"})
+    assert engine == "overlay"
+    assert inputs == ["-i", "/tmp/main.mp4", "-i", "/tmp/pip.mp4"]
+    assert "[base][s0]overlay=0:0:shortest=1[tmp0]" in graph
+    assert graph.endswith("[tmp0][s1]overlay=1344:54[out]")
+    result = compose_videos(layout, {"pip": "/tmp/pip.mp4", "main": "/tmp/main.mp4"},
+                            "/tmp/out.mp4", engine="xstack")
+    assert result.startswith("error: layout does not tile")
+
+
+def test_hidden_slots_are_culled_and_partly_hidden_ones_cropped():
+    layout = {
+        "output_width": 1000,
+        "output_height": 500,
+        "slots": [
+            {"feed_id": "hidden", "x": 0.1, "y": 0.1, "width": 0.2, "height": 0.2, "z_index": 0},
+            {"feed_id": "left", "x": 0.0, "y": 0.0, "width": 0.5, "height": 1.0, "z_index": 1},
+            {"feed_id": "right", "x": 0.25, "y": 0.0, "width": 0.75, "height": 1.0, "z_index": 2},
+        ],
+    }
+    feeds = {name: f"/tmp/{name}.mp4" for name in ("hidden", "left", "right")}
+    inputs, graph, engine, culled = compile_layout(layout, feeds)
+    assert culled == [{"slot": 0, "feed_id": "hidden"}]
+    assert "/tmp/hidden.mp4" not in inputs
+    # Left keeps only its uncovered quarter, so the two now tile the frame.
+    assert engine == "xstack"
+    assert "[0:v]crop=iw*0.500000:ih*1.000000:iw*0.000000:ih*0.000000,scale=250:500" in graph
+
+    report = compose_layout(layout, feeds, "/tmp/out.mp4")
+    assert report["result"].startswith("error")
+    assert report["culled_slots"] == culled
+
+
+def test_sync_offsets_seek_each_input():
+    layout = _grid(2, 2, 1)
+    feeds = {"feed_0": "/tmp/0.mp4", "feed_1": "/tmp/1.mp4"}
+    inputs, graph, _, _ = compile_layout(
+        layout, feeds, feed_offsets={"feed_0": 0.0, "feed_1": 12.0},
+        start_seconds=10.0, duration_seconds=30.0,
+    )
+    assert inputs == ["-ss", "10", "-t", "30", "-i", "/tmp/0.mp4", "-t", "28", "-i", "/tmp/1.mp4"]
+    assert "[1:v]tpad=start_duration=2:color=black,scale=960:1080" in graph
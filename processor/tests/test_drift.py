@@ -0,0 +1,55 @@
+import numpy as np
+
+from processor.drift import estimate_drift, offset_at, reference_to_source
+from processor.timeline import drift_corrected_trim
+
+SAMPLE_RATE = 16000
+
+
+def _drifting_pair(drift_ppm: float, start_seconds: float = 5.0):
+    """A band-limited reference and a target recorded on a drifting clock."""
+    rng = np.random.default_rng(4)
+    n = SAMPLE_RATE * 300
+    envelope = np.repeat(rng.random(n // 400 + 1) ** 4, 400)[:n]
+    ref = (np.convolve(rng.standard_normal(n), np.ones(8) / 8, mode="same") * envelope)
+    source = start_seconds * SAMPLE_RATE + np.arange(SAMPLE_RATE * 240) * (1 + drift_ppm * 1e-6)
+    tgt = np.interp(source, np.arange(n), ref)
+    return ref.astype(np.float32), tgt.astype(np.float32)
+
+
+def test_estimate_drift_recovers_linear_drift():
+    """A steady clock-rate error should show up as a linear offset map."""
+    ref, tgt = _drifting_pair(200.0)
+    result = estimate_drift(ref, tgt, SAMPLE_RATE, hop_seconds=15.0)
+    assert abs(result["offset_seconds"] - 5.0) < 0.002
+    assert abs(result["drift_ppm"] - 200.0) < 10.0
+    assert result["confidence"] > 0.3
+    assert all(window["inlier"] for window in result["offset_map"])
+    late = result["offset_map"][-1]
+    assert abs(late["offset_seconds"] - (5.0 + 200e-6 * late["time"])) < 0.002
+
+
+def test_estimate_drift_empty_input():
+    result = estimate_drift(np.zeros(0, np.float32), np.zeros(10, np.float32), SAMPLE_RATE)
+    assert result["offset_map"] == [] and result["confidence"] == 0.0
+
+
+def test_warp_inversion():
+    """reference_to_source should undo time + offset_at(time)."""
+    warp = [
+        {"time": 0.0, "offset_seconds": 2.0},
+        {"time": 100.0, "offset_seconds": 2.01},
+        {"time": 200.0, "offset_seconds": 2.03},
+    ]
+    for source_time in (0.0, 50.0, 150.0, 250.0):
+        reference_time = source_time + offset_at(warp, source_time)
+        assert abs(reference_to_source(warp, reference_time) - source_time) < 1e-9
+
+
+def test_drift_corrected_trim():
+    """Clips on a drifting feed are mapped to source time and re-timed."""
+    warp = [{"time": 0.0, "offset_seconds": 1.0}, {"time": 1000.0, "offset_seconds": 1.1}]
+    start, end, speed = drift_corrected_trim({"trim_start": 101.0, "trim_end": 201.0}, warp)
+    assert abs(start - 100.0 / 1.0001) < 1e-6
+    assert abs((end - start) * speed - 100.0) < 1e-9
+    assert drift_corrected_trim({"trim_start": 5.0, "trim_end": 9.0}, None) == (5.0, 9.0, 1.0)
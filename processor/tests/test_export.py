@@ -1,4 +1,7 @@
-from processor.export import export_for_social
+import subprocess
+
+from processor import export
+from processor.export import export_for_social, export_multi
 
 
 def test_export_handles_missing_ffmpeg():
@@ -21,3 +24,21 @@ def test_export_square_dimensions():
     result = export_for_social("/tmp/in.mp4", "/tmp/out_square.mp4", 1080, 1080)
     assert isinstance(result, str)
     assert result.startswith("error")
+
+
+def test_export_multi_decodes_once(monkeypatch):
+    """All formats come from one ffmpeg process reading the master once."""
+    commands = []
+    monkeypatch.setattr(
+        export, "run_ffmpeg", lambda cmd: commands.append(cmd) or subprocess.CompletedProcess(cmd, 0),
+    )
+    outputs = {"landscape_1080p": "/tmp/wide.mp4", "portrait_1080p": "/tmp/tall.mp4", "square_1080": "/tmp/sq.mp4"}
+    report = export_multi("/tmp/master.mp4", outputs)
+    assert report == {"result": "ok", "outputs": outputs}
+    assert len(commands) == 1
+    cmd = commands[0]
+    assert cmd.count("-i") == 1
+    graph = cmd[cmd.index("-filter_complex") + 1]
+    assert "[0:v]split=3" in graph and "[0:a]asplit=3" in graph
+    assert "pad=1080:1920" in graph and cmd[-1] == "/tmp/sq.mp4"
+    assert export_multi("/tmp/master.mp4", {"vertical_4k": "/tmp/x.mp4"})["result"].startswith("error")
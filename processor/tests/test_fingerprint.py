@@ -0,0 +1,64 @@
+import numpy as np
+
+from processor import fingerprint
+from processor.fingerprint import FingerprintIndex, fingerprint_feed, fingerprint_samples, match_clip
+from tests.signals import SR, tones
+
+
+def test_index_finds_overlapping_feed_and_offset():
+    """A noisy excerpt should vote for its source feed at the right offset."""
+    feeds = {f"cam{i}": tones(60, seed=i) for i in range(4)}
+    index = FingerprintIndex.from_arrays({fid: fingerprint_samples(x) for fid, x in feeds.items()})
+    start = 21 * SR + 700
+    clip = feeds["cam2"][start:start + 10 * SR]
+    clip = clip + 0.05 * np.random.default_rng(9).standard_normal(len(clip)).astype(np.float32)
+
+    candidates = index.query(*fingerprint_samples(clip))
+    assert candidates[0]["feed_id"] == "cam2"
+    assert abs(candidates[0]["offset_seconds"] - start / SR) <= 2 * fingerprint.HOP / SR
+    assert all(c["matches"] < candidates[0]["matches"] for c in candidates[1:])
+
+
+def test_unrelated_clip_has_no_candidates():
+    index = FingerprintIndex.from_arrays({"cam0": fingerprint_samples(tones(30, seed=0))})
+    assert index.query(*fingerprint_samples(tones(10, seed=42))) == []
+
+
+def test_stored_fingerprints_match_and_verify(monkeypatch, tmp_path):
+    """Fingerprints round-trip through disk and candidates get a sample-accurate offset."""
+    audio = {"/feeds/a.mp4": tones(40, seed=1), "/feeds/b.mp4": tones(40, seed=2)}
+    start = 12 * SR + 123
+    audio["/clips/c.mp4"] = audio["/feeds/b.mp4"][start:start + 8 * SR]
+    monkeypatch.setattr(fingerprint, "load_audio_pcm", lambda path, sr: audio[path])
+
+    fingerprint_feed("a", "/feeds/a.mp4", str(tmp_path))
+    fingerprint_feed("b", "/feeds/b.mp4", str(tmp_path))
+    index = FingerprintIndex.load(str(tmp_path))
+    assert sorted(index.feed_ids) == ["a", "b"]
+
+    matches = match_clip("/clips/c.mp4", index, {"a": "/feeds/a.mp4", "b": "/feeds/b.mp4"})
+    assert [m["feed_id"] for m in matches] == ["b"]
+    assert abs(matches[0]["offset_seconds"] - start / SR) < 1e-3
+    assert matches[0]["confidence"] > 0.9
+
+
+def test_corrupt_fingerprint_is_rebuilt_and_index_is_cached(monkeypatch, tmp_path):
+    """A truncated .npz is re-fingerprinted from its feed; unchanged files reuse the index."""
+    audio = {"/feeds/a.mp4": tones(20, seed=1), "/feeds/b.mp4": tones(20, seed=2)}
+    monkeypatch.setattr(fingerprint, "load_audio_pcm", lambda path, sr: audio[path])
+    fingerprint_feed("a", "/feeds/a.mp4", str(tmp_path))
+    fingerprint_feed("b", "/feeds/b.mp4", str(tmp_path))
+    path = fingerprint.fingerprint_path("b", str(tmp_path))
+    with open(path, "r+b") as fh:
+        fh.truncate(100)
+
+    assert FingerprintIndex.load(str(tmp_path), ["a", "b"]).feed_ids == ["a"]
+    assert not (tmp_path / "b.npz").exists()
+
+    fingerprint_feed("b", "/feeds/b.mp4", str(tmp_path))
+    with open(path, "r+b") as fh:
+        fh.truncate(100)
+    paths = {"a": "/feeds/a.mp4", "b": "/feeds/b.mp4"}
+    index = FingerprintIndex.load(str(tmp_path), ["a", "b"], paths)
+    assert index.feed_ids == ["a", "b"] and len(index) > 0
+    assert FingerprintIndex.load(str(tmp_path), ["a", "b"], paths) is index
@@ -0,0 +1,91 @@
+import numpy as np
+
+from processor import loudness
+from processor.loudness import analyze_many, analyze_samples
+
+SR = 16000
+
+
+def _sine(seconds: float, amplitude: float, freq: float = 1000.0) -> np.ndarray:
+    t = np.arange(int(seconds * SR)) / SR
+    return amplitude * np.sin(2 * np.pi * freq * t)
+
+
+def test_sine_reads_reference_loudness():
+    """A -20 dBFS 1 kHz sine is -23.0 LUFS (BS.1770 reference tone), in float and int16."""
+    tone = _sine(10, 0.1)
+    result = analyze_samples(tone, SR, target_lufs=-16.0)
+    assert abs(result["integrated_lufs"] - -23.0) < 0.1
+    assert abs(result["gain_db"] - 7.0) < 0.1
+    assert abs(result["sample_peak_dbfs"] - -20.0) < 0.01
+    assert result["loudness_range_lu"] < 0.1
+    assert result["clipped_samples"] == 0
+
+    pcm = np.round(tone * 32768).astype(np.int16)
+    assert abs(analyze_samples(pcm, SR)["integrated_lufs"] - result["integrated_lufs"]) < 0.05
+
+
+def test_k_weighting_cuts_low_frequencies():
+    """The 38 Hz high-pass makes a 20 Hz tone read far quieter than 1 kHz."""
+    low = analyze_samples(_sine(5, 0.1, 20.0), SR)["integrated_lufs"]
+    assert low < -23.0 - 10
+
+
+def test_gating_ignores_silence_and_curves_are_floored():
+    """Silence neither lowers the integrated level nor yields -inf in the curves."""
+    program = np.concatenate([_sine(10, 0.1), np.zeros(10 * SR)])
+    result = analyze_samples(program, SR, curve_hop_seconds=0.5)
+    assert abs(result["integrated_lufs"] - -23.0) < 0.1
+    assert result["curve_hop_seconds"] == 0.5
+    assert len(result["momentary"]) == len(range(0, 200 - 3, 5))
+    assert result["momentary"][-1] == loudness.LOUDNESS_FLOOR
+
+    silent = analyze_samples(np.zeros(5 * SR), SR, target_lufs=-16.0)
+    assert silent["integrated_lufs"] is None
+    assert silent["sample_peak_dbfs"] is None
+    assert silent["gain_db"] is None
+
+
+def test_chunked_filtering_matches_one_block(monkeypatch):
+    """Block-wise overlap-add gives the same sub-block energies as one block."""
+    noise = np.random.default_rng(0).standard_normal(12 * SR) * 0.1
+    whole = loudness.subblock_energy(noise, SR)
+    monkeypatch.setattr(loudness, "CHUNK_SAMPLES", 3 * SR)
+    assert np.allclose(loudness.subblock_energy(noise, SR), whole)
+
+
+def test_clipping_is_counted():
+    pcm = np.round(np.clip(_sine(2, 1.5), -1, 32767 / 32768) * 32768).astype(np.int16)
+    result = analyze_samples(pcm, SR)
+    assert result["clipped_samples"] > 0
+    assert abs(result["sample_peak_dbfs"]) < 0.01
+
+
+def test_negative_full_scale_is_counted():
+    """-32768 samples count as clipped and read as a 0 dBFS peak."""
+    pcm = np.round(_sine(2, 0.5) * 32768).astype(np.int16)
+    pcm[pcm < -10000] = -32768
+    result = analyze_samples(pcm, SR)
+    assert result["clipped_samples"] == np.count_nonzero(pcm == -32768) > 0
+    assert result["sample_peak_dbfs"] == 0.0
+
+
+def test_chunked_peak_matches_one_block(monkeypatch):
+    """Peak and clipping are read block by block with the same result."""
+    pcm = np.round(np.clip(_sine(3, 1.5), -1, 32767 / 32768) * 32768).astype(np.int16)
+    whole = loudness.sample_peak(pcm)
+    monkeypatch.setattr(loudness, "CHUNK_SAMPLES", 1000)
+    assert loudness.sample_peak(pcm) == whole and whole[1] > 0
+
+
+def test_analyze_many_reports_every_feed(monkeypatch):
+    """Feeds come back keyed by id; one without audio reports an error."""
+    audio = {"loud.mp4": np.round(_sine(5, 0.5) * 32768).astype(np.int16),
+             "quiet.mp4": np.round(_sine(5, 0.05) * 32768).astype(np.int16),
+             "none.mp4": np.zeros(0, dtype=np.int16)}
+    monkeypatch.setattr(loudness, "load_audio_pcm", lambda path, sr, dtype: audio[path])
+    results = analyze_many({"a": "loud.mp4", "b": "quiet.mp4", "c": "none.mp4"}, target_lufs=-23.0)
+    assert list(results) == ["a", "b", "c"]
+    assert abs(results["a"]["integrated_lufs"] - results["b"]["integrated_lufs"] - 20.0) < 0.1
+    assert results["b"]["gain_db"] > results["a"]["gain_db"]
+    assert results["c"] == {"error": "no audio decoded"}
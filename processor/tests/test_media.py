@@ -0,0 +1,22 @@
+from processor.media import input_args, lead_in_filters, trim_filters
+
+
+def test_input_args_seek_before_input():
+    args, lead_in = input_args("/tmp/a.mp4", 5400.0, 5460.5)
+    assert args == ["-ss", "5400", "-t", "60.5", "-i", "/tmp/a.mp4"]
+    assert lead_in == 0.0
+    assert input_args("/tmp/a.mp4") == (["-i", "/tmp/a.mp4"], 0.0)
+
+
+def test_negative_start_becomes_lead_in():
+    args, lead_in = input_args("/tmp/a.mp4", -1.5, 10.0)
+    assert args == ["-t", "10", "-i", "/tmp/a.mp4"]
+    assert lead_in == 1.5
+    video, audio = lead_in_filters(lead_in)
+    assert video == "tpad=start_duration=1.5:color=black,"
+    assert audio == "adelay=1500:all=1,"
+
+
+def test_trim_filters_syntax():
+    assert trim_filters(5.0, 30.0) == ("trim=start=5:end=30,", "atrim=start=5:end=30,")
+    assert trim_filters(None, None) == ("", "")
@@ -0,0 +1,106 @@
+import io
+import wave
+
+import numpy as np
+
+from processor import mixdown
+from processor.mixdown import limiter_gains, mixdown as mix_feeds
+
+SR = 1000
+
+
+class _FakeProc:
+    """Stands in for an ffmpeg PCM pipe over a fake stereo float32 recording."""
+
+    def __init__(self, audio: np.ndarray, returncode: int = 0):
+        self.stdout = io.BytesIO(audio.astype("<f4").tobytes())
+        self.stderr = io.BytesIO(b"decode error\n" if returncode else b"")
+        self.returncode = returncode
+
+    def poll(self):
+        return self.returncode
+
+    def wait(self):
+        return self.returncode
+
+    def kill(self):
+        pass
+
+
+def _fake_popen(monkeypatch, recordings: dict, commands: list, failing=()):
+    def popen(cmd, stdout=None, stderr=None):
+        commands.append(cmd)
+        path = cmd[cmd.index("-i") + 1]
+        audio = recordings[path]
+        if "-ss" in cmd:
+            audio = audio[int(round(float(cmd[cmd.index("-ss") + 1]) * SR)):]
+        return _FakeProc(audio, 1 if path in failing else 0)
+
+    monkeypatch.setattr(mixdown.subprocess, "Popen", popen)
+
+
+def _read_wav(path) -> np.ndarray:
+    with wave.open(str(path), "rb") as f:
+        assert f.getframerate() == SR and f.getnchannels() == 2
+        return np.frombuffer(f.readframes(f.getnframes()), dtype="<i2").reshape(-1, 2) / 32767.0
+
+
+def test_mixdown_applies_offsets_and_volume(monkeypatch, tmp_path):
+    """Offsets delay or trim each feed, volumes scale it, and the mix lasts until the last feed ends."""
+    recordings = {"a.mp4": np.full((3 * SR, 2), 0.2), "b.mp4": np.full((2 * SR, 2), 0.1)}
+    recordings["b.mp4"][:SR] = 0.3
+    commands: list = []
+    _fake_popen(monkeypatch, recordings, commands)
+    out = tmp_path / "mix.wav"
+    feeds = [
+        {"path": "a.mp4", "offset_seconds": 1.5, "volume": 0.5},
+        {"path": "b.mp4", "offset_seconds": -1.0, "volume": 2.0},
+    ]
+    report = mix_feeds(feeds, str(out), sample_rate=SR, block_frames=700)
+    assert report["result"] == str(out)
+    assert report["duration_seconds"] == 4.5
+    assert report["max_gain_reduction_db"] == 0.0
+    assert not (tmp_path / "mix.wav.part").exists()
+
+    mix = _read_wav(out)
+    assert len(mix) == 4500
+    # b is seeked past its first second; a starts 1.5 s in.
+    assert "-ss" in commands[1] and "-ss" not in commands[0]
+    assert np.allclose(mix[:1000], 0.2, atol=1e-3)
+    assert np.allclose(mix[1000:1500], 0.0, atol=1e-3)
+    assert np.allclose(mix[1500:], 0.1, atol=1e-3)
+    assert abs(report["peak_dbfs"] - 20 * np.log10(0.2)) < 0.01
+
+
+def test_mixdown_limits_the_sum(monkeypatch, tmp_path):
+    """Feeds that sum past full scale are held under the ceiling."""
+    recordings = {f"{k}.mp4": np.full((2 * SR, 2), 0.6) for k in range(3)}
+    _fake_popen(monkeypatch, recordings, [])
+    out = tmp_path / "mix.wav"
+    report = mix_feeds([{"path": p} for p in recordings], str(out), sample_rate=SR, block_frames=512)
+    ceiling = 10 ** (mixdown.LIMITER_CEILING_DB / 20)
+    assert np.abs(_read_wav(out)).max() <= ceiling + 1e-4
+    assert abs(report["max_gain_reduction_db"] - 20 * np.log10(1.8 / ceiling)) < 0.01
+
+
+def test_mixdown_failure_leaves_no_output(monkeypatch, tmp_path):
+    recordings = {"a.mp4": np.zeros((SR, 2)), "b.mp4": np.zeros((SR, 2))}
+    _fake_popen(monkeypatch, recordings, [], failing=("b.mp4",))
+    out = tmp_path / "mix.wav"
+    report = mix_feeds([{"path": "a.mp4"}, {"path": "b.mp4"}], str(out), sample_rate=SR)
+    assert report["result"].startswith("error: ffmpeg failed on b.mp4")
+    assert not out.exists() and not (tmp_path / "mix.wav.part").exists()
+
+
+def test_mixdown_handles_missing_ffmpeg(tmp_path):
+    """Without ffmpeg installed the mix reports an error instead of raising."""
+    report = mix_feeds([{"path": str(tmp_path / "in.mp4")}], str(tmp_path / "mix.wav"))
+    assert report["result"].startswith("error")
+
+
+def test_limiter_gains_attack_at_once_and_release_slowly():
+    peaks = np.array([0.5, 2.0, 0.5, 0.5, 0.5])
+    gains = limiter_gains(peaks, 1.0, 1.0, 2.0)
+    assert np.allclose(gains, [1.0, 0.5, 1.0, 1.0, 1.0])
+    gains = limiter_gains(peaks, 1.0, 1.0, 1.5)
+    assert np.allclose(gains, [1.0, 0.5, 0.75, 1.0, 1.0])
@@ -1,5 +1,13 @@
+import subprocess
+
 from processor.optimize import normalize_audio, optimize_audio
 
+LOUDNORM_STDERR = (
+    b"Input #0, mov,mp4 ...\n[Parsed_loudnorm_0 @ 0x1]\n"
+    b'{\n\t"input_i" : "-23.54",\n\t"input_tp" : "-4.20",\n\t"input_lra" : "6.10",\n'
+    b'\t"input_thresh" : "-33.90",\n\t"target_offset" : "0.35"\n}\n'
+)
+
 
 def test_normalize_handles_missing_ffmpeg():
     """normalize_audio should return an error string when ffmpeg is missing."""
@@ -15,3 +23,49 @@ def test_optimize_returns_settings():
     assert result["normalize"] is True
     assert result["noise_reduce"] is False
     assert "result" in result
+
+
+def test_measure_loudness_parses_loudnorm_json(monkeypatch):
+    """The analysis pass's JSON block on stderr should come back as floats."""
+    from processor import optimize
+
+    monkeypatch.setattr(
+        optimize, "run_ffmpeg", lambda cmd: subprocess.CompletedProcess(cmd, 0, b"", LOUDNORM_STDERR)
+    )
+    stats = optimize.measure_loudness_many(["a.mp4", "b.mp4"])
+    assert stats[0] == stats[1]
+    assert stats[0]["input_i"] == -23.54 and stats[0]["target_offset"] == 0.35
+
+
+def test_optimize_runs_one_pass_and_copies_video(monkeypatch, tmp_path):
+    """Both filters share one ffmpeg run; no .norm.tmp intermediate is written."""
+    from processor import cache, optimize
+
+    monkeypatch.setattr(cache, "_loudness_cache", cache.LoudnessCache(str(tmp_path / "loudness")))
+    commands = []
+
+    def run(cmd):
+        commands.append(cmd)
+        return subprocess.CompletedProcess(cmd, 0, b"", LOUDNORM_STDERR)
+
+    monkeypatch.setattr(optimize, "run_ffmpeg", run)
+    master = tmp_path / "in.mp4"
+    master.write_bytes(b"master")
+    output = str(tmp_path / "out.mp4")
+    result = optimize_audio(str(master), output, normalize=True, noise_reduce=True)
+    assert result["result"] == output
+    # One analysis pass, then one pass applying both filters.
+    assert len(commands) == 2
+    cmd = commands[1]
+    chain = cmd[cmd.index("-af") + 1]
+    assert chain.startswith("loudnorm=I=-16:TP=-1.5:LRA=11:measured_I=-23.54:measured_TP=-4.20")
+    assert chain.endswith(":offset=0.35:linear=true,afftdn=nf=-25")
+    assert cmd[cmd.index("-c:v") + 1] == "copy"
+    assert not any(".tmp" in arg for arg in cmd)
+
+    # The measurements are cached: a repeat skips the analysis pass.
+    optimize_audio(str(master), output, normalize=True)
+    assert len(commands) == 3
+    master.write_bytes(b"re-mastered")
+    optimize_audio(str(master), output, normalize=True)
+    assert len(commands) == 5
@@ -0,0 +1,101 @@
+import subprocess
+
+from processor import pipeline, scratch
+from processor.pipeline import plan_pipeline, run_pipeline
+
+PROJECT = {
+    "clips": [
+        {"feed_id": "cam1", "timeline_start": 0.0, "trim_start": 10.0, "trim_end": 20.0},
+        {"feed_id": "cam2", "timeline_start": 10.0, "trim_start": 5.0, "trim_end": 15.0},
+    ],
+    "output_width": 1920,
+    "output_height": 1080,
+}
+FEEDS = {"cam1": "/data/uploads/cam1.mp4", "cam2": "/data/uploads/cam2.mp4"}
+OUTPUTS = {"landscape_1080p": "/data/output/wide.mp4", "portrait_1080p": "/data/output/tall.mp4"}
+
+
+def test_render_optimize_export_is_one_ffmpeg_run():
+    steps = plan_pipeline(
+        [
+            {"stage": "render", "project": PROJECT, "feed_paths": FEEDS},
+            {"stage": "optimize", "normalize": True},
+            {"stage": "export", "formats": list(OUTPUTS)},
+        ],
+        outputs=OUTPUTS,
+    )
+    assert len(steps) == 1
+    assert steps[0]["stages"] == ["render", "optimize", "export"]
+    cmd = steps[0]["cmd"]
+    graph = cmd[cmd.index("-filter_complex") + 1]
+    assert "[outa]loudnorm=I=-16:TP=-1.5:LRA=11[p1a]" in graph
+    assert "[outv]split=2" in graph and "[p1a]asplit=2" in graph
+    assert cmd.count("libx264") == 2 and cmd[-1] == "/data/output/tall.mp4"
+
+
+def test_audio_only_stage_copies_video():
+    steps = plan_pipeline(
+        [{"stage": "optimize", "normalize": True, "noise_reduce": True}],
+        output_path="/data/output/master.mp4",
+        input_path="/data/output/raw.mp4",
+    )
+    cmd = steps[0]["cmd"]
+    assert cmd[cmd.index("-map") + 1] == "0:v?" and cmd[cmd.index("-c:v") + 1] == "copy"
+    assert "libx264" not in cmd and "[0:a]loudnorm" in cmd[cmd.index("-filter_complex") + 1]
+
+
+def test_segmented_render_goes_through_scratch_and_is_cleaned_up(monkeypatch, tmp_path):
+    monkeypatch.setattr(scratch, "SCRATCH_DIR", str(tmp_path / "scratch"))
+    rendered = []
+
+    def fake_render(**kwargs):
+        rendered.append(kwargs)
+        with open(kwargs["output_path"], "wb") as fh:
+            fh.write(b"mp4")
+        return {"result": kwargs["output_path"]}
+
+    commands = []
+    monkeypatch.setattr("processor.segments.render_timeline_segments", fake_render)
+    monkeypatch.setattr(
+        pipeline, "run_ffmpeg", lambda cmd: commands.append(cmd) or subprocess.CompletedProcess(cmd, 0),
+    )
+    report = run_pipeline(
+        [
+            {"stage": "render", "project": PROJECT, "feed_paths": FEEDS, "render_mode": "smart"},
+            {"stage": "export", "formats": ["portrait_1080p"]},
+        ],
+        outputs=OUTPUTS,
+    )
+    assert report["result"] == "ok" and report["outputs"] == {"portrait_1080p": OUTPUTS["portrait_1080p"]}
+    assert report["steps"] == [["render"], ["export"]]
+    assert rendered[0]["smart"] is True
+    assert commands[0][commands[0].index("-i") + 1] == rendered[0]["output_path"]
+    assert list((tmp_path / "scratch").iterdir()) == []
+
+
+def test_optimize_after_segmented_render_uses_dynamic_loudnorm(tmp_path):
+    """The scratch render does not exist at planning time, so it is not measured."""
+    steps = plan_pipeline(
+        [
+            {"stage": "render", "project": PROJECT, "feed_paths": FEEDS, "render_mode": "smart"},
+            {"stage": "optimize", "normalize": True},
+        ],
+        output_path="/data/output/master.mp4",
+        scratch_dir=str(tmp_path),
+    )
+    assert [step["stages"] for step in steps] == [["render"], ["optimize"]]
+    cmd = steps[1]["cmd"]
+    assert cmd[cmd.index("-i") + 1] == str(tmp_path / "render.mp4")
+    assert "[0:a]loudnorm=I=-16:TP=-1.5:LRA=11[p1a]" in cmd[cmd.index("-filter_complex") + 1]
+
+
+def test_invalid_pipelines_are_rejected(monkeypatch, tmp_path):
+    monkeypatch.setattr(scratch, "SCRATCH_DIR", str(tmp_path))
+    compose = {"stage": "compose", "feed_paths": FEEDS, "layout": {
+        "slots": [{"feed_id": "cam1", "x": 0, "y": 0, "width": 1, "height": 1}],
+    }}
+    assert run_pipeline([compose, {"stage": "optimize"}], "/tmp/o.mp4")["result"].startswith(
+        "error: optimize needs audio"
+    )
+    assert run_pipeline([{"stage": "export"}, {"stage": "optimize"}], input_path="/tmp/i.mp4")[
+        "result"] == "error: export can only be the last stage"
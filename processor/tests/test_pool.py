@@ -0,0 +1,104 @@
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+
+from processor import pool
+from processor.pool import Cancelled, run_ffmpeg, run_parallel
+
+
+def _sleeper(seconds: float, code: int = 0) -> list[str]:
+    return [sys.executable, "-c", f"import sys, time; time.sleep({seconds}); sys.exit({code})"]
+
+
+def test_run_ffmpeg_matches_subprocess_run_errors():
+    assert run_ffmpeg([sys.executable, "-c", "print('ok')"]).stdout.strip() == b"ok"
+    with pytest.raises(subprocess.CalledProcessError) as info:
+        run_ffmpeg([sys.executable, "-c", "import sys; sys.stderr.write('bad'); sys.exit(3)"])
+    assert info.value.returncode == 3 and info.value.stderr == b"bad"
+    with pytest.raises(FileNotFoundError):
+        run_ffmpeg(["definitely-not-ffmpeg"])
+
+
+def test_run_parallel_overlaps_jobs_and_keeps_order(monkeypatch):
+    monkeypatch.setattr(pool, "_executor", None)
+    monkeypatch.setattr(pool, "FFMPEG_POOL_SIZE", 4)
+    start = time.monotonic()
+    results = run_parallel(lambda k: (run_ffmpeg(_sleeper(0.5)), k)[1], range(4))
+    assert results == [0, 1, 2, 3]
+    assert time.monotonic() - start < 1.5
+
+
+def test_first_failure_cancels_the_rest(monkeypatch):
+    """A failing job kills running siblings and stops queued ones from starting."""
+    monkeypatch.setattr(pool, "_executor", None)
+    monkeypatch.setattr(pool, "FFMPEG_POOL_SIZE", 2)
+    started = []
+    lock = threading.Lock()
+
+    def job(k):
+        with lock:
+            started.append(k)
+        return run_ffmpeg(_sleeper(0.2, code=1) if k == 0 else _sleeper(30))
+
+    start = time.monotonic()
+    with pytest.raises(subprocess.CalledProcessError):
+        run_parallel(job, range(6))
+    assert time.monotonic() - start < 10
+    assert len(started) <= 3
+
+
+def test_cancel_all_kills_running_batches(monkeypatch):
+    monkeypatch.setattr(pool, "_executor", None)
+    outcome = []
+
+    def run():
+        try:
+            run_parallel(lambda k: run_ffmpeg(_sleeper(30)), range(2))
+        except Cancelled as exc:
+            outcome.append(exc)
+
+    worker = threading.Thread(target=run)
+    start = time.monotonic()
+    worker.start()
+    while not pool.cancel_all():
+        time.sleep(0.05)
+    worker.join(10)
+    assert outcome and time.monotonic() - start < 10
+
+
+def test_cancel_task_kills_only_that_tasks_processes(monkeypatch):
+    """Revoking one task leaves another task in the same process running."""
+    monkeypatch.setattr(pool, "_executor", None)
+    outcome = {}
+
+    def task(task_id, seconds, batched):
+        pool.begin_task(task_id)
+        try:
+            if batched:
+                run_parallel(lambda k: run_ffmpeg(_sleeper(seconds)), range(2))
+            else:
+                run_ffmpeg(_sleeper(seconds))
+            outcome[task_id] = "done"
+        except (Cancelled, subprocess.CalledProcessError) as exc:
+            outcome[task_id] = type(exc).__name__
+        finally:
+            pool.end_task(task_id)
+
+    workers = [
+        threading.Thread(target=task, args=("a", 30, True)),
+        threading.Thread(target=task, args=("b", 30, False)),
+        threading.Thread(target=task, args=("c", 1.0, True)),
+    ]
+    start = time.monotonic()
+    for worker in workers:
+        worker.start()
+    time.sleep(0.3)
+    assert pool.cancel_task("a") and pool.cancel_task("b")
+    assert not pool.cancel_task("unknown")
+    for worker in workers:
+        worker.join(10)
+    assert outcome == {"a": "Cancelled", "b": "Cancelled", "c": "done"}
+    assert time.monotonic() - start < 10
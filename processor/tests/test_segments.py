@@ -0,0 +1,308 @@
+import os
+import subprocess
+
+from processor import cache, segments
+from processor.segments import (
+    finish_parallel_render,
+    plan_parallel_render,
+    plan_segments,
+    render_timeline_segments,
+)
+
+PROBES = {
+    "/tmp/cam1.mp4": {
+        "duration": 3600.0,
+        "video": {"codec_name": "h264", "width": 1920, "height": 1080, "pix_fmt": "yuv420p", "fps": 30.0,
+                  "profile": "High", "level": 40},
+        "audio": {"codec_name": "aac", "sample_rate": 48000, "channels": 2},
+    },
+    "/tmp/phone.mp4": {
+        "duration": 600.0,
+        "video": {"codec_name": "hevc", "width": 1080, "height": 1920, "pix_fmt": "yuv420p", "fps": 30.0},
+        "audio": {"codec_name": "aac", "sample_rate": 44100, "channels": 2},
+    },
+}
+KEYFRAMES = [0.0, 10.0, 20.0, 30.0, 40.0]
+FEEDS = {"cam1": "/tmp/cam1.mp4", "phone": "/tmp/phone.mp4"}
+
+
+def _fake_probes(monkeypatch):
+    monkeypatch.setattr(segments, "probe_media", PROBES.get)
+    monkeypatch.setattr(segments, "keyframe_times", lambda path, around, window: KEYFRAMES)
+
+
+def _fake_ffmpeg(commands):
+    """Record ffmpeg commands and create the file each one writes."""
+    def run(cmd):
+        commands.append(cmd)
+        with open(cmd[-1], "wb") as fh:
+            fh.write(b"ts")
+        return subprocess.CompletedProcess(cmd, 0, b"", b"")
+    return run
+
+
+def _project(*clips):
+    return {
+        "clips": [{"feed_id": f, "timeline_start": 0.0, "trim_start": s, "trim_end": e} for f, s, e in clips],
+        "output_width": 1920,
+        "output_height": 1080,
+    }
+
+
+def test_plan_copies_only_keyframe_aligned_matching_clips(monkeypatch):
+    _fake_probes(monkeypatch)
+    planned, spec = plan_segments(
+        _project(("cam1", 10.0, 30.0), ("cam1", 12.5, 20.0), ("phone", 0.0, 5.0)), FEEDS,
+    )
+    assert [s["mode"] for s in planned] == ["copy", "encode", "encode"]
+    assert planned[1]["reason"] == "start is not on a keyframe"
+    assert "resolution" in planned[2]["reason"]
+    assert spec == {"fps": 30.0, "profile": "High", "level": 40, "sample_rate": 48000, "channels": 2}
+
+
+def test_copy_requires_a_profile_and_level_the_encodes_can_match(monkeypatch):
+    """Copied clips must share level, and carry a profile libx264 can reproduce."""
+    probes = {
+        "/tmp/cam2.mp4": {**PROBES["/tmp/cam1.mp4"], "video": {**PROBES["/tmp/cam1.mp4"]["video"], "level": 41}},
+        "/tmp/cam3.mp4": {**PROBES["/tmp/cam1.mp4"],
+                          "video": {**PROBES["/tmp/cam1.mp4"]["video"], "profile": "High 4:4:4 Predictive"}},
+        **PROBES,
+    }
+    monkeypatch.setattr(segments, "probe_media", probes.get)
+    monkeypatch.setattr(segments, "keyframe_times", lambda path, around, window: KEYFRAMES)
+    feeds = {**FEEDS, "cam2": "/tmp/cam2.mp4", "cam3": "/tmp/cam3.mp4"}
+    planned, spec = plan_segments(_project(("cam1", 10.0, 30.0), ("cam2", 10.0, 30.0), ("cam3", 10.0, 30.0)), feeds)
+    assert [s["mode"] for s in planned] == ["copy", "encode", "encode"]
+    assert planned[1]["reason"] == "stream parameters differ from the other copied segments"
+    assert planned[2]["reason"].startswith("profile High 4:4:4 Predictive")
+    assert spec["level"] == 40
+
+
+def test_segments_are_copied_encoded_and_concatenated(monkeypatch, tmp_path):
+    _fake_probes(monkeypatch)
+    commands = []
+
+    monkeypatch.setattr(segments, "run_ffmpeg", _fake_ffmpeg(commands))
+    output = str(tmp_path / "out.mp4")
+    report = render_timeline_segments(_project(("cam1", 10.0, 30.0), ("phone", 0.0, 5.0)), FEEDS, output)
+    assert report["result"] == output
+    assert (report["copied"], report["encoded"]) == (1, 1)
+    copy_cmd = next(c for c in commands if "/tmp/cam1.mp4" in c)
+    assert copy_cmd[copy_cmd.index("-c") + 1] == "copy"
+    encode_cmd = next(c for c in commands if "/tmp/phone.mp4" in c)
+    assert "libx264" in encode_cmd and encode_cmd[encode_cmd.index("-ar") + 1] == "48000"
+    assert commands[-1][commands[-1].index("-f") + 1] == "concat"
+
+
+def test_smart_render_encodes_only_partial_gops(monkeypatch, tmp_path):
+    _fake_probes(monkeypatch)
+    commands = []
+
+    monkeypatch.setattr(segments, "run_ffmpeg", _fake_ffmpeg(commands))
+    project = _project(("cam1", 12.5, 35.0), ("cam1", 21.0, 29.0))
+    planned, _ = plan_segments(project, FEEDS, smart=True)
+    assert planned[0]["mode"] == "smart"
+    assert [(p["start"], p["end"], p["mode"]) for p in planned[0]["pieces"]] == [
+        (12.5, 20.0, "encode"), (20.0, 30.0, "copy"), (30.0, 35.0, "encode"),
+    ]
+    # No keyframe strictly inside the clip: nothing to copy.
+    assert planned[1]["mode"] == "encode"
+
+    report = render_timeline_segments(project, FEEDS, str(tmp_path / "out.mp4"), smart=True)
+    assert (report["copied"], report["encoded"], report["smart"]) == (0, 1, 1)
+    assert report["segments"][0]["pieces"] == ["encode", "copy", "encode"]
+    head = next(c for c in commands if c[c.index("-ss") + 1] == "12.5")
+    assert head[head.index("-profile:v") + 1] == "high" and head[head.index("-level:v") + 1] == "4.0"
+    assert "stitchable=1" in head and head[head.index("-f") + 1] == "mpegts"
+    assert "aac_adtstoasc" in commands[-1]
+
+
+def test_smart_open_ended_clip_copies_to_the_end(monkeypatch):
+    """A clip without an end re-encodes only its head, not the whole source."""
+    _fake_probes(monkeypatch)
+    planned, _ = plan_segments(_project(("cam1", 12.5, None)), FEEDS, smart=True)
+    assert planned[0]["mode"] == "smart"
+    assert [(p["start"], p["end"], p["mode"]) for p in planned[0]["pieces"]] == [
+        (12.5, 20.0, "encode"), (20.0, None, "copy"),
+    ]
+
+
+def test_falls_back_to_single_graph_when_nothing_copies(monkeypatch):
+    _fake_probes(monkeypatch)
+    monkeypatch.setattr(
+        segments, "render_timeline_detailed", lambda *args: {"result": "/tmp/out.mp4", "inputs": 1},
+    )
+    report = render_timeline_segments(_project(("phone", 0.0, 5.0)), FEEDS, "/tmp/out.mp4")
+    assert report["result"] == "/tmp/out.mp4"
+    assert (report["copied"], report["encoded"]) == (0, 1)
+
+
+def test_parallel_plan_splits_long_encodes_into_chunks(monkeypatch):
+    _fake_probes(monkeypatch)
+    project = _project(("cam1", 12.5, 35.0), ("phone", None, None))
+    jobs, spec, report = plan_parallel_render(project, FEEDS, smart=True, segment_seconds=120.0)
+    # Smart head/copy/tail for cam1, then the whole 600 s phone clip in 120 s chunks.
+    assert [(j["piece"]["start"], j["piece"]["mode"]) for j in jobs[:3]] == [
+        (12.5, "encode"), (20.0, "copy"), (30.0, "encode"),
+    ]
+    # The phone clip's audio is one piece; its video is cut into chunks.
+    phone = [j["piece"] for j in jobs[3:]]
+    assert [(p["start"], p["end"], p["streams"]) for p in phone] == [
+        (None, None, "a"), (0.0, 120.0, "v"), (120.0, 240.0, "v"), (240.0, 360.0, "v"),
+        (360.0, 480.0, "v"), (480.0, None, "v"),
+    ]
+    assert report["pieces"] == 9 and (report["smart"], report["encoded"]) == (1, 1)
+    assert spec["fps"] == 30.0 and spec["sample_rate"] == 48000
+    audio, video = (segments.piece_command(jobs[3]["segment"], p, "out.ts", 1920, 1080, spec) for p in phone[:2])
+    assert "0:a:0" in audio and "0:v:0" not in audio and "libx264" not in audio
+    assert "0:v:0" in video and "0:a:0" not in video and "aac" not in video
+
+
+def test_finish_parallel_render_concatenates_and_cleans_up(monkeypatch, tmp_path):
+    commands = []
+    monkeypatch.setattr(
+        segments, "run_ffmpeg", lambda cmd: commands.append(cmd) or subprocess.CompletedProcess(cmd, 0),
+    )
+    scratch = tmp_path / ".segments-job"
+    scratch.mkdir()
+    pieces = [str(scratch / "00000.ts"), str(scratch / "00001.ts")]
+    output = str(tmp_path / "out.mp4")
+    report = finish_parallel_render(pieces, output, str(scratch), {"pieces": 2})
+    assert report == {"pieces": 2, "result": output}
+    assert commands[0][commands[0].index("-c") + 1] == "copy"
+    assert not scratch.exists()
+
+    scratch.mkdir()
+    # Failed renders keep their finished pieces for a resume.
+    failed = finish_parallel_render([pieces[0], "error: ffmpeg failed – x"], output, str(scratch), {})
+    assert failed["result"] == "error: ffmpeg failed – x" and scratch.exists()
+
+
+def test_split_audio_is_joined_apart_from_the_video_chunks(monkeypatch, tmp_path):
+    """Next to unsplit pieces, every file in the audio join holds audio only."""
+    commands, lists = [], {}
+
+    def run(cmd):
+        commands.append(cmd)
+        if "concat" in cmd:
+            for path in (cmd[i + 1] for i, arg in enumerate(cmd) if arg == "-i"):
+                with open(path) as fh:
+                    lists[os.path.basename(path)] = fh.read().splitlines()
+
+    monkeypatch.setattr(segments, "run_ffmpeg", run)
+    monkeypatch.setattr(segments, "run_parallel", lambda fn, items: [fn(item) for item in items])
+    scratch = tmp_path / ".render-x"
+    scratch.mkdir()
+    pieces = [str(scratch / f"{k:05d}.ts") for k in range(5)]
+    output = str(tmp_path / "out.mp4")
+    report = finish_parallel_render(pieces, output, str(scratch), {}, ["av", "a", "v", "v", "av"])
+    assert report["result"] == output
+
+    extracts, concat = commands[:-1], commands[-1]
+    assert [(c[c.index("-i") + 1], c[c.index("-map") + 1]) for c in extracts] == [
+        (pieces[0], "0:a:0"), (pieces[4], "0:a:0"),
+    ]
+    assert all(c[c.index("-c") + 1] == "copy" for c in extracts)
+    assert "0:v:0" in concat and "1:a:0" in concat
+    assert lists["segments-audio.txt"] == ["ffconcat version 1.0", "stream"] + [
+        f"file '{scratch / name}'" for name in ("00000-audio.ts", "00001.ts", "00004-audio.ts")
+    ]
+    assert lists["segments.txt"] == ["ffconcat version 1.0", "stream"] + [
+        f"file '{pieces[k]}'" for k in (0, 2, 3, 4)
+    ]
+
+
+def test_render_piece_reports_filesystem_errors(monkeypatch, tmp_path):
+    """An OSError becomes an error result, so the chord callback still runs and cleans up."""
+    def fail(*args):
+        raise PermissionError("read-only file system")
+
+    monkeypatch.setattr(segments, "_render_piece", fail)
+    job = {"segment": {}, "piece": {}}
+    result = segments.render_piece(job, str(tmp_path / "00000.ts"), 1920, 1080, dict(segments.DEFAULT_SPEC))
+    assert result == "error: read-only file system"
+
+
+def test_rerender_encodes_only_changed_clips(monkeypatch, tmp_path):
+    phone = tmp_path / "phone.mp4"
+    phone.write_bytes(b"phone")
+    monkeypatch.setattr(segments, "probe_media", lambda path: PROBES["/tmp/phone.mp4"])
+    monkeypatch.setattr(segments, "keyframe_times", lambda path, around, window: KEYFRAMES)
+    monkeypatch.setattr(cache, "_segment_cache", cache.SegmentCache(str(tmp_path / "cache"), 1 << 20))
+    encodes = []
+
+    commands = []
+    monkeypatch.setattr(segments, "run_ffmpeg", _fake_ffmpeg(commands))
+    # Phone clips never copy; skip the single-graph fallback to exercise pieces.
+    monkeypatch.setattr(segments, "plan_segments", _plan_with_spec(segments.plan_segments))
+    feeds = {"phone": str(phone)}
+    output = str(tmp_path / "out.mp4")
+    first = render_timeline_segments(_project(("phone", 0.0, 5.0), ("phone", 10.0, 20.0)), feeds, output)
+    encodes = lambda: [c for c in commands if "libx264" in c]  # noqa: E731
+    assert (len(encodes()), first["reused"]) == (2, 0)
+    again = render_timeline_segments(_project(("phone", 0.0, 5.0), ("phone", 10.0, 21.0)), feeds, output)
+    assert (len(encodes()), again["reused"]) == (3, 1)
+
+
+def _plan_with_spec(plan):
+    def planned(*args, **kwargs):
+        found, _ = plan(*args, **kwargs)
+        return found, dict(segments.DEFAULT_SPEC)
+    return planned
+
+
+def test_interrupted_render_resumes_from_finished_pieces(monkeypatch, tmp_path):
+    _fake_probes(monkeypatch)
+    monkeypatch.setattr(cache, "_segment_cache", None)
+    monkeypatch.setattr(cache, "SEGMENT_CACHE_DIR", "")
+    # Render pieces in order, so the crash comes after the first two finished.
+    monkeypatch.setattr(segments, "run_parallel", lambda fn, items: [fn(item) for item in items])
+    commands = []
+    fake = _fake_ffmpeg(commands)
+
+    def crash_on_tail(cmd):
+        if "-ss" in cmd and cmd[cmd.index("-ss") + 1] == "30":
+            raise subprocess.CalledProcessError(1, cmd, b"", b"worker lost")
+        return fake(cmd)
+
+    monkeypatch.setattr(segments, "run_ffmpeg", crash_on_tail)
+    project = _project(("cam1", 12.5, 35.0))
+    output = str(tmp_path / "out.mp4")
+    failed = render_timeline_segments(project, FEEDS, output, smart=True)
+    assert failed["result"].startswith("error") and failed["recovered"] == 0
+
+    commands.clear()
+    progress = []
+    monkeypatch.setattr(segments, "run_ffmpeg", fake)
+    report = render_timeline_segments(project, FEEDS, output, smart=True, progress=progress.append)
+    assert report["result"] == output and report["recovered"] == 2
+    # Only the tail piece and the final concat run again.
+    assert len(commands) == 2
+    assert progress == [{"done": 3, "total": 3, "recovered": 2}]
+    assert not any(p.name.startswith(".render-") for p in tmp_path.iterdir())
+
+
+def test_edited_timeline_sweeps_stale_checkpoint(monkeypatch, tmp_path):
+    """An interrupted render's pieces go once the edited timeline renders to the same output."""
+    _fake_probes(monkeypatch)
+    monkeypatch.setattr(cache, "_segment_cache", None)
+    monkeypatch.setattr(cache, "SEGMENT_CACHE_DIR", "")
+    commands = []
+    fake = _fake_ffmpeg(commands)
+
+    def crash(cmd):
+        raise subprocess.CalledProcessError(1, cmd, b"", b"worker lost")
+
+    monkeypatch.setattr(segments, "run_ffmpeg", crash)
+    output = str(tmp_path / "out.mp4")
+    other = str(tmp_path / "other.mp4")
+    assert render_timeline_segments(_project(("cam1", 12.5, 35.0)), FEEDS, output, smart=True)["result"] != output
+    assert render_timeline_segments(_project(("cam1", 12.5, 35.0)), FEEDS, other, smart=True)["result"] != other
+    assert len([p for p in tmp_path.iterdir() if p.name.startswith(".render-")]) == 2
+
+    monkeypatch.setattr(segments, "run_ffmpeg", fake)
+    report = render_timeline_segments(_project(("cam1", 12.5, 36.0)), FEEDS, output, smart=True)
+    assert report["result"] == output
+    left = [p for p in tmp_path.iterdir() if p.name.startswith(".render-")]
+    assert len(left) == 1 and str(tmp_path / "other.mp4") in (left[0] / "manifest.json").read_text()
+    assert not any(c[-1].endswith(".ts.part") for c in commands)
@@ -0,0 +1,57 @@
+import numpy as np
+
+from processor import solver
+from processor.solver import select_pairs, solve_feed_offsets, solve_offsets
+from tests.signals import SR, tones
+
+
+def test_solve_offsets_outvotes_a_bad_pair():
+    """Redundant pairs should pull a single wrong measurement back into line."""
+    truth = np.array([0.0, 2.0, 5.0, 9.0])
+    measurements = [
+        {"reference": i, "target": j, "offset_seconds": truth[j] - truth[i], "confidence": 0.9}
+        for i, j in [(0, 1), (1, 2), (2, 3), (0, 2), (1, 3)]
+    ]
+    measurements.append({"reference": 0, "target": 3, "offset_seconds": 4.0, "confidence": 0.9})
+    offsets, residuals, component = solve_offsets(4, measurements)
+    np.testing.assert_allclose(offsets, truth, atol=1e-3)
+    assert residuals[-1] > 4.9
+    assert len(set(component)) == 1
+
+
+def test_select_pairs_is_sparse_and_connected():
+    n = 12
+    candidates = [(i, j, float(100 - abs(i - j))) for i in range(n) for j in range(i + 1, n)]
+    pairs = select_pairs(n, candidates, [60.0] * n)
+    assert n - 1 <= len(pairs) <= 2 * n
+    reached = {0}
+    for _ in range(n):
+        reached |= {j for i, j in pairs if i in reached} | {i for i, j in pairs if j in reached}
+    assert reached == set(range(n))
+
+
+def test_chain_of_partial_overlaps(monkeypatch, tmp_path):
+    """Clips that never overlap the first one are placed through the chain."""
+    master = tones(100, seed=5)
+    starts = [0, 20, 40, 60]
+    audio = {f"/clips/{k}.mp4": master[s * SR:(s + 30) * SR] for k, s in enumerate(starts)}
+    monkeypatch.setattr(solver, "load_audio_pcm", lambda path, sr: audio[path])
+
+    result = solve_feed_offsets({f"clip{k}": f"/clips/{k}.mp4" for k in range(4)},
+                                fingerprint_dir=str(tmp_path))
+    assert result["components"] == 1
+    for k, start in enumerate(starts):
+        assert abs(result["offsets"][f"clip{k}"]["offset_seconds"] - start) < 1e-3
+    assert len(result["pairs"]) < 4 * 3 / 2
+
+
+def test_corrupt_stored_fingerprint_falls_back_to_the_samples(monkeypatch, tmp_path):
+    """A truncated .npz is recomputed from the decoded audio instead of aborting the solve."""
+    master = tones(60, seed=6)
+    audio = {"/clips/0.mp4": master[:40 * SR], "/clips/1.mp4": master[15 * SR:55 * SR]}
+    monkeypatch.setattr(solver, "load_audio_pcm", lambda path, sr: audio[path])
+    (tmp_path / "clip1.npz").write_bytes(b"PK\x03\x04 truncated")
+
+    result = solve_feed_offsets({"clip0": "/clips/0.mp4", "clip1": "/clips/1.mp4"}, fingerprint_dir=str(tmp_path))
+    assert abs(result["offsets"]["clip1"]["offset_seconds"] - 15) < 1e-3
+    assert not (tmp_path / "clip1.npz").exists()
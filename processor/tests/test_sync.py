@@ -1,4 +1,19 @@
-from processor.sync import detect_offset, extract_audio_pcm
+import subprocess
+import sys
+
+import numpy as np
+
+from processor.sync import (
+    _next_fast_len,
+    detect_offset,
+    detect_offsets_batch,
+    estimate_offset,
+    estimate_offset_multires,
+    estimate_offset_streaming,
+    estimate_offsets_batch,
+    extract_audio_pcm,
+    fft_correlate,
+)
 
 
 def test_detect_offset_mock():
@@ -13,3 +28,158 @@ def test_extract_audio_handles_missing_file():
     """Gracefully return an empty array for a missing file."""
     samples = extract_audio_pcm("/nonexistent/video.mp4")
     assert samples.size == 0
+
+
+def _offset_signals(offset_samples: int, length: int = 4000, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    ref = rng.standard_normal(length).astype(np.float32)
+    tgt = ref[offset_samples:offset_samples + length // 2].copy()
+    return ref, tgt
+
+
+def test_fft_correlate_matches_direct():
+    """The FFT engine should reproduce np.correlate(mode="full")."""
+    rng = np.random.default_rng(1)
+    ref = rng.standard_normal(257)
+    tgt = rng.standard_normal(91)
+    np.testing.assert_allclose(
+        fft_correlate(ref, tgt), np.correlate(ref, tgt, mode="full"), atol=1e-9,
+    )
+
+
+def test_next_fast_len():
+    """Fast lengths should be 5-smooth and never smaller than requested."""
+    for n in (1, 7, 97, 1000, 10007, 65537):
+        size = _next_fast_len(n)
+        assert size >= n
+        for prime in (2, 3, 5):
+            while size % prime == 0:
+                size //= prime
+        assert size == 1
+    assert _next_fast_len(1000) == 1000
+
+
+def test_estimate_offset_synthetic():
+    """A target cut from the reference should be located with high confidence."""
+    ref, tgt = _offset_signals(800)
+    result = estimate_offset(ref, tgt, 16000)
+    assert result["offset_seconds"] == 0.05
+    assert result["confidence"] > 0.99
+
+
+def _music_like(seconds: float, sample_rate: int = 16000, seed: int = 2) -> np.ndarray:
+    """Noise with a bursty amplitude envelope so onsets are well defined."""
+    rng = np.random.default_rng(seed)
+    n = int(seconds * sample_rate)
+    envelope = np.repeat(rng.random(n // 400 + 1) ** 4, 400)[:n]
+    return (rng.standard_normal(n) * envelope).astype(np.float32)
+
+
+def test_multires_matches_exhaustive_search():
+    """The coarse-to-fine search should land on the same sample-accurate lag."""
+    ref = _music_like(60.0)
+    tgt = ref[16000 * 7 + 123:16000 * 47].copy()
+    exhaustive = estimate_offset(ref, tgt, 16000)
+    multires = estimate_offset_multires(ref, tgt, 16000)
+    assert multires == exhaustive
+    assert multires["offset_seconds"] == round((16000 * 7 + 123) / 16000, 4)
+
+
+def test_max_lag_bounds_the_search():
+    """Offsets beyond max_lag_seconds should never be reported."""
+    ref = _music_like(60.0)
+    tgt = ref[16000 * 20:16000 * 50].copy()
+    for search in (estimate_offset, estimate_offset_multires):
+        assert search(ref, tgt, 16000)["offset_seconds"] == 20.0
+        bounded = search(ref, tgt, 16000, max_lag_seconds=5.0)
+        assert abs(bounded["offset_seconds"]) <= 5.0
+        assert bounded["confidence"] < 0.5
+
+
+def _fake_ffmpeg(monkeypatch, samples: np.ndarray, returncode: int = 0):
+    """Replace the ffmpeg process with one that writes ``samples`` as s16le."""
+    script = (
+        "import sys; sys.stdout.buffer.write(bytes.fromhex(sys.argv[1])); "
+        "sys.stderr.write('boom'); sys.exit(int(sys.argv[2]))"
+    )
+    real_popen = subprocess.Popen
+
+    def popen(cmd, **kwargs):
+        payload = samples.astype("<i2").tobytes().hex()
+        return real_popen([sys.executable, "-c", script, payload, str(returncode)], **kwargs)
+
+    monkeypatch.setattr(subprocess, "Popen", popen)
+
+
+def test_extract_audio_streams_in_chunks(monkeypatch):
+    """Chunked reads should reassemble the stream exactly, in both storage modes."""
+    samples = np.arange(-5000, 5000, 7, dtype=np.int16)
+    _fake_ffmpeg(monkeypatch, samples)
+    as_int = extract_audio_pcm("clip.mp4", dtype=np.int16, chunk_bytes=333)
+    np.testing.assert_array_equal(as_int, samples)
+    as_float = extract_audio_pcm("clip.mp4", chunk_bytes=4096)
+    assert as_float.dtype == np.float32
+    np.testing.assert_allclose(as_float, samples / 32768.0)
+
+
+def test_extract_audio_to_memory_map(monkeypatch, tmp_path):
+    """With mmap_path the samples land in a memory-mapped .npy file."""
+    samples = np.arange(3000, dtype=np.int16)
+    _fake_ffmpeg(monkeypatch, samples)
+    path = str(tmp_path / "clip.npy")
+    mapped = extract_audio_pcm("clip.mp4", dtype=np.int16, mmap_path=path, chunk_bytes=1000)
+    assert isinstance(mapped, np.memmap)
+    np.testing.assert_array_equal(mapped, samples)
+    np.testing.assert_array_equal(np.load(path), samples)
+
+
+def test_extract_audio_failure_cleans_up(monkeypatch, tmp_path):
+    """A failing ffmpeg yields an empty array and leaves no partial file behind."""
+    _fake_ffmpeg(monkeypatch, np.arange(10, dtype=np.int16), returncode=1)
+    path = tmp_path / "clip.npy"
+    assert extract_audio_pcm("clip.mp4", mmap_path=str(path)).size == 0
+    assert not path.exists()
+
+
+def test_batch_matches_pairwise():
+    """Batched sync should agree with one-at-a-time estimates for every target."""
+    ref = _music_like(60.0)
+    starts = [16000 * 3, 16000 * 11 + 57, 0]
+    targets = [ref[s:s + 16000 * 20].copy() for s in starts] + [np.zeros(0, np.float32)]
+    for method, single in (("fft", estimate_offset), ("multires", estimate_offset_multires)):
+        batch = estimate_offsets_batch(ref, targets, 16000, method=method, batch_size=2)
+        assert len(batch) == 4
+        for tgt, result in zip(targets[:3], batch):
+            expected = single(ref, tgt, 16000)
+            assert result["offset_seconds"] == expected["offset_seconds"]
+            assert abs(result["confidence"] - expected["confidence"]) < 1e-3
+        assert batch[3] == {"offset_seconds": 0.0, "confidence": 0.0}
+
+
+def test_detect_offsets_batch_missing_files():
+    """Unreadable files yield zero-confidence results instead of raising."""
+    results = detect_offsets_batch("/nonexistent/ref.mp4", ["/nonexistent/a.mp4", "/nonexistent/b.mp4"])
+    assert results == [{"offset_seconds": 0.0, "confidence": 0.0}] * 2
+
+
+def test_streaming_matches_exhaustive_search():
+    """Overlap-save search should find the same lag with block-sized buffers."""
+    ref = _music_like(60.0)
+    for start in (16000 * 9 + 31, 0):
+        tgt = ref[start:start + 16000 * 30].copy()
+        expected = estimate_offset(ref, tgt, 16000)
+        assert estimate_offset_streaming(ref, tgt, 16000, block_seconds=4.0) == expected
+        bounded = estimate_offset_streaming(ref, tgt, 16000, max_lag_seconds=12.0, block_seconds=4.0)
+        assert bounded == expected
+
+
+def test_streaming_reads_memory_maps(tmp_path):
+    """The streaming search should work directly on memory-mapped int16 PCM."""
+    ref = (_music_like(40.0) * 8000).astype(np.int16)
+    np.save(tmp_path / "ref.npy", ref)
+    np.save(tmp_path / "tgt.npy", np.concatenate([np.zeros(16000 * 2, np.int16), ref[:16000 * 20]]))
+    mapped_ref = np.load(tmp_path / "ref.npy", mmap_mode="r")
+    mapped_tgt = np.load(tmp_path / "tgt.npy", mmap_mode="r")
+    result = estimate_offset_streaming(mapped_ref, mapped_tgt, 16000, block_seconds=2.0)
+    assert result["offset_seconds"] == -2.0
+    assert result["confidence"] > 0.99
@@ -1,4 +1,7 @@
-from processor.timeline import render_timeline
+import subprocess
+
+from processor import timeline
+from processor.timeline import render_timeline, render_timeline_detailed
 
 
 def test_render_timeline_no_clips():
@@ -47,3 +50,83 @@ def test_render_timeline_with_trim_points():
     result = render_timeline(project, {"cam1": "/tmp/cam1.mp4"}, "/tmp/out.mp4")
     assert isinstance(result, str)
     assert result.startswith("error")
+
+
+def test_trimmed_clips_seek_on_the_input(monkeypatch):
+    """Trims become -ss/-t before -i, with no trim filter left in the graph."""
+    commands = []
+
+    def run(cmd):
+        commands.append(cmd)
+        return subprocess.CompletedProcess(cmd, 0, b"", b"bench: maxrss=123456kB\n")
+
+    monkeypatch.setattr(timeline, "run_ffmpeg", run)
+    project = {
+        "clips": [
+            {"feed_id": "cam1", "timeline_start": 0.0, "trim_start": 5400.0, "trim_end": 5460.0},
+            {"feed_id": "cam2", "timeline_start": 60.0, "trim_start": None, "trim_end": None},
+        ],
+        "output_width": 1280,
+        "output_height": 720,
+    }
+    feeds = {"cam1": "/tmp/cam1.mp4", "cam2": "/tmp/cam2.mp4"}
+    assert render_timeline(project, feeds, "/tmp/out.mp4") == "/tmp/out.mp4"
+    cmd = commands[0]
+    assert cmd[3:9] == ["-ss", "5400", "-t", "60", "-i", "/tmp/cam1.mp4"]
+    assert cmd[9:11] == ["-i", "/tmp/cam2.mp4"]
+    graph = cmd[cmd.index("-filter_complex") + 1]
+    assert "trim" not in graph
+
+    render_timeline(project, feeds, "/tmp/out.mp4", seek_mode="filter")
+    graph = commands[1][commands[1].index("-filter_complex") + 1]
+    assert "[0:v]trim=start=5400:end=5460,setpts=PTS-STARTPTS" in graph
+
+
+def test_clips_of_one_feed_share_an_input(monkeypatch):
+    """200 cuts between 4 cameras should open 4 inputs, not 200."""
+    commands = []
+
+    def run(cmd):
+        commands.append(cmd)
+        return subprocess.CompletedProcess(cmd, 0, b"", b"bench: utime=1s maxrss=204800kB\n")
+
+    monkeypatch.setattr(timeline, "run_ffmpeg", run)
+    clips = [
+        {"feed_id": f"cam{k % 4}", "timeline_start": 5.0 * k, "trim_start": 5.0 * k, "trim_end": 5.0 * k + 5}
+        for k in range(200)
+    ]
+    project = {"clips": clips, "output_width": 1280, "output_height": 720}
+    feeds = {f"cam{i}": f"/tmp/cam{i}.mp4" for i in range(4)}
+    report = render_timeline_detailed(project, feeds, "/tmp/out.mp4")
+    assert report["result"] == "/tmp/out.mp4"
+    assert (report["clips"], report["inputs"], report["decoders"]) == (200, 4, 8)
+    assert report["peak_rss_kb"] == 204800
+    cmd = commands[0]
+    assert cmd.count("-i") == 4
+    graph = cmd[cmd.index("-filter_complex") + 1]
+    assert "[0:v]split=50" in graph and "[0:a]asplit=50" in graph
+    # cam1's second clip starts 25 s into the source, 20 s after its input's seek point.
+    assert cmd[cmd.index("/tmp/cam1.mp4") - 5:cmd.index("/tmp/cam1.mp4")] == ["-ss", "5", "-t", "985", "-i"]
+    assert "[g1v1]trim=start=20:end=25,setpts=PTS-STARTPTS" in graph
+
+
+def test_backwards_jump_opens_a_new_input(monkeypatch):
+    monkeypatch.setattr(timeline, "run_ffmpeg", lambda cmd: subprocess.CompletedProcess(cmd, 0, b"", b""))
+    clips = [
+        {"feed_id": "cam1", "timeline_start": 0.0, "trim_start": 100.0, "trim_end": 110.0},
+        {"feed_id": "cam1", "timeline_start": 10.0, "trim_start": 10.0, "trim_end": 20.0},
+        {"feed_id": "cam1", "timeline_start": 20.0, "trim_start": 900.0, "trim_end": 910.0},
+    ]
+    report = render_timeline_detailed({"clips": clips}, {"cam1": "/tmp/cam1.mp4"}, "/tmp/out.mp4")
+    assert report["inputs"] == 3 and report["peak_rss_kb"] is None
+    # Unseeked inputs gain nothing from splitting on a forward gap, only on going backwards.
+    report = render_timeline_detailed(
+        {"clips": clips}, {"cam1": "/tmp/cam1.mp4"}, "/tmp/out.mp4", seek_mode="filter",
+    )
+    assert report["inputs"] == 2
+
+
+def test_render_timeline_rejects_unknown_render_mode():
+    project = {"clips": [{"feed_id": "a", "timeline_start": 0.0}]}
+    result = render_timeline(project, {"a": "/tmp/a.mp4"}, "/tmp/out.mp4", render_mode="fast")
+    assert result == "error: unknown render mode 'fast'"